@@ -1,110 +1,76 @@
+import time
+
 import config
-from arch.java_static import scan_repo_java
-from arch.dep_graph import build_package_graph, compute_degrees, find_cycles
-from tools.prompt_builder import build_architecture_prompt
-from arch.smells import detect_dependency_magnets, detect_cycles, detect_oversized_packages
+from arch.modules import discover_modules, scan_modules, module_findings
+from arch.dep_graph import build_package_graph, compute_degrees, package_edge_weights, strongly_connected_components, cycles_by_scc
+from arch.evidence import select_dependency_evidence
+from arch.export import export_architecture
+from tools.prompt_builder import build_architecture_prompt, messages_text
+from arch.smells import detect_dependency_magnets, detect_oversized_packages
 from tools.llm_client import generate_arch_answer_with_fallback
-from tools.verify import verify_arch_response  
+from tools.tokens import count_tokens
+from tools.verify import verify_arch_response, collect_arch_violations
+
+def analyze_repository(repo_path):
+    """Static dependency analysis (no LLM): graphs, metrics and smell candidates as a dict."""
+    # One scan per build module (Maven/Gradle), in worker processes; the package
+    # graph below still spans all modules so cross-module cycles are found.
+    t0 = time.perf_counter()
+    modules = discover_modules(repo_path)
+    files_by_module, stats_by_module = scan_modules(repo_path, modules)
+    java_files = []
+    for infos in files_by_module.values():
+        java_files.extend(infos)
+    findings = module_findings(modules, files_by_module, stats_by_module)
+    if len(findings) < 2:
+        findings = None
+    print("[TIMING] arch_scan_ms=" + str(int((time.perf_counter() - t0) * 1000)) + " modules=" + str(len(files_by_module)) + " files=" + str(len(java_files)))
 
-def run_architecture_analysis(repo_path):
-    java_files = scan_repo_java(repo_path)
     graph, files_by_pkg = build_package_graph(java_files)
+    weights = package_edge_weights(java_files)
     indeg, outdeg = compute_degrees(graph)
 
-    cycle_lists = find_cycles(graph, limit=5)
-    cycle_findings = detect_cycles(cycle_lists)
-
-    magnets = detect_dependency_magnets(indeg, outdeg, files_by_pkg, top_n=5)
-    oversized = detect_oversized_packages(files_by_pkg, top_n=5)
-
-    evidence = _format_dependency_evidence(graph, cycle_findings, magnets, oversized)
-
-    prompt = build_architecture_prompt(config.ARCH_QUERY, evidence)
-
-    answer = generate_arch_answer_with_fallback(prompt, evidence, verify_arch_response)
+    # Candidates per kind; the token budget decides how many reach the prompt.
+    n = config.ARCH_EVIDENCE_CANDIDATES
+    sccs = strongly_connected_components(graph)
+    cycle_lists = cycles_by_scc(graph, sccs, config.ARCH_CYCLES_PER_SCC, n)
+
+    magnets = detect_dependency_magnets(indeg, outdeg, files_by_pkg, top_n=n)
+    oversized = detect_oversized_packages(files_by_pkg, top_n=n)
+
+    return {
+        "repo_path": repo_path,
+        "java_files": java_files,
+        "files_by_module": files_by_module,
+        "modules": findings,
+        "graph": graph,
+        "files_by_pkg": files_by_pkg,
+        "weights": weights,
+        "indeg": indeg,
+        "outdeg": outdeg,
+        "sccs": sccs,
+        "cycle_lists": cycle_lists,
+        "magnets": magnets,
+        "oversized": oversized,
+    }
+
+
+def run_architecture_analysis(repo_path, export_formats=None, out_dir="out"):
+    a = analyze_repository(repo_path)
+    if export_formats:
+        export_architecture(a, out_dir, export_formats)
+
+    fixed = count_tokens(messages_text(build_architecture_prompt(config.ARCH_QUERY, "")))
+    budget = config.ARCH_PROMPT_TOKEN_BUDGET - fixed
+    if budget <= 0:
+        print("[ARCH] ARCH_QUERY alone uses " + str(fixed) + " of ARCH_PROMPT_TOKEN_BUDGET=" + str(config.ARCH_PROMPT_TOKEN_BUDGET) + " tokens")
+    evidence = select_dependency_evidence(
+        a["graph"], a["weights"], a["sccs"], a["cycle_lists"], a["magnets"], a["oversized"], budget, a["modules"]
+    )
+
+    prompt = build_architecture_prompt(config.ARCH_QUERY, evidence.render())
+    print("[ARCH] " + evidence.selected_line + " prompt_tokens=" + str(count_tokens(messages_text(prompt))) + "/" + str(config.ARCH_PROMPT_TOKEN_BUDGET))
+
+    answer = generate_arch_answer_with_fallback(prompt, evidence, verify_arch_response, collect_arch_violations)
 
     return answer
-
-
-def _format_dependency_evidence(graph, cycle_findings, magnets, oversized):
-    """
-    Evidence blob with stable IDs:
-      - CYCLE_k lines
-      - EDGE_k lines (derived from cycles)
-      - MAGNET_k lines (with sample file paths as raw strings)
-      - OVERSIZED_k lines
-    """
-    n_nodes = len(graph.keys())
-    n_edges = 0
-    for k in graph:
-        n_edges += len(graph[k])
-
-    evidence_lines = []
-    evidence_lines.append("Dependency evidence summary:")
-    evidence_lines.append("SUMMARY: packages=" + str(n_nodes) + " edges=" + str(n_edges))
-
-    # magnets
-    evidence_lines.append("")
-    evidence_lines.append("Dependency magnets (fan_in/fan_out/total):")
-    if magnets:
-        i = 0
-        while i < len(magnets):
-            m = magnets[i]
-            mid = "MAGNET_" + str(i + 1)
-
-            pkg = m.get("package")
-            fin = m.get("fan_in")
-            fout = m.get("fan_out")
-            total = m.get("total_degree")
-
-            evidence_lines.append(
-                mid + ": " + str(pkg) + " fin=" + str(fin) + " fout=" + str(fout) + " total=" + str(total)
-            )
-
-            sample_files = m.get("sample_files") or []
-            if sample_files:
-                evidence_lines.append(mid + "_FILES: " + ", ".join(sample_files))
-            i += 1
-    else:
-        evidence_lines.append("(none)")
-
-    # cycles + edges
-    evidence_lines.append("")
-    evidence_lines.append("Cycles (package-level):")
-    edge_id = 1
-    if cycle_findings:
-        c = 0
-        while c < len(cycle_findings):
-            cyc = cycle_findings[c].get("cycle", [])
-            cid = "CYCLE_" + str(c + 1)
-
-            evidence_lines.append(cid + ": " + " -> ".join(cyc))
-
-            e = 0
-            while e + 1 < len(cyc):
-                a = cyc[e]
-                b = cyc[e + 1]
-                eid = "EDGE_" + str(edge_id)
-                evidence_lines.append(eid + ": " + a + " -> " + b + " cycle=" + cid)
-                edge_id += 1
-                e += 1
-
-            c += 1
-    else:
-        evidence_lines.append("(none)")
-
-    # oversized
-    evidence_lines.append("")
-    evidence_lines.append("Oversized packages (by total LOC):")
-    if oversized:
-        k = 0
-        while k < len(oversized):
-            oid = "OVERSIZED_" + str(k + 1)
-            pkg = oversized[k].get("package")
-            loc = oversized[k].get("total_loc")
-            evidence_lines.append(oid + ": " + str(pkg) + " total_loc=" + str(loc))
-            k += 1
-    else:
-        evidence_lines.append("(none)")
-
-    return "\n".join(evidence_lines)
\ No newline at end of file
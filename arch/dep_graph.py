@@ -1,3 +1,6 @@
+import json
+import os
+
 def _best_internal_package(import_path, internal_packages):
     # Map "a.b.c.Class" to the longest matching known package prefix.
     best = ""
@@ -38,6 +41,25 @@ def build_package_graph(java_files):
 
     return graph, files_by_pkg
 
+def package_edge_weights(java_files):
+    """{(src_pkg, dst_pkg): number of import statements} for the edges of build_package_graph."""
+    internal_packages = set()
+    for f in java_files:
+        if f.package:
+            internal_packages.add(f.package)
+
+    weights = {}
+    for f in java_files:
+        if not f.package:
+            continue
+        for imp in f.imports:
+            dst_pkg = _best_internal_package(imp, internal_packages)
+            if not dst_pkg or dst_pkg == f.package:
+                continue
+            key = (f.package, dst_pkg)
+            weights[key] = weights.get(key, 0) + 1
+    return weights
+
 def compute_degrees(graph):
     indeg = {}
     outdeg = {}
@@ -51,40 +73,184 @@ def compute_degrees(graph):
                 outdeg[b] = outdeg.get(b, 0)
     return indeg, outdeg
 
-def find_cycles(graph, limit):
-    cycles = []
-    visited = set()
-    stack = []
+def strongly_connected_components(graph):
+    """Tarjan's algorithm (iterative); returns a list of node sets, largest first."""
+    index = {}
+    low = {}
     on_stack = set()
+    stack = []
+    out = []
+    counter = 0
 
-    def dfs(u):
-        if len(cycles) >= limit:
-            return
-        visited.add(u)
-        stack.append(u)
-        on_stack.add(u)
-
-        for v in graph.get(u, []):
-            if v not in visited:
-                dfs(v)
-            elif v in on_stack:
-                i = 0
-                while i < len(stack):
-                    if stack[i] == v:
-                        cycle = stack[i:] + [v]
-                        cycles.append(cycle)
-                        break
-                    i += 1
-                if len(cycles) >= limit:
+    for root in sorted(graph):
+        if root in index:
+            continue
+        work = [(root, iter(sorted(graph.get(root, []))))]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+
+        while work:
+            u, it = work[-1]
+            advanced = False
+            for v in it:
+                if v not in index:
+                    index[v] = low[v] = counter
+                    counter += 1
+                    stack.append(v)
+                    on_stack.add(v)
+                    work.append((v, iter(sorted(graph.get(v, [])))))
+                    advanced = True
                     break
+                if v in on_stack:
+                    low[u] = min(low[u], index[v])
+            if advanced:
+                continue
 
-        on_stack.remove(u)
-        stack.pop()
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[u])
+            if low[u] == index[u]:
+                comp = set()
+                while True:
+                    w = stack.pop()
+                    on_stack.discard(w)
+                    comp.add(w)
+                    if w == u:
+                        break
+                out.append(comp)
 
-    for n in graph:
-        if n not in visited:
-            dfs(n)
-        if len(cycles) >= limit:
+    out.sort(key=lambda c: (-len(c), sorted(c)))
+    return out
+
+def _shortest_cycle_through(sub, start):
+    """BFS back to start inside sub; returns [start, ..., start] or None."""
+    parent = {}
+    queue = [start]
+    i = 0
+    while i < len(queue):
+        u = queue[i]
+        i += 1
+        for v in sub.get(u, []):
+            if v == start:
+                path = [start]
+                while u != start:
+                    path.append(u)
+                    u = parent[u]
+                path.append(start)
+                path.reverse()
+                return path
+            if v not in parent:
+                parent[v] = u
+                queue.append(v)
+    return None
+
+def cycles_by_scc(graph, sccs, per_scc, limit):
+    """
+    Up to per_scc distinct cycles from each cyclic SCC (largest SCC first), at most
+    limit in total: the shortest cycle through each of the SCC's best-connected
+    packages, which are shorter and more actionable than DFS discovery order.
+    """
+    out = []
+    for comp in sccs:
+        if len(comp) < 2:
+            continue
+        sub = {}
+        degree = {}
+        for u in comp:
+            sub[u] = [v for v in sorted(graph.get(u, [])) if v in comp]
+            degree[u] = degree.get(u, 0) + len(sub[u])
+            for v in sub[u]:
+                degree[v] = degree.get(v, 0) + 1
+
+        seen = set()
+        found = 0
+        for u in sorted(comp, key=lambda x: (-degree[x], x))[: per_scc * 4]:
+            cycle = _shortest_cycle_through(sub, u)
+            if cycle is None:
+                continue
+            key = frozenset(zip(cycle, cycle[1:]))
+            if key in seen:
+                continue
+            seen.add(key)
+            out.append(cycle)
+            found += 1
+            if found >= per_scc or len(out) >= limit:
+                break
+        if len(out) >= limit:
             break
+    return out
+
+def _class_name(rel_path):
+    name = rel_path.rsplit("/", 1)[-1]
+    if name.endswith(".java"):
+        name = name[:-5]
+    return name
+
+def build_class_graph(java_files):
+    """
+    File-level (top-level class) graph keyed by rel_path, the same ids the RAG index uses:
+      - import a.b.C (or a.b.C.Inner) -> the file declaring a.b.C
+      - a capitalised identifier naming another class of the same package -> that file
+    """
+    by_fqn = {}
+    by_pkg = {}
+    for f in java_files:
+        cls = _class_name(f.rel_path)
+        fqn = f.package + "." + cls if f.package else cls
+        by_fqn[fqn] = f.rel_path
+        if f.package not in by_pkg:
+            by_pkg[f.package] = {}
+        by_pkg[f.package][cls] = f.rel_path
+
+    graph = {}
+    for f in java_files:
+        deps = set()
+        for imp in f.imports:
+            target = imp
+            while target and target not in by_fqn:
+                if "." not in target:
+                    target = ""
+                    break
+                target = target.rsplit(".", 1)[0]
+            if target:
+                deps.add(by_fqn[target])
+
+        same_pkg = by_pkg.get(f.package, {})
+        for ref in f.type_refs:
+            if ref in same_pkg:
+                deps.add(same_pkg[ref])
+
+        deps.discard(f.rel_path)
+        graph[f.rel_path] = deps
+
+    return graph
+
+def save_dependency_graphs(path, package_graph, class_graph):
+    """Persist both graphs as JSON (sorted adjacency lists) for query-time use."""
+    data = {
+        "packages": dict((k, sorted(v)) for k, v in package_graph.items()),
+        "classes": dict((k, sorted(v)) for k, v in class_graph.items()),
+    }
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    tmp = path + ".tmp"
+    f = open(tmp, "w", encoding="utf-8")
+    json.dump(data, f)
+    f.close()
+    os.replace(tmp, path)
+    return path
 
-    return cycles
+def load_dependency_graphs(path):
+    """(package_graph, class_graph) as dicts of sets, or (None, None) when not built yet."""
+    if not os.path.isfile(path):
+        return None, None
+    f = open(path, "r", encoding="utf-8")
+    data = json.load(f)
+    f.close()
+    packages = dict((k, set(v)) for k, v in data.get("packages", {}).items())
+    classes = dict((k, set(v)) for k, v in data.get("classes", {}).items())
+    return packages, classes
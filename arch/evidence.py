@@ -0,0 +1,316 @@
+"""
+Typed dependency evidence for the architecture agent.
+
+Built once from the analysis results; render() produces the EVIDENCE text for the
+prompt, while verification and the fallback answer use the indexed fields and
+lookup sets (ids, packages, edges_by_id, cycles_by_id) instead of parsing
+that text back. select_dependency_evidence ranks candidates by impact and keeps
+what fits a token budget, so the prompt size does not grow with the repository.
+"""
+
+from tools.tokens import count_tokens
+
+
+class DependencyEvidence:
+    """
+    Evidence items with stable IDs:
+      - CYCLE_k: {"id", "path", "scc_size", "edges"}  (path = [pkg, ..., pkg])
+      - EDGE_k: {"id", "a", "b", "cycle_id", "imports"}  (consecutive arrows of each cycle)
+      - MAGNET_k: {"id", "package", "fan_in", "fan_out", "total", "files"}
+      - OVERSIZED_k: {"id", "package", "total_loc"}
+      - MODULE_k: {"id", "module", "path", "files", "loc", "packages", "pkg_edges",
+        "cyclic_packages", "depends_on", "undeclared", "cycle_with"}  (see arch/modules.py)
+    make_* builds an item with the next free id; add() registers it.
+    """
+
+    def __init__(self, n_packages, n_edges):
+        self.n_packages = n_packages
+        self.n_edges = n_edges
+        self.summary_extra = ""
+        self.selected_line = ""
+        self.magnets = []
+        self.cycles = []
+        self.edges = []
+        self.oversized = []
+        self.modules = []
+
+        # lookup sets
+        self.ids = set()
+        self.packages = set()
+        self.edges_by_id = {}
+        self.cycles_by_id = {}
+
+    def make_magnet(self, package, fan_in, fan_out, total, files):
+        return {
+            "kind": "magnet",
+            "id": "MAGNET_" + str(len(self.magnets) + 1),
+            "package": package,
+            "fan_in": fan_in,
+            "fan_out": fan_out,
+            "total": total,
+            "files": list(files or []),
+        }
+
+    def make_cycle(self, path, weights=None, scc_size=None):
+        """A cycle and one EDGE_k per arrow of its path; weights = {(a, b): import count}."""
+        cycle = {
+            "kind": "cycle",
+            "id": "CYCLE_" + str(len(self.cycles) + 1),
+            "path": list(path),
+            "scc_size": scc_size,
+            "edges": [],
+        }
+        e = 0
+        while e + 1 < len(path):
+            edge = {
+                "id": "EDGE_" + str(len(self.edges) + len(cycle["edges"]) + 1),
+                "a": path[e],
+                "b": path[e + 1],
+                "cycle_id": cycle["id"],
+                "imports": weights.get((path[e], path[e + 1])) if weights else None,
+            }
+            cycle["edges"].append(edge)
+            e += 1
+        return cycle
+
+    def make_oversized(self, package, total_loc):
+        return {"kind": "oversized", "id": "OVERSIZED_" + str(len(self.oversized) + 1), "package": package, "total_loc": total_loc}
+
+    def make_module(self, finding):
+        item = dict(finding)
+        item["kind"] = "module"
+        item["id"] = "MODULE_" + str(len(self.modules) + 1)
+        return item
+
+    def add(self, item):
+        kind = item["kind"]
+        self.ids.add(item["id"])
+        if kind == "magnet":
+            self.magnets.append(item)
+            self.packages.add(str(item["package"]))
+        elif kind == "cycle":
+            self.cycles.append(item)
+            self.cycles_by_id[item["id"]] = item
+            for edge in item["edges"]:
+                self.edges.append(edge)
+                self.edges_by_id[edge["id"]] = edge
+                self.ids.add(edge["id"])
+                self.packages.add(edge["a"])
+                self.packages.add(edge["b"])
+        elif kind == "module":
+            self.modules.append(item)
+        else:
+            self.oversized.append(item)
+            self.packages.add(str(item["package"]))
+        return item
+
+    def add_magnet(self, package, fan_in, fan_out, total, files):
+        return self.add(self.make_magnet(package, fan_in, fan_out, total, files))
+
+    def add_cycle(self, path, weights=None, scc_size=None):
+        return self.add(self.make_cycle(path, weights, scc_size))
+
+    def add_oversized(self, package, total_loc):
+        return self.add(self.make_oversized(package, total_loc))
+
+    def edges_of_cycle(self, cycle_id):
+        return self.cycles_by_id[cycle_id]["edges"] if cycle_id in self.cycles_by_id else []
+
+    def first_cycle_edge(self):
+        """(cycle, edge) for the first cycle that has an edge, or None."""
+        for cycle in self.cycles:
+            if cycle["edges"]:
+                return cycle, cycle["edges"][0]
+        return None
+
+    def item_lines(self, item):
+        """Rendered EVIDENCE lines of one item."""
+        kind = item["kind"]
+        if kind == "magnet":
+            lines = [
+                item["id"] + ": " + str(item["package"]) + " fin=" + str(item["fan_in"]) + " fout=" + str(item["fan_out"])
+                + " total=" + str(item["total"])
+            ]
+            if item["files"]:
+                lines.append(item["id"] + "_FILES: " + ", ".join(item["files"]))
+            return lines
+        if kind == "cycle":
+            head = item["id"] + ": " + " -> ".join(item["path"])
+            if item["scc_size"] is not None:
+                head += " scc_size=" + str(item["scc_size"])
+            lines = [head]
+            for edge in item["edges"]:
+                line = edge["id"] + ": " + edge["a"] + " -> " + edge["b"] + " cycle=" + item["id"]
+                if edge["imports"] is not None:
+                    line += " imports=" + str(edge["imports"])
+                lines.append(line)
+            return lines
+        if kind == "module":
+            line = (
+                item["id"] + ": " + item["module"] + " path=" + item["path"] + " files=" + str(item["files"])
+                + " loc=" + str(item["loc"]) + " packages=" + str(item["packages"])
+                + " pkg_edges=" + str(item["pkg_edges"]) + " cyclic_packages=" + str(item["cyclic_packages"])
+            )
+            line += " depends_on=" + (",".join(d + "(" + str(n) + ")" for d, n in item["depends_on"]) or "-")
+            if item["undeclared"]:
+                line += " undeclared=" + ",".join(item["undeclared"])
+            if item["cycle_with"]:
+                line += " cycle_with=" + ",".join(item["cycle_with"])
+            return [line]
+        return [item["id"] + ": " + str(item["package"]) + " total_loc=" + str(item["total_loc"])]
+
+    def render(self):
+        """EVIDENCE text for the prompt."""
+        lines = []
+        lines.append("Dependency evidence summary:")
+        lines.append("SUMMARY: packages=" + str(self.n_packages) + " edges=" + str(self.n_edges) + self.summary_extra)
+        if self.selected_line:
+            lines.append(self.selected_line)
+
+        lines.append("")
+        lines.append("Dependency magnets (fan_in/fan_out/total):")
+        for m in self.magnets:
+            lines.extend(self.item_lines(m))
+        if not self.magnets:
+            lines.append("(none)")
+
+        lines.append("")
+        lines.append("Cycles (package-level):")
+        for cycle in self.cycles:
+            lines.extend(self.item_lines(cycle))
+        if not self.cycles:
+            lines.append("(none)")
+
+        lines.append("")
+        lines.append("Oversized packages (by total LOC):")
+        for o in self.oversized:
+            lines.extend(self.item_lines(o))
+        if not self.oversized:
+            lines.append("(none)")
+
+        if self.modules:
+            lines.append("")
+            lines.append("Build modules (depends_on = imports into other modules):")
+            for m in self.modules:
+                lines.extend(self.item_lines(m))
+
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.render()
+
+
+def _cycle_weight(path, weights):
+    total = 0
+    i = 0
+    while i + 1 < len(path):
+        total += weights.get((path[i], path[i + 1]), 1)
+        i += 1
+    return total
+
+
+def rank_cycles(cycle_lists, sccs, weights):
+    """
+    Cycles by impact: size of their SCC (how many packages are entangled), then
+    shorter first (fewer edges to reason about), then higher import count along the
+    cycle. Returns [(path, scc_size)].
+    """
+    scc_of = {}
+    for comp in sccs:
+        for node in comp:
+            scc_of[node] = len(comp)
+
+    seen = set()
+    ranked = []
+    for path in cycle_lists:
+        key = frozenset(zip(path, path[1:]))
+        if key in seen:
+            continue
+        seen.add(key)
+        size = scc_of.get(path[0], len(path) - 1)
+        ranked.append((-size, len(path), -_cycle_weight(path, weights), path))
+    ranked.sort(key=lambda x: (x[0], x[1], x[2], x[3]))
+    return [(x[3], -x[0]) for x in ranked]
+
+
+def _selected_line(cycles, n_cycles, magnets, n_magnets, oversized, n_oversized, modules=0, n_modules=0):
+    line = (
+        "SELECTED: cycles=" + str(cycles) + "/" + str(n_cycles)
+        + " magnets=" + str(magnets) + "/" + str(n_magnets)
+        + " oversized=" + str(oversized) + "/" + str(n_oversized)
+    )
+    if n_modules:
+        line += " modules=" + str(modules) + "/" + str(n_modules)
+    return line + " (ranked by impact)"
+
+
+def select_dependency_evidence(graph, weights, sccs, cycle_lists, magnets, oversized, token_budget, modules=None):
+    """
+    Fill token_budget (model-tokenizer tokens, see tools/tokens.py) with the
+    highest-impact items: ranked cycles (with their EDGE_k lines), magnets (already
+    ranked by total degree), oversized packages (by LOC) and build modules (by LOC,
+    only for multi-module repos), taken round-robin so each kind is represented.
+    The top cycle is always kept.
+    """
+    n_edges = 0
+    for k in graph:
+        n_edges += len(graph[k])
+    evidence = DependencyEvidence(len(graph.keys()), n_edges)
+
+    cyclic = [c for c in sccs if len(c) > 1]
+    evidence.summary_extra = " cyclic_sccs=" + str(len(cyclic))
+    if cyclic:
+        evidence.summary_extra += " largest_scc=" + str(len(cyclic[0]))
+    if modules:
+        evidence.summary_extra += " modules=" + str(len(modules))
+
+    ranked = rank_cycles(cycle_lists, sccs, weights)
+    queues = [
+        [("cycle", c) for c in ranked],
+        [("magnet", m) for m in magnets or []],
+        [("oversized", o) for o in oversized or []],
+        [("module", m) for m in modules or []],
+    ]
+
+    # Reserve the SELECTED line at its final width.
+    evidence.selected_line = _selected_line(
+        len(ranked), len(ranked), len(queues[1]), len(queues[1]), len(queues[2]), len(queues[2]), len(queues[3]), len(queues[3])
+    )
+    used = count_tokens(evidence.render())
+    if queues[3]:
+        used += count_tokens("\nBuild modules (depends_on = imports into other modules):") + 1
+    positions = [0, 0, 0, 0]
+    open_kinds = [True, True, True, True]
+    while any(open_kinds):
+        k = 0
+        while k < len(queues):
+            if not open_kinds[k]:
+                k += 1
+                continue
+            if positions[k] >= len(queues[k]):
+                open_kinds[k] = False
+                k += 1
+                continue
+
+            kind, x = queues[k][positions[k]]
+            positions[k] += 1
+            if kind == "cycle":
+                item = evidence.make_cycle(x[0], weights, x[1])
+            elif kind == "magnet":
+                item = evidence.make_magnet(x.get("package"), x.get("fan_in"), x.get("fan_out"), x.get("total_degree"), x.get("sample_files"))
+            elif kind == "module":
+                item = evidence.make_module(x)
+            else:
+                item = evidence.make_oversized(x.get("package"), x.get("total_loc"))
+
+            cost = count_tokens("\n".join(evidence.item_lines(item))) + 1
+            if used + cost <= token_budget or (kind == "cycle" and not evidence.cycles):
+                evidence.add(item)
+                used += cost
+            k += 1
+
+    evidence.selected_line = _selected_line(
+        len(evidence.cycles), len(ranked), len(evidence.magnets), len(queues[1]), len(evidence.oversized), len(queues[2]),
+        len(evidence.modules), len(queues[3]),
+    )
+    return evidence
@@ -0,0 +1,404 @@
+"""
+Streaming architecture exports: `python main.py arch --export json,dot,graphml`.
+
+Writes the package and class dependency graphs, per-node metrics and the smell
+findings to out/arch_graph.<ext>. Every record is written as soon as it is
+produced: nodes, then edges, then findings, in one pass shared by all formats.
+Only the graphs themselves are in memory, never a serialised document, so
+graphs with hundreds of thousands of edges export in bounded extra memory.
+Each file is written to a temporary name and renamed when complete.
+
+Node ids: "package:<name>" and "class:<rel_path>".
+Edges: kind=package_dep (weight = import count, cyclic = both ends in one SCC)
+and kind=class_dep.
+"""
+
+import json
+import os
+import time
+from xml.sax.saxutils import escape, quoteattr
+
+from arch.dep_graph import build_class_graph
+from arch.evidence import rank_cycles
+
+EXPORT_FORMATS = ("json", "dot", "graphml")
+_BUFFER = 1 << 20
+
+# GraphML needs its attribute keys declared up front: (name, domain, type)
+_GRAPHML_KEYS = [
+    ("kind", "node", "string"),
+    ("label", "node", "string"),
+    ("package", "node", "string"),
+    ("module", "node", "string"),
+    ("files", "node", "int"),
+    ("loc", "node", "int"),
+    ("fan_in", "node", "int"),
+    ("fan_out", "node", "int"),
+    ("scc", "node", "int"),
+    ("scc_size", "node", "int"),
+    ("kind", "edge", "string"),
+    ("weight", "edge", "int"),
+    ("cyclic", "edge", "boolean"),
+    ("findings", "graph", "string"),
+]
+
+
+def parse_export_formats(text):
+    """["json", "dot", ...] from "json,dot"; None when a format is unknown."""
+    out = []
+    for part in text.split(","):
+        fmt = part.strip().lower()
+        if not fmt:
+            continue
+        if fmt not in EXPORT_FORMATS:
+            return None
+        if fmt not in out:
+            out.append(fmt)
+    return out
+
+
+class _JsonWriter:
+    """{"meta": {...}, "nodes": [...], "edges": [...], "findings": [...]}, one record per line."""
+
+    def __init__(self, f):
+        self.f = f
+        self.first = True
+
+    def begin(self, meta):
+        self.f.write('{"meta": ' + json.dumps(meta, sort_keys=True))
+
+    def start(self, section):
+        self.f.write(',\n"' + section + '": [\n')
+        self.first = True
+
+    def _item(self, obj):
+        if not self.first:
+            self.f.write(",\n")
+        self.first = False
+        self.f.write(json.dumps(obj, sort_keys=True))
+
+    def node(self, node_id, attrs):
+        obj = dict(attrs)
+        obj["id"] = node_id
+        self._item(obj)
+
+    def edge(self, source, target, attrs):
+        obj = dict(attrs)
+        obj["source"] = source
+        obj["target"] = target
+        self._item(obj)
+
+    def finding(self, obj):
+        self._item(obj)
+
+    def stop(self, section):
+        self.f.write("\n]")
+
+    def end(self):
+        self.f.write("}\n")
+
+
+def _dot_id(text):
+    return '"' + str(text).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _dot_attrs(attrs):
+    parts = []
+    for k in sorted(attrs):
+        v = attrs[k]
+        if isinstance(v, bool):
+            v = "true" if v else "false"
+        elif isinstance(v, int):
+            v = str(v)
+        else:
+            v = _dot_id(v)
+        parts.append(k + "=" + v)
+    return " [" + ", ".join(parts) + "]" if parts else ""
+
+
+class _DotWriter:
+    """Graphviz digraph; cyclic package edges are red, findings are // comments at the end."""
+
+    def __init__(self, f):
+        self.f = f
+
+    def begin(self, meta):
+        self.f.write("// " + json.dumps(meta, sort_keys=True) + "\n")
+        self.f.write("digraph arch {\n")
+        self.f.write("  rankdir=LR;\n")
+        self.f.write("  node [shape=box];\n")
+
+    def start(self, section):
+        self.f.write("  // " + section + "\n")
+
+    def node(self, node_id, attrs):
+        a = dict(attrs)
+        if a.get("kind") == "package":
+            a["shape"] = "folder"
+        self.f.write("  " + _dot_id(node_id) + _dot_attrs(a) + ";\n")
+
+    def edge(self, source, target, attrs):
+        a = dict(attrs)
+        if a.get("cyclic"):
+            a["color"] = "red"
+        self.f.write("  " + _dot_id(source) + " -> " + _dot_id(target) + _dot_attrs(a) + ";\n")
+
+    def finding(self, obj):
+        self.f.write("  // finding " + json.dumps(obj, sort_keys=True) + "\n")
+
+    def stop(self, section):
+        pass
+
+    def end(self):
+        self.f.write("}\n")
+
+
+class _GraphmlWriter:
+    """
+    GraphML with typed keys. The findings are one graph-level <data key="findings">
+    holding a JSON array (readers keep a single value per key), streamed item by item.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.key_ids = {}
+        self.n_edges = 0
+        self.first = True
+
+    def begin(self, meta):
+        self.f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self.f.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        self.f.write("  <desc>" + escape(json.dumps(meta, sort_keys=True)) + "</desc>\n")
+        i = 0
+        for name, domain, typ in _GRAPHML_KEYS:
+            key_id = "d" + str(i)
+            self.key_ids[(domain, name)] = key_id
+            self.f.write(
+                '  <key id="' + key_id + '" for="' + domain + '" attr.name="' + name + '" attr.type="' + typ + '"/>\n'
+            )
+            i += 1
+        self.f.write('  <graph id="arch" edgedefault="directed">\n')
+
+    def start(self, section):
+        if section == "findings":
+            self.f.write('    <data key="' + self.key_ids[("graph", "findings")] + '">[')
+            self.first = True
+
+    def _data(self, domain, attrs):
+        out = ""
+        for k in sorted(attrs):
+            key_id = self.key_ids.get((domain, k))
+            if key_id is None:
+                continue
+            v = attrs[k]
+            if isinstance(v, bool):
+                v = "true" if v else "false"
+            out += '<data key="' + key_id + '">' + escape(str(v)) + "</data>"
+        return out
+
+    def node(self, node_id, attrs):
+        self.f.write("    <node id=" + quoteattr(node_id) + ">" + self._data("node", attrs) + "</node>\n")
+
+    def edge(self, source, target, attrs):
+        self.n_edges += 1
+        self.f.write(
+            '    <edge id="e' + str(self.n_edges) + '" source=' + quoteattr(source) + " target=" + quoteattr(target) + ">"
+            + self._data("edge", attrs) + "</edge>\n"
+        )
+
+    def finding(self, obj):
+        if not self.first:
+            self.f.write(",\n")
+        self.first = False
+        self.f.write(escape(json.dumps(obj, sort_keys=True)))
+
+    def stop(self, section):
+        if section == "findings":
+            self.f.write("]</data>\n")
+
+    def end(self):
+        self.f.write("  </graph>\n</graphml>\n")
+
+
+_WRITERS = {"json": _JsonWriter, "dot": _DotWriter, "graphml": _GraphmlWriter}
+
+
+def _package_node(pkg):
+    return "package:" + pkg
+
+
+def _class_node(rel_path):
+    return "class:" + rel_path
+
+
+def _emit(analysis, writers):
+    """One pass over the analysis; every record goes to every writer. Returns record counts."""
+    java_files = analysis["java_files"]
+    graph = analysis["graph"]
+    files_by_pkg = analysis["files_by_pkg"]
+    weights = analysis["weights"]
+    sccs = analysis["sccs"]
+
+    module_of = {}
+    for module, infos in analysis["files_by_module"].items():
+        for f in infos:
+            module_of[f.rel_path] = module
+
+    scc_of = {}
+    i = 0
+    while i < len(sccs):
+        for pkg in sccs[i]:
+            scc_of[pkg] = i
+        i += 1
+
+    class_graph = build_class_graph(java_files)
+    class_fan_in = {}
+    n_class_edges = 0
+    for deps in class_graph.values():
+        n_class_edges += len(deps)
+        for d in deps:
+            class_fan_in[d] = class_fan_in.get(d, 0) + 1
+    n_package_edges = 0
+    for deps in graph.values():
+        n_package_edges += len(deps)
+
+    meta = {
+        "format": "arch-graph",
+        "version": 1,
+        "repo": analysis["repo_path"],
+        "packages": len(graph),
+        "package_edges": n_package_edges,
+        "classes": len(class_graph),
+        "class_edges": n_class_edges,
+        "modules": len(analysis["files_by_module"]),
+    }
+    for w in writers:
+        w.begin(meta)
+
+    counts = {"nodes": 0, "edges": 0, "findings": 0}
+
+    for w in writers:
+        w.start("nodes")
+    for pkg in sorted(graph):
+        files = files_by_pkg.get(pkg, [])
+        loc = 0
+        modules = set()
+        for f in files:
+            loc += f.loc
+            modules.add(module_of.get(f.rel_path, ""))
+        scc = scc_of.get(pkg, -1)
+        attrs = {
+            "kind": "package",
+            "label": pkg or "(default)",
+            "files": len(files),
+            "loc": loc,
+            "fan_in": analysis["indeg"].get(pkg, 0),
+            "fan_out": analysis["outdeg"].get(pkg, 0),
+            "scc": scc,
+            "scc_size": len(sccs[scc]) if scc >= 0 else 1,
+            "module": ",".join(sorted(m for m in modules if m)),
+        }
+        for w in writers:
+            w.node(_package_node(pkg), attrs)
+        counts["nodes"] += 1
+    for f in sorted(java_files, key=lambda x: x.rel_path):
+        attrs = {
+            "kind": "class",
+            "label": f.rel_path,
+            "package": f.package,
+            "loc": f.loc,
+            "fan_in": class_fan_in.get(f.rel_path, 0),
+            "fan_out": len(class_graph.get(f.rel_path, ())),
+            "module": module_of.get(f.rel_path, ""),
+        }
+        for w in writers:
+            w.node(_class_node(f.rel_path), attrs)
+        counts["nodes"] += 1
+    for w in writers:
+        w.stop("nodes")
+
+    for w in writers:
+        w.start("edges")
+    for pkg in sorted(graph):
+        for dst in sorted(graph[pkg]):
+            a = scc_of.get(pkg, -1)
+            attrs = {
+                "kind": "package_dep",
+                "weight": weights.get((pkg, dst), 1),
+                "cyclic": a >= 0 and a == scc_of.get(dst, -2) and len(sccs[a]) > 1,
+            }
+            for w in writers:
+                w.edge(_package_node(pkg), _package_node(dst), attrs)
+            counts["edges"] += 1
+    for src in sorted(class_graph):
+        for dst in sorted(class_graph[src]):
+            for w in writers:
+                w.edge(_class_node(src), _class_node(dst), {"kind": "class_dep"})
+            counts["edges"] += 1
+    for w in writers:
+        w.stop("edges")
+
+    for w in writers:
+        w.start("findings")
+    findings = []
+    i = 0
+    while i < len(sccs):
+        if len(sccs[i]) > 1:
+            findings.append({"kind": "scc", "scc": i, "size": len(sccs[i]), "packages": sorted(sccs[i])})
+        i += 1
+    for path, scc_size in rank_cycles(analysis["cycle_lists"], sccs, weights):
+        imports = [weights.get((path[e], path[e + 1]), 1) for e in range(len(path) - 1)]
+        findings.append({"kind": "cycle", "path": path, "scc_size": scc_size, "imports": imports})
+    findings.extend(analysis["magnets"])
+    findings.extend(analysis["oversized"])
+    for m in analysis["modules"] or []:
+        obj = dict(m)
+        obj["kind"] = "module"
+        findings.append(obj)
+    for obj in findings:
+        for w in writers:
+            w.finding(obj)
+        counts["findings"] += 1
+    for w in writers:
+        w.stop("findings")
+
+    for w in writers:
+        w.end()
+    return counts
+
+
+def export_architecture(analysis, out_dir, formats):
+    """Write out_dir/arch_graph.<fmt> for each format; returns the written paths."""
+    t0 = time.perf_counter()
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    paths = []
+    files = []
+    writers = []
+    try:
+        for fmt in formats:
+            path = os.path.join(out_dir, "arch_graph." + fmt)
+            f = open(path + ".tmp", "w", encoding="utf-8", buffering=_BUFFER)
+            paths.append(path)
+            files.append(f)
+            writers.append(_WRITERS[fmt](f))
+        counts = _emit(analysis, writers)
+    except Exception:
+        for f in files:
+            f.close()
+        for path in paths:
+            if os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+        raise
+
+    for f in files:
+        f.close()
+    for path in paths:
+        os.replace(path + ".tmp", path)
+        print("Wrote:", path)
+    print(
+        "[TIMING] arch_export_ms=" + str(int((time.perf_counter() - t0) * 1000))
+        + " nodes=" + str(counts["nodes"]) + " edges=" + str(counts["edges"]) + " findings=" + str(counts["findings"])
+    )
+    return paths
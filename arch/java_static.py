@@ -3,13 +3,20 @@ import re
 
 PACKAGE_RE = re.compile(r"^\s*package\s+([a-zA-Z0-9_.]+)\s*;", re.MULTILINE)
 IMPORT_RE = re.compile(r"^\s*import\s+([a-zA-Z0-9_.]+)\s*;", re.MULTILINE)
+# Capitalised identifiers: candidate references to other types (same-package types need no import).
+TYPE_REF_RE = re.compile(r"\b[A-Z][A-Za-z0-9_]*\b")
 
 class JavaFileInfo:
-    def __init__(self, rel_path, package, imports, loc):
+    def __init__(self, rel_path, package, imports, loc, type_refs=None):
         self.rel_path = rel_path
         self.package = package
         self.imports = imports
         self.loc = loc
+        self.type_refs = type_refs if type_refs is not None else set()
+
+def is_test_path(rel_path):
+    """True for files under a src/test/ tree, at the root or inside a module (a/src/test/...)."""
+    return rel_path.startswith("src/test/") or "/src/test/" in rel_path
 
 def count_loc(text):
     loc = 0
@@ -38,10 +45,16 @@ def parse_java_file(abs_path, rel_path):
         imports.append(im)
 
     loc = count_loc(text)
-    return JavaFileInfo(rel_path.replace(os.sep, "/"), pkg, imports, loc)
+    type_refs = set(TYPE_REF_RE.findall(text))
+    return JavaFileInfo(rel_path.replace(os.sep, "/"), pkg, imports, loc, type_refs)
 
-def scan_repo_java(repo_path):
+def scan_repo_java(repo_path, cache=None):
+    """
+    Parse every non-test Java file. With a ParseCache (arch/parse_cache.py), files
+    whose mtime/size are unchanged reuse their cached parse, and the cache is saved.
+    """
     out = []
+    seen = set()
     for root, _, files in os.walk(repo_path):
         for name in files:
             if not name.endswith(".java"):
@@ -50,10 +63,26 @@ def scan_repo_java(repo_path):
             rel_path = os.path.relpath(abs_path, repo_path).replace(os.sep, "/")
 
             # Always exclude tests
-            if rel_path.startswith("src/test/"):
+            if is_test_path(rel_path):
                 continue
 
-            info = parse_java_file(abs_path, rel_path)
+            info = None
+            st = None
+            if cache is not None:
+                try:
+                    st = os.stat(abs_path)
+                except OSError:
+                    continue
+                info = cache.lookup(rel_path, st)
+            if info is None:
+                info = parse_java_file(abs_path, rel_path)
+                if info and cache is not None:
+                    cache.store(info, st)
             if info:
                 out.append(info)
+                seen.add(rel_path)
+
+    if cache is not None:
+        cache.retain(seen)
+        cache.save()
     return out
@@ -0,0 +1,321 @@
+"""
+Build-module discovery and per-module scans for the architecture agent.
+
+Modules come from Maven (pom.xml <modules>, recursively) or Gradle
+(settings.gradle / settings.gradle.kts `include`). Each module owns the Java files
+under its directory, minus nested modules and any src/test/ tree, and is scanned
+and graphed (its own package graph) in a worker process. An inter-module graph is
+derived from the imports: module A depends on B when a file of A imports a package
+that lives in B.
+Without build files the repository is one module, scanned like before.
+"""
+
+import os
+import re
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+from arch.dep_graph import _best_internal_package, build_package_graph, strongly_connected_components
+from arch.java_static import is_test_path, parse_java_file, scan_repo_java
+from arch.parse_cache import ParseCache, parse_cache_for
+
+ROOT_MODULE = "(root)"
+
+_GRADLE_INCLUDE_RE = re.compile(r"^\s*include\b(.*)$", re.MULTILINE)
+_QUOTED_RE = re.compile(r"['\"]([^'\"]+)['\"]")
+_GRADLE_PROJECT_DEP_RE = re.compile(r"project\(\s*(?:path\s*[:=]\s*)?['\"]:?([^'\"]+)['\"]")
+
+
+class BuildModule:
+    def __init__(self, name, path, declared_deps=None, build_tool=""):
+        self.name = name
+        self.path = path  # repo-relative dir, "." for the root
+        self.declared_deps = declared_deps if declared_deps is not None else []
+        self.build_tool = build_tool
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child(elem, name):
+    for c in elem:
+        if _local(c.tag) == name:
+            return c
+    return None
+
+
+def _read_pom(pom_path):
+    """(artifactId, [module dirs], [dependency artifactIds]) of one pom.xml, or None."""
+    try:
+        root = ET.parse(pom_path).getroot()
+    except (ET.ParseError, OSError):
+        return None
+
+    artifact = _child(root, "artifactId")
+    modules = []
+    mods = _child(root, "modules")
+    if mods is not None:
+        for m in mods:
+            if _local(m.tag) == "module" and m.text:
+                modules.append(m.text.strip())
+
+    deps = []
+    dependencies = _child(root, "dependencies")
+    if dependencies is not None:
+        for d in dependencies:
+            a = _child(d, "artifactId")
+            if a is not None and a.text:
+                deps.append(a.text.strip())
+    return (artifact.text.strip() if artifact is not None and artifact.text else None), modules, deps
+
+
+def _maven_modules(repo_path):
+    out = []
+    pending = ["."]
+    seen = set()
+    while pending:
+        rel = pending.pop(0)
+        if rel in seen:
+            continue
+        seen.add(rel)
+        info = _read_pom(os.path.join(repo_path, rel, "pom.xml"))
+        if info is None:
+            continue
+        artifact, modules, deps = info
+        name = artifact or (ROOT_MODULE if rel == "." else rel)
+        out.append(BuildModule(name, rel, deps, "maven"))
+        for m in modules:
+            pending.append(os.path.normpath(os.path.join(rel, m)).replace(os.sep, "/"))
+
+    # Keep only dependencies on modules of this build.
+    names = set(m.name for m in out)
+    for m in out:
+        m.declared_deps = sorted(set(d for d in m.declared_deps if d in names and d != m.name))
+    return out
+
+
+def _read_text(path):
+    try:
+        f = open(path, "r", encoding="utf-8", errors="ignore")
+        text = f.read()
+        f.close()
+        return text
+    except OSError:
+        return None
+
+
+def _gradle_modules(repo_path):
+    settings = None
+    for name in ("settings.gradle", "settings.gradle.kts"):
+        settings = _read_text(os.path.join(repo_path, name))
+        if settings is not None:
+            break
+    if settings is None:
+        return []
+
+    paths = []
+    for m in _GRADLE_INCLUDE_RE.finditer(settings):
+        for project in _QUOTED_RE.findall(m.group(1)):
+            paths.append(project.strip(":").replace(":", "/"))
+
+    out = [BuildModule(ROOT_MODULE, ".", [], "gradle")]
+    for path in paths:
+        out.append(BuildModule(path, path, [], "gradle"))
+
+    names = set(m.name for m in out)
+    for m in out:
+        deps = set()
+        for name in ("build.gradle", "build.gradle.kts"):
+            text = _read_text(os.path.join(repo_path, m.path, name))
+            if text is not None:
+                for d in _GRADLE_PROJECT_DEP_RE.findall(text):
+                    deps.add(d.strip(":").replace(":", "/"))
+        m.declared_deps = sorted(d for d in deps if d in names and d != m.name)
+    return out
+
+
+def discover_modules(repo_path):
+    """Build modules of repo_path (Maven first, then Gradle); [] when it has no build files."""
+    modules = _maven_modules(repo_path)
+    if not modules:
+        modules = _gradle_modules(repo_path)
+    return modules
+
+
+def _module_graph_stats(infos):
+    """Package edges and packages in dependency cycles, within one module only."""
+    graph, _ = build_package_graph(infos)
+    edges = 0
+    for k in graph:
+        edges += len(graph[k])
+    cyclic = 0
+    for comp in strongly_connected_components(graph):
+        if len(comp) > 1:
+            cyclic += len(comp)
+    return {"pkg_edges": edges, "cyclic_packages": cyclic}
+
+
+def _scan_module(repo_path, module_path, nested, cache_path):
+    """
+    Worker: parse the module's Java files (rel paths from the repo root), skipping
+    nested module dirs and src/test/ trees, and graph its packages. Returns
+    ([(info, stat or None)], graph stats); stat is set for files parsed here, so the
+    parent can update the shared parse cache.
+    """
+    cache = ParseCache(cache_path)
+    top = os.path.join(repo_path, module_path)
+    out = []
+    for root, dirs, files in os.walk(top):
+        rel_root = os.path.relpath(root, repo_path).replace(os.sep, "/")
+        if rel_root == ".":
+            rel_root = ""
+        keep = []
+        for d in dirs:
+            rel_dir = (rel_root + "/" + d) if rel_root else d
+            if rel_dir in nested or d.startswith("."):
+                continue
+            keep.append(d)
+        dirs[:] = keep
+
+        for name in files:
+            if not name.endswith(".java"):
+                continue
+            rel_path = (rel_root + "/" + name) if rel_root else name
+            rel_in_module = os.path.relpath(os.path.join(root, name), top).replace(os.sep, "/")
+            if is_test_path(rel_path) or is_test_path(rel_in_module):
+                continue
+            abs_path = os.path.join(root, name)
+            try:
+                st = os.stat(abs_path)
+            except OSError:
+                continue
+            info = cache.lookup(rel_path, st)
+            if info is not None:
+                out.append((info, None))
+                continue
+            info = parse_java_file(abs_path, rel_path)
+            if info is not None:
+                out.append((info, st))
+    return out, _module_graph_stats([x[0] for x in out])
+
+
+def scan_modules(repo_path, modules):
+    """
+    ({module name: [JavaFileInfo]}, {module name: graph stats}), scanned in
+    ARCH_MODULE_WORKERS processes sharing the repository's parse cache.
+    Without modules: ({ROOT_MODULE: scan_repo_java(...)}, {}).
+    """
+    cache = parse_cache_for(repo_path)
+    if not modules:
+        return {ROOT_MODULE: scan_repo_java(repo_path, cache)}, {}
+
+    jobs = []
+    for m in modules:
+        nested = set()
+        for other in modules:
+            if other is m:
+                continue
+            if m.path == "." or other.path.startswith(m.path.rstrip("/") + "/"):
+                if other.path != ".":
+                    nested.add(other.path)
+        jobs.append((m, nested))
+
+    results = {}
+    workers = max(1, min(config.ARCH_MODULE_WORKERS, len(jobs)))
+    if workers == 1:
+        for m, nested in jobs:
+            results[m.name] = _scan_module(repo_path, m.path, nested, cache.path)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(m, pool.submit(_scan_module, repo_path, m.path, nested, cache.path)) for m, nested in jobs]
+            for m, fut in futures:
+                results[m.name] = fut.result()
+
+    out = {}
+    stats = {}
+    seen = set()
+    for m in modules:
+        infos = []
+        pairs, stats[m.name] = results[m.name]
+        for info, st in pairs:
+            if info.rel_path in seen:
+                continue
+            seen.add(info.rel_path)
+            if st is not None:
+                cache.store(info, st)
+            infos.append(info)
+        out[m.name] = infos
+    cache.retain(seen)
+    cache.save()
+    return out, stats
+
+
+def build_module_graph(files_by_module):
+    """{module: {other module: import count}} from imports that resolve to another module's package."""
+    internal_packages = set()
+    owners = {}
+    for module, infos in files_by_module.items():
+        for f in infos:
+            if f.package:
+                internal_packages.add(f.package)
+                owners.setdefault(f.package, set()).add(module)
+
+    graph = {}
+    for module, infos in files_by_module.items():
+        edges = graph.setdefault(module, {})
+        for f in infos:
+            for imp in f.imports:
+                pkg = _best_internal_package(imp, internal_packages)
+                if not pkg:
+                    continue
+                for owner in owners.get(pkg, ()):
+                    if owner != module:
+                        edges[owner] = edges.get(owner, 0) + 1
+    return graph
+
+
+def module_findings(modules, files_by_module, stats_by_module):
+    """
+    One finding per non-empty module, largest first: files, LOC, packages, its own
+    package graph stats, actual dependencies with import counts, dependencies
+    missing from the build file, and the other modules it shares a cycle with.
+    """
+    graph = build_module_graph(files_by_module)
+    cyclic = {}
+    for comp in strongly_connected_components(dict((k, set(v)) for k, v in graph.items())):
+        if len(comp) > 1:
+            for m in comp:
+                cyclic[m] = sorted(comp - {m})
+
+    by_name = dict((m.name, m) for m in modules)
+    out = []
+    for name, infos in files_by_module.items():
+        if not infos:
+            continue
+        module = by_name.get(name)
+        loc = 0
+        packages = set()
+        for f in infos:
+            loc += f.loc
+            packages.add(f.package)
+        deps = sorted(graph.get(name, {}).items(), key=lambda x: (-x[1], x[0]))
+        stats = stats_by_module.get(name, {})
+        undeclared = []
+        if module is not None and module.build_tool:
+            undeclared = [d for d, _ in deps if d not in module.declared_deps]
+        out.append({
+            "module": name,
+            "path": module.path if module is not None else ".",
+            "files": len(infos),
+            "loc": loc,
+            "packages": len(packages),
+            "pkg_edges": stats.get("pkg_edges", 0),
+            "cyclic_packages": stats.get("cyclic_packages", 0),
+            "depends_on": deps,
+            "undeclared": undeclared,
+            "cycle_with": cyclic.get(name, []),
+        })
+    out.sort(key=lambda x: (-x["loc"], x["module"]))
+    return out
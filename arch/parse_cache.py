@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+
+import config
+from arch.java_static import JavaFileInfo
+
+
+def _stat_key(st):
+    return [st.st_mtime_ns, st.st_size]
+
+
+class ParseCache:
+    """
+    Per-file parse results (package, imports, LOC, type refs) of one repository,
+    keyed by rel_path and valid while the file's mtime and size are unchanged.
+    Lets scan_repo_java skip unchanged files; watch mode updates it eagerly.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        self.dirty = False
+        if os.path.isfile(path):
+            try:
+                f = open(path, "r", encoding="utf-8")
+                self.files = json.load(f).get("files", {})
+                f.close()
+            except Exception:
+                self.files = {}
+
+    def lookup(self, rel_path, st):
+        e = self.files.get(rel_path)
+        if e is None or e.get("stat") != _stat_key(st):
+            return None
+        return JavaFileInfo(rel_path, e["package"], e["imports"], e["loc"], set(e["type_refs"]))
+
+    def store(self, info, st):
+        self.files[info.rel_path] = {
+            "stat": _stat_key(st),
+            "package": info.package,
+            "imports": info.imports,
+            "loc": info.loc,
+            "type_refs": sorted(info.type_refs),
+        }
+        self.dirty = True
+
+    def remove(self, rel_path):
+        if self.files.pop(rel_path, None) is not None:
+            self.dirty = True
+
+    def retain(self, rel_paths):
+        """Drop entries of files that no longer exist."""
+        for rel_path in list(self.files.keys()):
+            if rel_path not in rel_paths:
+                del self.files[rel_path]
+                self.dirty = True
+
+    def files_in_package(self, package):
+        return sorted(r for r, e in self.files.items() if e["package"] == package)
+
+    def save(self):
+        if not self.dirty:
+            return
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        tmp = self.path + "." + str(os.getpid()) + ".tmp"
+        f = open(tmp, "w", encoding="utf-8")
+        json.dump({"files": self.files}, f)
+        f.close()
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+def parse_cache_for(repo_path):
+    """The cache file of repo_path under config.PARSE_CACHE_DIR (one file per repository)."""
+    key = hashlib.sha1(os.path.abspath(repo_path).encode("utf-8")).hexdigest()[:16]
+    return ParseCache(os.path.join(config.PARSE_CACHE_DIR, key + ".json"))
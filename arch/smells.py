@@ -27,12 +27,6 @@ def detect_dependency_magnets(indeg, outdeg, files_by_pkg, top_n):
         })
     return magnets
 
-def detect_cycles(cycles):
-    out = []
-    for c in cycles:
-        out.append({"kind": "cycle", "cycle": c})
-    return out
-
 def detect_oversized_packages(files_by_pkg, top_n):
     items = []
     for pkg in files_by_pkg:
@@ -1,17 +1,146 @@
 # Repository root (edit this once)
 REPO_PATH = "E:\\arch_task\\zip4j" 
 
+# Multi-repo mode: {"shard name": "repo path", ...}. Each repo is indexed into its own
+# shard under SHARDS_DIR (built in parallel worker processes) and QA queries all
+# shards concurrently. Leave empty to index REPO_PATH only.
+REPOS = {}
+SHARDS_DIR = "./shards"
+SHARD_BUILD_WORKERS = 2  # each worker loads its own embedding model
+SHARD_QUERY_WORKERS = 8
+
 # Chroma / embedding
 EMBEDDING_MODEL_NAME = "BAAI/bge-base-en-v1.5"
+# "sentence-transformers" (PyTorch) or "onnx" (int8-quantised export of the same model,
+# created with `python main.py export-onnx`)
+EMBEDDING_BACKEND = "sentence-transformers"
+ONNX_MODEL_DIR = "./onnx_model"
+ONNX_MODEL_FILE = "model_int8.onnx"
+ONNX_NUM_THREADS = 0  # 0 = onnxruntime default
+ONNX_PARITY_MIN_COSINE = 0.99
+ONNX_PARITY_SAMPLES = 64
+# Chunks read, embedded and upserted per batch when building the index
+EMBED_BATCH_SIZE = 64
+# Build as a pipeline (walk -> read -> chunk -> embed -> write, overlapped through
+# bounded queues) instead of ingesting everything, then embedding everything
+PIPELINED_BUILD = True
+PIPELINE_READ_WORKERS = 4
+PIPELINE_CHUNK_WORKERS = 2
+PIPELINE_QUEUE_SIZE = 256
+# Embed each group of identical / near-identical Java files once (MinHash + LSH over
+# token 5-shingles); exact copies are listed on the canonical chunk, near copies are
+# pointer records to it, and query hits of one group are collapsed
+DEDUP_ENABLED = True
+DEDUP_THRESHOLD = 0.9
+DEDUP_NUM_PERM = 64
+DEDUP_BANDS = 8
+DEDUP_QUERY_EXTRA = 5
+# Path components of generated / build output dirs; a file under one of them is
+# only the canonical copy when no other member of its group is outside them.
+DEDUP_GENERATED_DIRS = ("gen", "generated", "generated-sources", "generated-src", "build", "target", "out")
 CHROMA_COLLECTION_NAME = "zip4j_docs"
 CHROMA_PERSIST_DIR = "./chroma_db"
 CHROMA_SPACE = "cosine"
 
+# HNSW index settings (Chroma backend), applied when a collection version is created.
+# A profile written by `python main.py tune-index` overrides these values.
+HNSW_M = 16
+HNSW_CONSTRUCTION_EF = 100
+HNSW_SEARCH_EF = 100
+HNSW_PROFILE_PATH = "./chroma_db/hnsw_profile.json"
+
+# tune-index sweep (recall@k against exact brute-force search)
+TUNE_HNSW_M = [8, 16, 32]
+TUNE_HNSW_CONSTRUCTION_EF = [64, 128, 256]
+TUNE_HNSW_SEARCH_EF = [16, 32, 64, 128]
+TUNE_NUM_QUERIES = 50
+TUNE_RECALL_K = 10
+TUNE_TARGET_RECALL = 0.95
+
+# Vector store backend: "chroma" (HNSW, persisted via PersistentClient)
+# or "flat" (memory-mapped brute-force index, see rag_pipeline/flat_store.py)
+VECTOR_STORE_BACKEND = "chroma"
+FLAT_PERSIST_DIR = "./flat_index"
+FLAT_INDEX_DTYPE = "float32"  # "float32", "float16" or "int8" (scalar-quantised)
+FLAT_INDEX_TRUNCATE_DIM = 0  # keep only the first N dimensions in the scanned matrix (0 = all)
+FLAT_KEEP_FULL_VECTORS = True  # keep a float32 copy on disk to rescore compressed results
+FLAT_RESCORE_CANDIDATES = 50  # top candidates rescored at full precision
+
+# bench-vectors: (dtype, truncate_dim) variants compared against exact float32 search
+BENCH_VECTOR_VARIANTS = [
+    ("float32", 0),
+    ("float16", 0),
+    ("int8", 0),
+    ("float16", 384),
+    ("int8", 384),
+    ("int8", 256),
+]
+
+# Rebuilds write a new collection version and swap the alias when done.
+# Versions kept after a swap (current + previous), the rest are deleted in the background.
+INDEX_KEEP_VERSIONS = 2
+
+# Per-file Java parse results reused by scan_repo_java (one cache file per repo)
+PARSE_CACHE_DIR = "./cache/parse"
+
+# `python main.py watch`: inotify on Linux (polling fallback); changes are applied
+# once no new change arrived for WATCH_DEBOUNCE_SECS
+WATCH_USE_INOTIFY = True
+WATCH_POLL_SECS = 2.0
+WATCH_DEBOUNCE_SECS = 1.5
+
+# Index snapshots (`python main.py index export|import`): rows read per page on
+# export and upserted per batch on import
+SNAPSHOT_PAGE_SIZE = 1000
+SNAPSHOT_BATCH_SIZE = 1000
+
 # Retrieval
 TOP_K = 3
 MAX_CANDIDATE_TOKENS = 1200
 RETRIEVAL_SCOPE = "code"
 
+# Hierarchical retrieval for large repos: "flat" searches every chunk; "hierarchical"
+# picks the top packages, then their top files, and searches only those files' chunks.
+# Needs the package/file summary docs, written at build time when INDEX_SUMMARIES is on.
+RETRIEVAL_MODE = "flat"
+INDEX_SUMMARIES = False
+HIER_TOP_PACKAGES = 3
+HIER_TOP_FILES = 20
+SUMMARY_README_PARAGRAPHS = 2
+
+# Context packing: retrieve CANDIDATE_POOL_K chunks, drop duplicate/overlapping
+# spans and pack the most relevant snippets into CONTEXT_TOKEN_BUDGET tokens
+# (counted with PROMPT_TOKENIZER: a tokenizer.json path or Hugging Face repo id;
+# empty = regex approximation)
+CONTEXT_PACKING = True
+CANDIDATE_POOL_K = 10
+CONTEXT_TOKEN_BUDGET = 3000
+PROMPT_TOKENIZER = ""
+
+# Cross-encoder reranking: retrieve RERANK_CANDIDATES chunks, score (question, chunk)
+# pairs on CPU in batches and keep the best TOP_K (or CANDIDATE_POOL_K when packing)
+RERANK_ENABLED = False
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 50
+RERANK_BATCH_SIZE = 16
+RERANK_MAX_LENGTH = 512  # tokens per (question, chunk) pair
+RERANK_CACHE_SIZE = 4096  # cached (question, chunk, index version) scores
+
+# Graph-aware expansion: package/class dependency graphs are written at build time;
+# QA appends direct dependencies/dependents of retrieved files within this budget
+DEP_GRAPH_PATH = "./chroma_db/dep_graph.json"
+GRAPH_EXPANSION = True
+GRAPH_EXPANSION_TOKEN_BUDGET = 800
+GRAPH_EXPANSION_MAX_NEIGHBOURS = 6
+
+# QA caches: exact question -> embedding LRU, and verified answers reused for
+# near-identical questions on the same index version (cleared on every build)
+QUERY_EMBEDDING_CACHE_SIZE = 256
+QA_CACHE_ENABLED = True
+QA_CACHE_PATH = "./cache/qa_cache.json"
+SEMANTIC_CACHE_MIN_SIMILARITY = 0.95
+SEMANTIC_CACHE_MAX_ENTRIES = 500
+
 # LM Studio (OpenAI-compatible)
 LM_STUDIO_BASE_URL = "http://localhost:1234"
 LM_STUDIO_MODEL = "qwen/qwen3-coder-30b"
@@ -19,7 +148,56 @@ LM_TEMPERATURE = 0
 LM_TOP_P = 1.0
 LM_TIMEOUT_SECS = 120
 
+# LLM requests: transient failures (timeouts, connection errors, 429/5xx) are retried
+# with jittered exponential backoff; each attempt and the whole call have deadlines
+LLM_MAX_RETRIES = 3
+LLM_BACKOFF_BASE_SECS = 0.5
+LLM_BACKOFF_MAX_SECS = 8.0
+LLM_REQUEST_DEADLINE_SECS = LM_TIMEOUT_SECS
+LLM_TOTAL_DEADLINE_SECS = 300
+# Candidates per question: the first that passes verification is used, the rest are
+# cancelled. "parallel" = one request each; "n" = one request with n > 1 (if the
+# server supports it). Extra candidates use LLM_CANDIDATE_TEMPERATURE to differ.
+LLM_CANDIDATES = 1
+LLM_CANDIDATE_MODE = "parallel"
+LLM_CANDIDATE_TEMPERATURE = 0.4
+# Stream responses (SSE) to measure time-to-first-token, and ask for usage so the
+# server's cached prompt tokens are logged; cancelled candidates stop reading early.
+# Turn LLM_STREAM_INCLUDE_USAGE off if the server rejects "stream_options".
+LLM_STREAM = True
+LLM_STREAM_INCLUDE_USAGE = True
+# Architecture answers rejected by the verifier are sent back with the violations
+# for at most this many repair rounds before the fallback answer is used
+ARCH_REPAIR_ROUNDS = 2
+
+# Local OpenAI-compatible stand-in server (`python main.py stub-llm [port]`, see
+# tools/stub_llm.py): seconds before the first token, tokens per second after it
+# (0 = no delay), fraction of requests failing with STUB_LLM_ERROR_STATUS, fraction
+# of answers that fail verification, and an optional JSON file of canned answers
+STUB_LLM_PORT = 1234
+STUB_LLM_LATENCY_SECS = 0.2
+STUB_LLM_TOKENS_PER_SEC = 200
+STUB_LLM_ERROR_RATE = 0.0
+STUB_LLM_ERROR_STATUS = 503
+STUB_LLM_INVALID_RATE = 0.0
+STUB_LLM_ANSWERS_FILE = ""
+
+# `python main.py load-test [qa|arch] [requests] [concurrency]`; with
+# LOAD_TEST_USE_STUB an in-process stub server is started instead of LM Studio
+LOAD_TEST_REQUESTS = 50
+LOAD_TEST_CONCURRENCY = 8
+LOAD_TEST_USE_STUB = True
+
 # Architecture analysis
+# Evidence is ranked by impact (SCC size and import counts for cycles, degree for
+# magnets, LOC for oversized packages) and added until the whole prompt, ARCH_QUERY
+# included, reaches ARCH_PROMPT_TOKEN_BUDGET tokens (counted with PROMPT_TOKENIZER)
+ARCH_PROMPT_TOKEN_BUDGET = 3000
+ARCH_EVIDENCE_CANDIDATES = 50
+ARCH_CYCLES_PER_SCC = 5
+# Maven/Gradle build modules are scanned in this many worker processes; the module
+# dependency graph (from imports) is added to the evidence as MODULE_k items
+ARCH_MODULE_WORKERS = 4
 ARCH_QUERY = (
         "Based on the dependency evidence, identify ONE architectural smell and propose ONE concrete refactoring.\n"
         "\n"
@@ -1,10 +1,21 @@
 import sys
 
+import config
 from tools.runtime import get_repo_path, get_collection
 from rag_pipeline.qa_agent import run_question_answering
+from rag_pipeline.tuning import tune_hnsw, benchmark_vector_storage
+from rag_pipeline.ingestion import ingest_repository
+from rag_pipeline.onnx_embedding import export_onnx_model, check_parity
+from rag_pipeline.evaluation import evaluate_retrieval
+from rag_pipeline.snapshot import export_index, import_index
+from rag_pipeline.watch import watch_repository
+
+from tools.stub_llm import serve_stub_llm
+from tools.load_test import run_load_test
 
 from arch.arch_agent import run_architecture_analysis
 from arch.report import write_report
+from arch.export import EXPORT_FORMATS, parse_export_formats
 
 
 def run_qa(question, build_index, rebuild_index):
@@ -14,22 +25,101 @@ def run_qa(question, build_index, rebuild_index):
     print(answer)
 
 
-def run_arch():
+def run_arch(export_formats=None):
     repo_path = get_repo_path()
     if repo_path is None:
         return
 
-    answer = run_architecture_analysis(repo_path)
+    answer = run_architecture_analysis(repo_path, export_formats, "out")
     print(answer)
     write_report("out", answer)
 
 
+def run_tune_index(question_file):
+    repo_path = get_repo_path()
+    if repo_path is None:
+        return
+    tune_hnsw(repo_path, question_file)
+
+
+def run_bench_vectors(question_file):
+    repo_path = get_repo_path()
+    if repo_path is None:
+        return
+    benchmark_vector_storage(repo_path, question_file)
+
+
+def run_eval_retrieval(question_file, build_index, rebuild_index):
+    collection = get_collection(build=build_index, rebuild=rebuild_index)
+    if collection is None:
+        return
+    evaluate_retrieval(collection, question_file)
+
+
+def run_index(args, force):
+    if len(args) < 2 or args[0] not in ("export", "import"):
+        print("Usage: python main.py index export|import [--force] <snapshot.zip> [shard]")
+        return
+    shard = args[2] if len(args) > 2 else None
+    if shard is not None and shard not in config.REPOS:
+        print("Unknown shard:", shard)
+        return
+
+    if args[0] == "export":
+        export_index(args[1], shard)
+    else:
+        import_index(args[1], shard, force=force)
+
+
+def run_watch(shard):
+    if shard is not None:
+        if shard not in config.REPOS:
+            print("Unknown shard:", shard)
+            return
+        watch_repository(config.REPOS[shard], shard)
+        return
+
+    repo_path = get_repo_path()
+    if repo_path is None:
+        return
+    watch_repository(repo_path)
+
+
+def run_export_onnx():
+    repo_path = get_repo_path()
+    if repo_path is None:
+        return
+
+    export_onnx_model(config.EMBEDDING_MODEL_NAME, config.ONNX_MODEL_DIR)
+
+    docs = ingest_repository(repo_path)
+    step = max(1, len(docs) // max(1, config.ONNX_PARITY_SAMPLES))
+    texts = [d.text for d in docs[::step]][: config.ONNX_PARITY_SAMPLES]
+    ok = check_parity(
+        config.EMBEDDING_MODEL_NAME,
+        config.ONNX_MODEL_DIR,
+        texts,
+        model_file=config.ONNX_MODEL_FILE,
+        min_cosine=config.ONNX_PARITY_MIN_COSINE,
+    )
+    if ok:
+        print('Parity OK. Set EMBEDDING_BACKEND = "onnx" in config.py to use it.')
+
+
 def main():
     if len(sys.argv) < 2:
         print("Usage:")
-        print("  python main.py build [--rebuild]")
+        print("  python main.py build [--rebuild] [shard...]")
         print('  python main.py qa [--build|--rebuild] <question...>')
-        print("  python main.py arch [--build|--rebuild]")
+        print("  python main.py arch [--export json,dot,graphml]")
+        print("  python main.py tune-index [questions.txt]")
+        print("  python main.py bench-vectors [questions.txt]")
+        print("  python main.py export-onnx")
+        print("  python main.py eval-retrieval [--build|--rebuild] <labelled_questions.tsv>")
+        print("  python main.py index export|import [--force] <snapshot.zip> [shard]")
+        print("  python main.py watch [shard]")
+        print("  python main.py stub-llm [port]")
+        print("  python main.py load-test [qa|arch] [requests] [concurrency]")
         print("")
         print("Repo path comes from rag_pipeline/config.py: REPO_PATH")
         return
@@ -39,6 +129,8 @@ def main():
 
     build_index = False
     rebuild_index = False
+    force = False
+    export_formats = None
 
     while args and args[0].startswith("--"):
         flag = args[0].strip()
@@ -47,12 +139,28 @@ def main():
             build_index = True
         elif flag == "--rebuild":
             rebuild_index = True
+        elif flag == "--force":
+            force = True
+        elif flag == "--export" or flag.startswith("--export="):
+            if flag == "--export":
+                if not args:
+                    print("--export needs a format list, e.g. --export json,dot,graphml")
+                    return
+                value = args[0]
+                args = args[1:]
+            else:
+                value = flag.split("=", 1)[1]
+            export_formats = parse_export_formats(value)
+            if export_formats is None:
+                print("Unknown export format in:", value, "(supported: " + ", ".join(EXPORT_FORMATS) + ")")
+                return
         else:
             print("Unknown flag:", flag)
             return
 
     if mode == "build":
-        _ = get_collection(build=True, rebuild=rebuild_index)
+        # Multi-repo mode: optional shard names build just those repos.
+        _ = get_collection(build=True, rebuild=rebuild_index, only=args or None)
         return
 
     if mode == "qa":
@@ -64,7 +172,50 @@ def main():
         return
 
     if mode == "arch":
-        run_arch()
+        run_arch(export_formats)
+        return
+
+    if mode == "tune-index":
+        run_tune_index(args[0] if args else None)
+        return
+
+    if mode == "bench-vectors":
+        run_bench_vectors(args[0] if args else None)
+        return
+
+    if mode == "export-onnx":
+        run_export_onnx()
+        return
+
+    if mode == "eval-retrieval":
+        if not args:
+            print("Need a labelled question file (question<TAB>source[,source...] per line).")
+            return
+        run_eval_retrieval(args[0], build_index=build_index, rebuild_index=rebuild_index)
+        return
+
+    if mode == "index":
+        # Flags may follow the sub-command: index import --force snap.zip
+        sub = [a for a in args if a != "--force"]
+        run_index(sub, force or len(sub) != len(args))
+        return
+
+    if mode == "watch":
+        run_watch(args[0] if args else None)
+        return
+
+    if mode == "stub-llm":
+        serve_stub_llm(int(args[0]) if args else None)
+        return
+
+    if mode == "load-test":
+        target = args[0] if args else "qa"
+        if target not in ("qa", "arch"):
+            print("load-test target must be qa or arch")
+            return
+        n_requests = int(args[1]) if len(args) > 1 else None
+        concurrency = int(args[2]) if len(args) > 2 else None
+        run_load_test(target, n_requests, concurrency)
         return
 
     print("Unknown mode:", mode)
@@ -0,0 +1,305 @@
+"""
+Pipelined index build: walk -> read -> chunk -> embed -> write, overlapped.
+
+The sequential build (ingest_repository, then embed_and_store) leaves the CPU idle
+while files are read and the disk idle while the model runs. Here every stage is
+a thread (or a few) connected by bounded queues (PIPELINE_QUEUE_SIZE items), so a
+fast stage blocks once it is that far ahead of the next one (backpressure) and
+memory stays bounded. Embedding and Chroma writes release the GIL, so the build
+time approaches the slowest stage instead of the sum of all stages.
+
+Per-stage throughput is printed at the end ([PIPELINE] lines): items, busy
+seconds, rate while busy and utilisation; the stage near 100% is the bottleneck.
+"""
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+import config
+from rag_pipeline.embedding import embed_texts, open_build_collection, finish_build
+from rag_pipeline.ingestion import (
+    DocumentChunk,
+    chunk_java_bytes,
+    ingest_readme,
+    iter_java_paths,
+    read_java_file,
+)
+from rag_pipeline.dedup import Deduper, copy_chunk, store_copies
+from rag_pipeline.summaries import build_summary_documents
+
+_DONE = object()
+
+
+class _StageStats:
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, items, secs):
+        with self.lock:
+            self.items += items
+            self.busy += secs
+
+    def report(self, wall):
+        rate = self.items / self.busy if self.busy > 0 else 0.0
+        util = self.busy / (wall * self.workers) * 100 if wall > 0 else 0.0
+        print(
+            "[PIPELINE] " + self.name + " items=" + str(self.items) + " workers=" + str(self.workers)
+            + " busy_s=" + "%.2f" % self.busy + " rate=" + "%.1f" % rate + "/s util=" + "%.0f" % util + "%"
+        )
+
+
+def _worker(in_q, fn, errors):
+    """Apply fn to every item until _DONE; after a failure anywhere, only drain."""
+    while True:
+        item = in_q.get()
+        if item is _DONE:
+            return
+        if errors:
+            continue
+        try:
+            fn(item)
+        except Exception as e:
+            errors.append(e)
+
+
+def _start(n, target, *args):
+    threads = []
+    i = 0
+    while i < n:
+        t = threading.Thread(target=target, args=args, daemon=True)
+        t.start()
+        threads.append(t)
+        i += 1
+    return threads
+
+
+def _attach_duplicates(collection, deduper):
+    """Canonical chunks were written before their groups were final: add "duplicates" now."""
+    canonical = sorted(deduper.groups)
+    i = 0
+    while i < len(canonical):
+        ids = canonical[i : i + 256]
+        got = collection.get(ids=ids, include=["documents", "metadatas", "embeddings"])
+        metadatas = []
+        for chunk_id, meta in zip(got["ids"], got["metadatas"]):
+            meta = dict(meta or {})
+            dups = deduper.duplicates_of(chunk_id)
+            meta["duplicates"] = ",".join(dups) if dups else None
+            meta["n_duplicates"] = len(dups)
+            metadatas.append(meta)
+        if got["ids"]:
+            collection.upsert(
+                ids=got["ids"], documents=got["documents"], metadatas=metadatas,
+                embeddings=np.asarray(got["embeddings"], dtype=np.float32),
+            )
+        i += 256
+    deduper.report()
+
+
+def _copy_records(repo_path, deduper, held):
+    """
+    Pointer records for the final near copies. Chunks held back as copies during the
+    build are reused; a chunk that was embedded first but lost its group to another
+    file is chunked again from disk.
+    """
+    out = []
+    for chunk_id in sorted(deduper.copies):
+        canonical, exact = deduper.copies[chunk_id]
+        if exact:
+            continue
+        chunk = held.get(chunk_id)
+        if chunk is None:
+            got = read_java_file(repo_path, chunk_id)
+            got = chunk_java_bytes(chunk_id, got[0], got[1], False, got[2], True) if got is not None else None
+            if got is None:
+                continue
+            chunk = got[0]
+        out.append(copy_chunk(chunk, canonical))
+    return out
+
+
+def build_index_pipelined(repo_path, reset=False, shard=None):
+    """
+    Same result as embed_and_store(ingest_repository(repo_path), reset, shard), built
+    by the staged pipeline. On failure a new version is dropped and the alias is
+    left unchanged.
+    """
+    t0 = time.perf_counter()
+    with_summaries = getattr(config, "INDEX_SUMMARIES", False)
+    size = max(1, config.PIPELINE_QUEUE_SIZE)
+    batch_size = max(1, config.EMBED_BATCH_SIZE)
+    n_read = max(1, config.PIPELINE_READ_WORKERS)
+    n_chunk = max(1, config.PIPELINE_CHUNK_WORKERS)
+
+    client, persist_dir, name, collection, swap = open_build_collection(reset, shard)
+
+    path_q = queue.Queue(size)
+    raw_q = queue.Queue(size)
+    chunk_q = queue.Queue(size)
+    write_q = queue.Queue(max(1, size // batch_size))
+    errors = []
+    file_infos = []
+    deduper = Deduper() if config.DEDUP_ENABLED else None
+    held = {}
+    copies = []
+    info_lock = threading.Lock()
+
+    read_stats = _StageStats("read", n_read)
+    chunk_stats = _StageStats("chunk", n_chunk)
+    embed_stats = _StageStats("embed", 1)
+    write_stats = _StageStats("write", 1)
+
+    def read(rel_path):
+        t = time.perf_counter()
+        got = read_java_file(repo_path, rel_path)
+        read_stats.add(1, time.perf_counter() - t)
+        if got is not None:
+            raw_q.put((rel_path, got[0], got[1], got[2]))
+
+    def chunk(item):
+        t = time.perf_counter()
+        # The bytes are already in memory: keep the text rather than reading the file again to embed it.
+        got = chunk_java_bytes(item[0], item[1], item[2], with_summaries, item[3], True)
+        # First-come grouping only decides what to embed now; groups are resolved in path order later.
+        duplicate = got is not None and deduper is not None and deduper.check(got[0].id, got[0].text) is not None
+        chunk_stats.add(1, time.perf_counter() - t)
+        if got is None:
+            return
+        with info_lock:
+            if got[1] is not None:
+                file_infos.append(got[1])
+            if duplicate:
+                held[got[0].id] = got[0]
+        if not duplicate:
+            chunk_q.put(got[0])
+
+    def embed_batch(docs):
+        t = time.perf_counter()
+        texts = [d.read_text() for d in docs]
+        docs = [d for d, text in zip(docs, texts) if text is not None]
+        texts = [text for text in texts if text is not None]
+        if not docs:
+            return
+        vectors = embed_texts(texts, batch_size)
+        embed_stats.add(len(docs), time.perf_counter() - t)
+        write_q.put(([d.id for d in docs], texts, [d.metadata for d in docs], vectors))
+
+    def embed_stage():
+        pending = []
+        while True:
+            doc = chunk_q.get()
+            if doc is _DONE:
+                break
+            if errors:
+                continue
+            pending.append(doc)
+            if len(pending) >= batch_size:
+                try:
+                    embed_batch(pending)
+                except Exception as e:
+                    errors.append(e)
+                pending = []
+        if pending and not errors:
+            try:
+                embed_batch(pending)
+            except Exception as e:
+                errors.append(e)
+        write_q.put(_DONE)
+
+    def write(item):
+        ids, texts, metadatas, vectors = item
+        t = time.perf_counter()
+        collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=np.asarray(vectors, dtype=np.float32))
+        write_stats.add(len(ids), time.perf_counter() - t)
+
+    readers = _start(n_read, _worker, path_q, read, errors)
+    chunkers = _start(n_chunk, _worker, raw_q, chunk, errors)
+    embedder = _start(1, embed_stage)
+    writer = _start(1, _worker, write_q, write, errors)
+
+    # Walk (this thread); put() blocks while the readers are PIPELINE_QUEUE_SIZE paths behind.
+    readme_chunks = []
+    n_paths = 0
+    try:
+        readme_chunks = ingest_readme(repo_path)
+        for doc in readme_chunks:
+            chunk_q.put(doc)
+        for rel_path in iter_java_paths(repo_path):
+            if errors:
+                break
+            path_q.put(rel_path)
+            n_paths += 1
+    except Exception as e:
+        errors.append(e)
+
+    for _ in readers:
+        path_q.put(_DONE)
+    for t in readers:
+        t.join()
+    for _ in chunkers:
+        raw_q.put(_DONE)
+    for t in chunkers:
+        t.join()
+
+    # Every chunk has been seen: fix the groups (canonical = smallest path) and embed
+    # the held-back chunks that turned out to be canonical.
+    if deduper is not None and not errors:
+        try:
+            deduper = deduper.resolve()
+            for chunk_id in sorted(held):
+                if chunk_id not in deduper.copies:
+                    chunk_q.put(held[chunk_id])
+            copies = _copy_records(repo_path, deduper, held)
+            file_infos = [f for f in file_infos if f.rel_path not in deduper.copies]
+        except Exception as e:
+            errors.append(e)
+
+    # Summaries need every file's signatures, so they go in after the chunkers finish.
+    if with_summaries and not errors:
+        try:
+            for chunk_id, text, metadata in build_summary_documents(file_infos, readme_chunks):
+                chunk_q.put(DocumentChunk(chunk_id, text, metadata))
+        except Exception as e:
+            errors.append(e)
+    chunk_q.put(_DONE)
+    for t in embedder:
+        t.join()
+    for t in writer:
+        t.join()
+
+    if deduper is not None and not errors:
+        try:
+            # Exact copies are only listed on their canonical; drop any that were embedded
+            # before their group was resolved.
+            embedded = [c for c in sorted(deduper.copies) if deduper.copies[c][1] and c not in held]
+            if embedded:
+                collection.delete(ids=embedded)
+            store_copies(collection, copies)
+            _attach_duplicates(collection, deduper)
+        except Exception as e:
+            errors.append(e)
+
+    if errors:
+        if swap:
+            try:
+                client.delete_collection(name=name)
+            except Exception:
+                pass
+        print("[PIPELINE] build failed; the current index is unchanged")
+        raise errors[0]
+
+    finish_build(client, persist_dir, name, collection, swap)
+
+    wall = time.perf_counter() - t0
+    print("[PIPELINE] files=" + str(n_paths) + " readme_chunks=" + str(len(readme_chunks)) + " wall_s=" + "%.2f" % wall)
+    for stats in (read_stats, chunk_stats, embed_stats, write_stats):
+        stats.report(wall)
+    print("[TIMING] build_ms=" + str(int(wall * 1000)))
+    return collection
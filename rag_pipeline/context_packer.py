@@ -0,0 +1,156 @@
+import re
+
+import config
+from rag_pipeline.ingestion import DocumentChunk
+from rag_pipeline.text_index import OFFSET_KEYS, has_offsets, term_lines
+from tools.tokens import count_tokens
+
+_TERM_RE = re.compile(r"[a-zA-Z_][a-zA-Z0-9_]+")
+
+# Tokens reserved per context block for its "Context k (from ...)" header and fences.
+_BLOCK_OVERHEAD_TOKENS = 16
+_SEGMENT_MAX_LINES = 40
+_SEGMENT_MIN_LINES = 4
+
+
+def _question_terms(question):
+    terms = set()
+    for t in _TERM_RE.findall(question.lower()):
+        if len(t) >= 3:
+            terms.add(t)
+    return terms
+
+
+def _split_segments(text):
+    """
+    Split a chunk into (first_line, last_line, text) segments on blank lines,
+    merging short runs and capping long ones so segments are packable units.
+    """
+    # "\n" lines, as numbered by the ingest-time text index (ix_terms)
+    lines = text.split("\n")
+    segments = []
+    start = 0
+    i = 0
+    while i <= len(lines):
+        at_break = i == len(lines) or not lines[i].strip()
+        too_long = i - start >= _SEGMENT_MAX_LINES
+        if (at_break and i - start >= _SEGMENT_MIN_LINES) or too_long or (i == len(lines) and i > start):
+            body = "\n".join(lines[start:i]).strip("\n")
+            if body.strip():
+                segments.append((start, i - 1, body))
+            start = i
+        i += 1
+    return segments
+
+
+def _normalise_segment(body):
+    return "\n".join(line.strip() for line in body.splitlines() if line.strip())
+
+
+def _segment_score(rank, body, terms, index=None, first=0, last=0):
+    # Retrieval rank sets the prior; overlap with the question's terms decides within and across chunks.
+    prior = 1.0 / (1.0 + rank)
+    if not terms:
+        return prior
+    low = None
+    hits = 0
+    for t in terms:
+        # index: the chunk's TermIndex; a term's first line settles most segments without reading them.
+        ln = index.first_line(t) if index is not None else -1
+        if ln is None or ln > last:
+            continue
+        if ln >= first:
+            hits += 1
+            continue
+        # Seen earlier in the chunk (or no index): it may recur in this segment.
+        if low is None:
+            low = body.lower()
+        if t in low:
+            hits += 1
+    return prior * (0.25 + hits / float(len(terms)))
+
+
+def pack_context(question, candidates, token_budget=None):
+    """
+    Choose the highest-value snippets from a (larger) candidate pool under a global
+    token budget:
+      - split candidates into segments and score them (rank prior x question-term overlap)
+      - drop exact duplicate segments (e.g. license headers) and segments whose lines are
+        already covered by a selected segment (overlapping spans)
+      - greedily pack by score, then reassemble one context block per source in line order
+    Returns DocumentChunks (ordered by their best segment) ready for build_prompt.
+    """
+    if token_budget is None:
+        token_budget = config.CONTEXT_TOKEN_BUDGET
+    terms = _question_terms(question)
+
+    scored = []
+    rank = 0
+    for chunk in candidates:
+        # Packed chunks have no offsets, and their lines no longer match the term map.
+        index = term_lines(chunk.metadata) if has_offsets(chunk.metadata) else None
+        for first, last, body in _split_segments(chunk.text):
+            scored.append((_segment_score(rank, body, terms, index, first, last), rank, first, last, body))
+        rank += 1
+    scored.sort(key=lambda x: (-x[0], x[1], x[2]))
+
+    seen_segments = set()
+    seen_lines = set()
+    used = 0
+    picked = {}
+    best = {}
+
+    for score, r, first, last, body in scored:
+        norm = _normalise_segment(body)
+        if norm in seen_segments:
+            continue
+        lines = [line for line in norm.splitlines() if len(line) > 3]
+        if lines:
+            covered = 0
+            for line in lines:
+                if line in seen_lines:
+                    covered += 1
+            if covered >= 0.8 * len(lines):
+                continue
+
+        cost = count_tokens(body)
+        if r not in picked:
+            cost += _BLOCK_OVERHEAD_TOKENS
+        if used + cost > token_budget:
+            continue
+
+        used += cost
+        seen_segments.add(norm)
+        for line in lines:
+            seen_lines.add(line)
+        picked.setdefault(r, []).append((first, last, body))
+        if r not in best:
+            best[r] = score
+
+    out = []
+    for r in sorted(picked.keys(), key=lambda x: -best[x]):
+        src = candidates[r]
+        parts = sorted(picked[r])
+        sep = "\n// ...\n" if src.metadata.get("type") == "code" else "\n...\n"
+
+        text = parts[0][2]
+        j = 1
+        while j < len(parts):
+            if parts[j][0] == parts[j - 1][1] + 1:
+                text += "\n" + parts[j][2]
+            else:
+                text += sep + parts[j][2]
+            j += 1
+
+        # Offsets describe the original chunk, not the packed text; the term map stays valid.
+        meta = {}
+        for k, v in src.metadata.items():
+            if k not in OFFSET_KEYS:
+                meta[k] = v
+        chunk = DocumentChunk(src.id, text, meta)
+        chunk.score = src.score
+        chunk.rerank_score = src.rerank_score
+        out.append(chunk)
+
+    print("[PACK] candidates=" + str(len(candidates)) + " blocks=" + str(len(out)) + " tokens=" + str(used) + "/" + str(token_budget))
+    return out
@@ -0,0 +1,290 @@
+"""
+Duplicate and near-duplicate detection for code chunks.
+
+Generated sources, vendored copies and near-identical classes are embedded once.
+The canonical chunk of each group is its smallest path outside generated dirs
+(canonical_key). Exact copies are not stored: the canonical lists them in its
+"duplicates" metadata (comma-separated paths, count in "n_duplicates"). Near copies
+are stored as pointer records ("duplicate_of" = canonical id) that reuse the
+canonical's vector, so their own text is available by id; at query time a group
+yields one hit.
+
+- exact: sha1 of the whitespace-normalised text ("content_hash" metadata on every
+  code chunk, also used to collapse duplicate hits at query time)
+- near: MinHash over token 5-shingles with LSH banding; candidates whose
+  estimated Jaccard similarity is >= DEDUP_THRESHOLD are duplicates
+"""
+
+import hashlib
+import re
+import threading
+import zlib
+
+import numpy as np
+
+import config
+from tools.tokens import TOKEN_RE
+
+SHINGLE = 5
+_PRIME = 4294967311  # > 2^32, so (a * x + b) % p permutes 32-bit hashes
+_WS_RE = re.compile(r"\s+")
+
+
+def content_hash(text):
+    return hashlib.sha1(_WS_RE.sub(" ", text).strip().encode("utf-8")).hexdigest()
+
+
+def _shingle_hashes(text):
+    tokens = TOKEN_RE.findall(text)
+    if len(tokens) < SHINGLE:
+        return None
+    out = set()
+    i = 0
+    while i + SHINGLE <= len(tokens):
+        out.add(zlib.crc32(" ".join(tokens[i : i + SHINGLE]).encode("utf-8")))
+        i += 1
+    return np.fromiter(out, dtype=np.uint64, count=len(out))
+
+
+class Deduper:
+    """
+    Thread-safe: check() may be called from several chunker workers. Which chunk of a
+    group check() makes canonical depends on call order; resolve() replays every
+    checked chunk in canonical_key order, which makes the choice deterministic.
+    """
+
+    def __init__(self, threshold=None, num_perm=None, bands=None):
+        self.threshold = config.DEDUP_THRESHOLD if threshold is None else threshold
+        num_perm = config.DEDUP_NUM_PERM if num_perm is None else num_perm
+        self.bands = config.DEDUP_BANDS if bands is None else bands
+        self.rows = max(1, num_perm // self.bands)
+        num_perm = self.rows * self.bands
+
+        rng = np.random.RandomState(1)
+        # a < 2^31 and x < 2^32 keep a * x + b inside uint64
+        self.a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+
+        self.lock = threading.Lock()
+        self.items = {}
+        self.by_hash = {}
+        self.buckets = {}
+        self.signatures = {}
+        self.groups = {}
+        self.copies = {}
+        self.exact = 0
+        self.near = 0
+
+    def _signature(self, text):
+        x = _shingle_hashes(text)
+        if x is None or len(x) == 0:
+            return None
+        sig = ((self.a[:, None] * x[None, :] + self.b[:, None]) % np.uint64(_PRIME)).min(axis=1)
+        return sig
+
+    def check(self, chunk_id, text):
+        """Canonical id when chunk_id duplicates an earlier chunk, else None (and it becomes a canonical)."""
+        h = content_hash(text)
+        sig = self._signature(text)
+        with self.lock:
+            self.items[chunk_id] = (h, sig)
+            return self._assign(chunk_id, h, sig)
+
+    def _assign(self, chunk_id, h, sig):
+        canonical = self.by_hash.get(h)
+        if canonical is not None:
+            self._add_copy(canonical, chunk_id, h)
+            return canonical
+        self.by_hash[h] = chunk_id
+        if sig is None:
+            return None
+
+        keys = []
+        band = 0
+        while band < self.bands:
+            keys.append((band, sig[band * self.rows : (band + 1) * self.rows].tobytes()))
+            band += 1
+
+        best = None
+        best_sim = 0.0
+        tried = set()
+        for key in keys:
+            for other in self.buckets.get(key, []):
+                if other in tried:
+                    continue
+                tried.add(other)
+                sim = float(np.mean(self.signatures[other] == sig))
+                if sim > best_sim:
+                    best, best_sim = other, sim
+        if best is not None and best_sim >= self.threshold:
+            self._add_copy(best, chunk_id, h)
+            # keep the hash pointing at the canonical so later exact copies resolve to it too
+            self.by_hash[h] = best
+            return best
+
+        self.signatures[chunk_id] = sig
+        for key in keys:
+            self.buckets.setdefault(key, []).append(chunk_id)
+        return None
+
+    def _add_copy(self, canonical, chunk_id, h):
+        exact = self.items[canonical][0] == h
+        if exact:
+            self.exact += 1
+        else:
+            self.near += 1
+        self.groups.setdefault(canonical, []).append(chunk_id)
+        self.copies[chunk_id] = (canonical, exact)
+
+    def resolve(self):
+        """A new Deduper holding the same chunks grouped in canonical_key order (independent of check() order)."""
+        out = Deduper(self.threshold, len(self.a), self.bands)
+        for chunk_id in sorted(self.items, key=canonical_key):
+            h, sig = self.items[chunk_id]
+            out.items[chunk_id] = (h, sig)
+            out._assign(chunk_id, h, sig)
+        return out
+
+    def duplicates_of(self, canonical):
+        """Exact copies of canonical (near copies are pointer records of their own)."""
+        return sorted(c for c in self.groups.get(canonical, []) if self.copies[c][1])
+
+    def report(self):
+        print("[DEDUP] exact=" + str(self.exact) + " near=" + str(self.near) + " canonical_with_copies=" + str(len(self.groups)))
+
+
+def canonical_key(rel_path):
+    """Sort key for picking a group's canonical: paths outside DEDUP_GENERATED_DIRS first, then the smallest path."""
+    parts = rel_path.split("/")[:-1]
+    generated = any(p in config.DEDUP_GENERATED_DIRS for p in parts)
+    return (1 if generated else 0, rel_path)
+
+
+def copy_chunk(chunk, canonical):
+    """
+    Turn a near copy into a pointer record: "duplicate_of" names the canonical, whose
+    vector it is stored with (see store_copies). Query hits are collapsed per group.
+    """
+    meta = dict(chunk.metadata)
+    meta["duplicates"] = None
+    meta["n_duplicates"] = 0
+    meta["duplicate_of"] = canonical
+    chunk.metadata = meta
+    return chunk
+
+
+def mark_duplicates(chunks, deduper):
+    """
+    Apply deduper's groups to chunks: near copies become pointer records and each
+    canonical lists its exact copies in "duplicates" (count in "n_duplicates").
+    Returns the ids of the exact copies, which are not stored at all.
+    """
+    exact = set()
+    for chunk in chunks:
+        got = deduper.copies.get(chunk.id)
+        if got is not None:
+            if got[1]:
+                exact.add(chunk.id)
+            else:
+                copy_chunk(chunk, got[0])
+            continue
+        if chunk.metadata.get("type") != "code":
+            continue
+        meta = dict(chunk.metadata)
+        meta["duplicate_of"] = None
+        dups = deduper.duplicates_of(chunk.id)
+        meta["duplicates"] = ",".join(dups) if dups else None
+        meta["n_duplicates"] = len(dups)
+        chunk.metadata = meta
+    return exact
+
+
+def dedupe_documents(documents):
+    """
+    Group duplicate code chunks (canonical by canonical_key) and mark them with
+    mark_duplicates. Returns (documents without the exact copies, ids of all copies);
+    near copies stay in the list as pointer records, which embed_and_store writes
+    without embedding them. Chunks whose file changed since chunking are dropped.
+    """
+    deduper = Deduper()
+    code = []
+    stale = set()
+    for doc in sorted((d for d in documents if d.metadata.get("type") == "code"), key=lambda d: canonical_key(d.id)):
+        text = doc.read_text()
+        if text is None:
+            stale.add(doc.id)
+            continue
+        deduper.check(doc.id, text)
+        code.append(doc)
+    exact = mark_duplicates(code, deduper)
+    deduper.report()
+    return [d for d in documents if d.id not in exact and d.id not in stale], set(deduper.copies)
+
+
+def store_copies(collection, copies):
+    """Upsert pointer records (copy_chunk) with their canonical's stored vector; canonicals must be written first."""
+    i = 0
+    while i < len(copies):
+        batch = copies[i : i + 256]
+        canonical = sorted(set(d.metadata["duplicate_of"] for d in batch))
+        got = collection.get(ids=canonical, include=["embeddings"])
+        vectors = dict(zip(got["ids"], got["embeddings"]))
+        docs, texts = [], []
+        for d in batch:
+            text = d.read_text() if d.metadata["duplicate_of"] in vectors else None
+            if text is not None:
+                docs.append(d)
+                texts.append(text)
+        if docs:
+            collection.upsert(
+                ids=[d.id for d in docs], documents=texts, metadatas=[d.metadata for d in docs],
+                embeddings=np.asarray([vectors[d.metadata["duplicate_of"]] for d in docs], dtype=np.float32),
+            )
+        i += 256
+
+
+def _split(value):
+    return [d for d in (value or "").split(",") if d]
+
+
+def collapse_duplicate_hits(chunks):
+    """
+    One hit per duplicate group: hits with the same content_hash (copies in other
+    shards) or the same group (a canonical and its near copies, "duplicate_of") are
+    merged into the best-ranked one, replaced by the canonical when it is among the
+    hits. The sources of the merged hits are added to its "duplicates" metadata.
+    """
+    out = []
+    by_key = {}
+    for c in chunks:
+        keys = []
+        if c.metadata.get("content_hash"):
+            keys.append("hash:" + c.metadata["content_hash"])
+        if c.metadata.get("type") == "code":
+            keys.append("group:" + (c.metadata.get("duplicate_of") or c.metadata.get("source", c.id)))
+        i = None
+        for k in keys:
+            if k in by_key:
+                i = by_key[k]
+                break
+        if i is None:
+            for k in keys:
+                by_key[k] = len(out)
+            out.append(c)
+            continue
+        for k in keys:
+            by_key.setdefault(k, i)
+
+        keep, other = out[i], c
+        if keep.metadata.get("duplicate_of") and not c.metadata.get("duplicate_of"):
+            # the canonical takes its copy's rank
+            keep, other = c, out[i]
+            keep.score = out[i].score
+            out[i] = keep
+        dups = _split(keep.metadata.get("duplicates"))
+        for d in [other.metadata.get("source", other.id)] + _split(other.metadata.get("duplicates")):
+            if d not in dups and d != keep.metadata.get("source"):
+                dups.append(d)
+        keep.metadata = dict(keep.metadata)
+        keep.metadata["duplicates"] = ",".join(dups)
+    return out
@@ -1,67 +1,246 @@
+import json
 import os
-import chromadb
-from chromadb.utils import embedding_functions
+import numpy as np
 import config
+from rag_pipeline.index_versions import resolve_alias, write_alias, new_version_name, collect_garbage_async
+from rag_pipeline.qa_cache import invalidate_answer_cache
+from rag_pipeline.dedup import store_copies
+
+_EMBEDDING_FN = None
+
 
 def _make_embedding_fn():
+    backend = getattr(config, "EMBEDDING_BACKEND", "sentence-transformers")
+    if backend == "onnx":
+        from rag_pipeline.onnx_embedding import OnnxEmbeddingFunction
+
+        return OnnxEmbeddingFunction(
+            config.ONNX_MODEL_DIR,
+            model_file=config.ONNX_MODEL_FILE,
+            num_threads=config.ONNX_NUM_THREADS,
+        )
+    if backend != "sentence-transformers":
+        raise ValueError("Unknown EMBEDDING_BACKEND: " + str(backend))
+
+    from chromadb.utils import embedding_functions
+
     return embedding_functions.SentenceTransformerEmbeddingFunction(
         model_name=config.EMBEDDING_MODEL_NAME
     )
 
 
-def _open_persistent_collection():
-    os.makedirs(config.CHROMA_PERSIST_DIR, exist_ok=True)
+def get_embedding_fn():
+    """Process-wide embedding function, so the model is loaded once."""
+    global _EMBEDDING_FN
+    if _EMBEDDING_FN is None:
+        _EMBEDDING_FN = _make_embedding_fn()
+    return _EMBEDDING_FN
+
+
+def embed_texts(texts, batch_size=64):
+    """Embed texts in batches; returns a float32 array of shape (len(texts), dim)."""
+    out = []
+    fn = get_embedding_fn()
+    i = 0
+    while i < len(texts):
+        for vec in fn(list(texts[i : i + batch_size])):
+            out.append(np.asarray(vec, dtype=np.float32))
+        i += batch_size
+    if not out:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack(out)
+
+
+def _store_backend():
+    return getattr(config, "VECTOR_STORE_BACKEND", "chroma")
+
+
+def _store_persist_dir(shard=None):
+    """Persist dir of the single-repo index, or of one shard (config.REPOS) under SHARDS_DIR."""
+    if shard is not None:
+        return os.path.join(config.SHARDS_DIR, shard)
+    if _store_backend() == "flat":
+        return config.FLAT_PERSIST_DIR
+    return config.CHROMA_PERSIST_DIR
+
+
+def _open_client(shard=None):
+    """
+    Vector store client for the configured backend.
+    Both backends expose the same client/collection methods (get_or_create_collection,
+    create_collection, delete_collection; count/upsert/query/get on collections).
+    """
+    backend = _store_backend()
+    persist_dir = _store_persist_dir(shard)
+    os.makedirs(persist_dir, exist_ok=True)
+
+    if backend == "chroma":
+        import chromadb
+
+        return chromadb.PersistentClient(path=persist_dir)
+
+    if backend == "flat":
+        from rag_pipeline.flat_store import FlatClient
+
+        return FlatClient(
+            persist_dir,
+            dtype=config.FLAT_INDEX_DTYPE,
+            truncate_dim=config.FLAT_INDEX_TRUNCATE_DIM,
+            keep_full=config.FLAT_KEEP_FULL_VECTORS,
+            rescore_candidates=config.FLAT_RESCORE_CANDIDATES,
+        )
+
+    raise ValueError("Unknown VECTOR_STORE_BACKEND: " + str(backend))
+
+
+def _read_hnsw_profile():
+    path = getattr(config, "HNSW_PROFILE_PATH", "")
+    if not path or not os.path.isfile(path):
+        return {}
+    try:
+        f = open(path, "r", encoding="utf-8")
+        data = json.load(f)
+        f.close()
+    except Exception:
+        return {}
+    return data.get("settings", {})
 
-    client = chromadb.PersistentClient(path=config.CHROMA_PERSIST_DIR)
+
+def hnsw_settings():
+    """HNSW construction/search parameters: config defaults, overridden by a tuned profile."""
+    settings = {
+        "hnsw:M": config.HNSW_M,
+        "hnsw:construction_ef": config.HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": config.HNSW_SEARCH_EF,
+    }
+    profile = _read_hnsw_profile()
+    for key in settings:
+        if key in profile:
+            settings[key] = int(profile[key])
+    return settings
+
+
+def _collection_metadata():
+    metadata = {"hnsw:space": config.CHROMA_SPACE}
+    metadata.update(hnsw_settings())
+    return metadata
+
+
+def current_index_version(shard=None):
+    """
+    Name of the collection currently serving queries: the alias target written by
+    the last completed build, or the plain collection name for indexes built
+    before versioning existed. In multi-repo mode (config.REPOS) without a shard,
+    the "name=version" pairs of all shards.
+    """
+    if shard is None and getattr(config, "REPOS", None):
+        return ",".join(name + "=" + current_index_version(name) for name in sorted(config.REPOS))
+
+    version = resolve_alias(_store_persist_dir(shard), config.CHROMA_COLLECTION_NAME)
+    if version:
+        return version
+    return config.CHROMA_COLLECTION_NAME
+
+
+def _open_persistent_collection(shard=None):
+    client = _open_client(shard)
     collection = client.get_or_create_collection(
-        name=config.CHROMA_COLLECTION_NAME,
-        embedding_function=_make_embedding_fn(),
-        metadata={"hnsw:space": config.CHROMA_SPACE},
+        name=current_index_version(shard),
+        embedding_function=get_embedding_fn(),
+        metadata=_collection_metadata(),
     )
     return client, collection
 
 
-def load_collection():
+def load_collection(shard=None):
     """
-    Open the persisted collection without rebuilding.
+    Open the persisted collection (of one shard, if given) without rebuilding.
     """
-    _, collection = _open_persistent_collection()
+    _, collection = _open_persistent_collection(shard)
     return collection
 
 
-def embed_and_store(documents, reset=False):
+def open_build_collection(reset=False, shard=None):
     """
-    Build (or rebuild) the persisted index.
-    - reset=True deletes the collection then recreates it.
-    - uses upsert to avoid 'id already exists' errors.
+    Collection a build writes into, as (client, persist_dir, name, collection, swap):
+    a new version when reset or no versioned index exists yet (swap=True), else the
+    current version. finish_build() publishes it.
     """
-    client, collection = _open_persistent_collection()
-
-    if reset:
-        try:
-            client.delete_collection(name=config.CHROMA_COLLECTION_NAME)
-        except Exception:
-            pass
+    client = _open_client(shard)
+    persist_dir = _store_persist_dir(shard)
+    base_name = config.CHROMA_COLLECTION_NAME
+    current = resolve_alias(persist_dir, base_name)
 
+    swap = reset or current is None
+    if swap:
+        name = new_version_name(base_name)
         collection = client.create_collection(
-            name=config.CHROMA_COLLECTION_NAME,
-            embedding_function=_make_embedding_fn(),
-            metadata={"hnsw:space": config.CHROMA_SPACE},
+            name=name,
+            embedding_function=get_embedding_fn(),
+            metadata=_collection_metadata(),
         )
+    else:
+        name = current
+        collection = client.get_or_create_collection(
+            name=name,
+            embedding_function=get_embedding_fn(),
+            metadata=_collection_metadata(),
+        )
+    return client, persist_dir, name, collection, swap
 
-    texts, ids, metadatas = [], [], []
-    for doc in documents:
-        texts.append(doc.text)
-        ids.append(doc.id)
-        metadatas.append(doc.metadata)
 
-    # Prefer upsert (safe for rebuilds); fallback to add
-    if hasattr(collection, "upsert"):
-        collection.upsert(documents=texts, metadatas=metadatas, ids=ids)
-    else:
-        collection.add(documents=texts, metadatas=metadatas, ids=ids)
+def finish_build(client, persist_dir, name, collection, swap):
+    """Switch the alias to a freshly built version (old ones are deleted in the background)."""
+    base_name = config.CHROMA_COLLECTION_NAME
+    if swap:
+        write_alias(persist_dir, base_name, name)
+        collect_garbage_async(client, base_name, name, config.INDEX_KEEP_VERSIONS)
+    invalidate_answer_cache()
+
+    print("Vector store backend:", _store_backend())
+    print("Persist dir:", persist_dir)
+    print("Collection:", base_name, "->", name)
+    print("Count:", collection.count())
+
+
+def embed_and_store(documents, reset=False, shard=None):
+    """
+    Build (or rebuild) the persisted index.
+    - reset=True (or no versioned index yet) builds into a new versioned collection
+      and switches the alias to it only once the build has finished; readers keep
+      querying the previous version meanwhile. Old versions are deleted in the background.
+    - reset=False with an existing index upserts into the current version.
+    - uses upsert to avoid 'id already exists' errors; chunks are embedded and
+      written in batches of config.EMBED_BATCH_SIZE.
+    - shard names a config.REPOS entry; its index lives in its own persist dir.
+    - duplicate pointer records ("duplicate_of" metadata) are not embedded; they are
+      written last, with their canonical's vector.
+    """
+    client, persist_dir, name, collection, swap = open_build_collection(reset, shard)
+    copies = [d for d in documents if d.metadata.get("duplicate_of")]
+    if copies:
+        documents = [d for d in documents if not d.metadata.get("duplicate_of")]
+
+    # Chunk texts are read lazily, so only one batch of texts is held in memory at a time.
+    batch_size = max(1, getattr(config, "EMBED_BATCH_SIZE", 64))
+    i = 0
+    while i < len(documents):
+        texts, ids, metadatas = [], [], []
+        for doc in documents[i:i + batch_size]:
+            text = doc.read_text()
+            if text is None:
+                continue
+            texts.append(text)
+            ids.append(doc.id)
+            metadatas.append(doc.metadata)
+
+        # Prefer upsert (safe for rebuilds); fallback to add
+        if ids and hasattr(collection, "upsert"):
+            collection.upsert(documents=texts, metadatas=metadatas, ids=ids)
+        elif ids:
+            collection.add(documents=texts, metadatas=metadatas, ids=ids)
+        i += batch_size
+    store_copies(collection, copies)
 
-    print("Chroma persist dir:", config.CHROMA_PERSIST_DIR)
-    print("Chroma collection:", config.CHROMA_COLLECTION_NAME)
-    print("Chroma count:", collection.count())
+    finish_build(client, persist_dir, name, collection, swap)
     return collection
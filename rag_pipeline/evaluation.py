@@ -0,0 +1,97 @@
+import time
+
+import config
+from rag_pipeline.embedding import current_index_version
+from rag_pipeline.retrieval import retrieve_top_k
+from rag_pipeline.rerank import rerank
+from rag_pipeline.tuning import _percentile
+from tools.tokens import count_tokens
+
+
+def load_labelled_questions(path):
+    """
+    Lines of "question<TAB>source[,source...]": the sources (paths as stored in chunk
+    metadata, e.g. src/main/java/.../ZipFile.java) that answer the question.
+    Lines without a tab or starting with # are skipped.
+    """
+    items = []
+    f = open(path, "r", encoding="utf-8")
+    for line in f:
+        line = line.strip()
+        if not line or line.startswith("#") or "\t" not in line:
+            continue
+        question, _, sources = line.partition("\t")
+        expected = set(s.strip() for s in sources.split(",") if s.strip())
+        if question.strip() and expected:
+            items.append((question.strip(), expected))
+    f.close()
+    return items
+
+
+def _first_hit_rank(chunks, expected):
+    i = 0
+    while i < len(chunks):
+        if chunks[i].metadata.get("source", chunks[i].id) in expected:
+            return i + 1
+        i += 1
+    return 0
+
+
+def _summary(name, ranks, tokens, k_values):
+    n = float(max(1, len(ranks)))
+    line = name
+    for k in k_values:
+        hits = sum(1 for r in ranks if 0 < r <= k)
+        line += "\thit@" + str(k) + "=" + "%.3f" % (hits / n)
+    mrr = sum(1.0 / r for r in ranks if r > 0) / n
+    line += "\tmrr=" + "%.3f" % mrr
+    line += "\tctx_tokens@" + str(config.TOP_K) + "=" + "%.0f" % (sum(tokens) / n)
+    print(line)
+
+
+def evaluate_retrieval(collection, question_file):
+    """
+    Compare dense retrieval with cross-encoder reranking on labelled questions:
+    hit@k and MRR against the expected sources, mean context tokens of the top
+    TOP_K chunks, and p50/p95 latency of retrieval and reranking.
+    """
+    items = load_labelled_questions(question_file)
+    if not items:
+        print("No labelled questions in", question_file, "(expected: question<TAB>source[,source...])")
+        return None
+
+    pool_k = max(config.TOP_K, config.RERANK_CANDIDATES)
+    version = current_index_version()
+    k_values = sorted(set([1, config.TOP_K, 5]))
+
+    dense_ranks, dense_tokens, rerank_ranks, rerank_tokens = [], [], [], []
+    retrieve_ms, rerank_ms = [], []
+
+    for question, expected in items:
+        t0 = time.perf_counter()
+        pool = retrieve_top_k(collection, question, pool_k)
+        t1 = time.perf_counter()
+        dense = list(pool)
+        reranked = rerank(question, pool, pool_k, version)
+        t2 = time.perf_counter()
+
+        retrieve_ms.append((t1 - t0) * 1000)
+        rerank_ms.append((t2 - t1) * 1000)
+        dense_ranks.append(_first_hit_rank(dense, expected))
+        rerank_ranks.append(_first_hit_rank(reranked, expected))
+        dense_tokens.append(sum(count_tokens(c.text) for c in dense[: config.TOP_K]))
+        rerank_tokens.append(sum(count_tokens(c.text) for c in reranked[: config.TOP_K]))
+
+    print("[EVAL] questions=" + str(len(items)) + " candidates=" + str(pool_k) + " reranker=" + config.RERANK_MODEL_NAME)
+    _summary("dense", dense_ranks, dense_tokens, k_values)
+    _summary("rerank", rerank_ranks, rerank_tokens, k_values)
+    print(
+        "[TIMING] retrieve_ms p50=" + "%.1f" % _percentile(retrieve_ms, 50) + " p95=" + "%.1f" % _percentile(retrieve_ms, 95)
+        + " rerank_ms p50=" + "%.1f" % _percentile(rerank_ms, 50) + " p95=" + "%.1f" % _percentile(rerank_ms, 95)
+    )
+    return {
+        "dense_ranks": dense_ranks,
+        "rerank_ranks": rerank_ranks,
+        "retrieve_ms": retrieve_ms,
+        "rerank_ms": rerank_ms,
+    }
@@ -0,0 +1,601 @@
+"""
+Brute-force vector store kept in plain files, one directory per collection:
+
+  collection.json  name, space, dtype, dim, truncate_dim
+  vectors.bin      row-major normalised vectors (memory-mapped), stored as
+                   float32, float16 or int8 (scalar-quantised), optionally
+                   truncated to the first truncate_dim dimensions
+  row_scales.bin   float32 quantisation scale of each row (int8 only)
+  vectors_full.bin full-precision float32 copy, kept only when vectors.bin is
+                   compressed; read just for the rows being rescored
+  doc_spans.bin    int64 (start, end) byte span of each row's document
+  documents.bin    UTF-8 documents, appended
+  meta.jsonl       one line per write: {"row", "id", "metadata"} or {"row", "deleted"}
+
+Writes are append-only (an upsert of an existing id rewrites its vector row in
+place and appends a new document + meta line), so batched builds stay linear.
+Compressed collections scan the small matrix, take the best rescore_candidates
+rows and rescore only those against the full-precision copy.
+The client/collection methods mirror the subset of the Chroma API used in
+rag_pipeline, so callers do not need to know which backend is active.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+_COLLECTION_FILE = "collection.json"
+_VECTORS_FILE = "vectors.bin"
+_FULL_VECTORS_FILE = "vectors_full.bin"
+_SPANS_FILE = "doc_spans.bin"
+_SCALES_FILE = "row_scales.bin"
+_DOCS_FILE = "documents.bin"
+_META_FILE = "meta.jsonl"
+
+_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+# float16/int8 have no BLAS path in numpy; score them in float32 blocks of this many rows.
+_SCORE_BLOCK_ROWS = 65536
+
+
+def _read_json(path):
+    f = open(path, "r", encoding="utf-8")
+    data = json.load(f)
+    f.close()
+    return data
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    f = open(tmp, "w", encoding="utf-8")
+    json.dump(data, f)
+    f.close()
+    os.replace(tmp, path)
+
+
+def _matches(meta, where):
+    """
+    Evaluate a Chroma-style metadata filter:
+      {"k": v}, {"k": {"$eq"|"$ne"|"$in"|"$nin"|"$gt"|"$gte"|"$lt"|"$lte": v}},
+      {"$and": [...]}, {"$or": [...]}
+    """
+    if not where:
+        return True
+
+    for key, cond in where.items():
+        if key == "$and":
+            for sub in cond:
+                if not _matches(meta, sub):
+                    return False
+            continue
+        if key == "$or":
+            ok = False
+            for sub in cond:
+                if _matches(meta, sub):
+                    ok = True
+                    break
+            if not ok:
+                return False
+            continue
+
+        value = meta.get(key)
+        if not isinstance(cond, dict):
+            if value != cond:
+                return False
+            continue
+
+        for op, arg in cond.items():
+            if op == "$eq" and not value == arg:
+                return False
+            if op == "$ne" and not value != arg:
+                return False
+            if op == "$in" and value not in arg:
+                return False
+            if op == "$nin" and value in arg:
+                return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if op == "$gt" and not value > arg:
+                    return False
+                if op == "$gte" and not value >= arg:
+                    return False
+                if op == "$lt" and not value < arg:
+                    return False
+                if op == "$lte" and not value <= arg:
+                    return False
+    return True
+
+
+def _normalise(vectors):
+    arr = np.asarray(vectors, dtype=np.float32)
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return arr / norms
+
+
+class FlatCollection:
+    def __init__(self, path, name, embedding_function=None, rescore_candidates=50):
+        self.path = path
+        self.name = name
+        self.rescore_candidates = rescore_candidates
+        self._embedding_function = embedding_function
+
+        info = _read_json(os.path.join(path, _COLLECTION_FILE))
+        self.metadata = info.get("metadata") or {}
+        self._space = self.metadata.get("hnsw:space", "cosine")
+        self._dtype = _DTYPES[info.get("dtype", "float32")]
+        self._dim = info.get("dim")
+        self._truncate_dim = info.get("truncate_dim") or 0
+        self._keep_full = bool(info.get("keep_full", True))
+        self._quant_scale = info.get("quant_scale")  # collections written before row_scales.bin
+
+        self._meta_stamp = None
+        self._ids = []
+        self._metadatas = []
+        self._alive = []
+        self._row_by_id = {}
+        self._vectors = None
+        self._full = None
+        self._spans = None
+        self._scales = None
+        self._mask_cache = {}
+
+    # ---------- loading ----------
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _stored_dim(self):
+        if self._truncate_dim and self._truncate_dim < self._dim:
+            return self._truncate_dim
+        return self._dim
+
+    def _has_full(self):
+        """Full-precision copy exists only when the scanned matrix is lossy."""
+        if not self._keep_full:
+            return False
+        return self._dtype != np.float32 or self._stored_dim() != self._dim
+
+    def _query_part(self, vectors):
+        """Leading stored dimensions, re-normalised when truncated."""
+        d = self._stored_dim()
+        if d == self._dim:
+            return vectors
+        return _normalise(vectors[:, :d])
+
+    def _encode(self, vectors):
+        """(stored rows, per-row int8 scales or None)."""
+        x = self._query_part(vectors)
+        if self._dtype == np.int8:
+            # Each row's largest component maps to 127, so no row is clipped whatever its values.
+            peak = np.max(np.abs(x), axis=1)
+            peak[peak <= 0] = 1.0
+            scales = (127.0 / peak).astype(np.float32)
+            return np.clip(np.rint(x * scales[:, None]), -127, 127).astype(np.int8), scales
+        return x.astype(self._dtype), None
+
+    def _decode(self, rows):
+        if self._full is not None:
+            return [np.asarray(self._full[r], dtype=np.float32) for r in rows]
+        out = []
+        for r in rows:
+            vec = np.asarray(self._vectors[r], dtype=np.float32)
+            if self._dtype == np.int8:
+                vec = vec / float(self._scales[r])
+            out.append(vec)
+        return out
+
+    def _init_dims(self, vectors):
+        """First write fixes the dimension."""
+        self._dim = int(vectors.shape[1])
+        info = _read_json(self._file(_COLLECTION_FILE))
+        info["dim"] = self._dim
+        _write_json(self._file(_COLLECTION_FILE), info)
+
+    def _write_legacy_scales(self, n_rows):
+        # int8 rows written with one collection-wide scale: give each its own entry.
+        if self._dtype == np.int8 and n_rows and not os.path.exists(self._file(_SCALES_FILE)):
+            f = open(self._file(_SCALES_FILE), "wb")
+            f.write(np.full(n_rows, self._quant_scale or 127.0, dtype=np.float32).tobytes())
+            f.close()
+
+    def _refresh(self):
+        """Reload the sidecar and re-map the files if another writer appended since last use."""
+        meta_path = self._file(_META_FILE)
+        try:
+            st = os.stat(meta_path)
+            stamp = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            stamp = None
+
+        if stamp == self._meta_stamp:
+            return
+        self._meta_stamp = stamp
+
+        self._ids = []
+        self._metadatas = []
+        self._alive = []
+        self._row_by_id = {}
+        self._mask_cache = {}
+
+        if stamp is not None:
+            f = open(meta_path, "r", encoding="utf-8")
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                rec = json.loads(line)
+                row = rec["row"]
+                while len(self._ids) <= row:
+                    self._ids.append(None)
+                    self._metadatas.append({})
+                    self._alive.append(False)
+                if rec.get("deleted"):
+                    old_id = self._ids[row]
+                    if old_id is not None and self._row_by_id.get(old_id) == row:
+                        del self._row_by_id[old_id]
+                    self._alive[row] = False
+                    continue
+                self._ids[row] = rec["id"]
+                self._metadatas[row] = rec.get("metadata") or {}
+                self._alive[row] = True
+                self._row_by_id[rec["id"]] = row
+            f.close()
+
+        info = _read_json(self._file(_COLLECTION_FILE))
+        self._dim = info.get("dim")
+        self._quant_scale = info.get("quant_scale")
+        self._vectors = None
+        self._full = None
+        self._spans = None
+        self._scales = None
+
+        n = len(self._ids)
+        if n and self._dim:
+            self._vectors = np.memmap(self._file(_VECTORS_FILE), dtype=self._dtype, mode="r", shape=(n, self._stored_dim()))
+            self._spans = np.memmap(self._file(_SPANS_FILE), dtype=np.int64, mode="r", shape=(n, 2))
+            if self._dtype == np.int8:
+                if os.path.exists(self._file(_SCALES_FILE)):
+                    self._scales = np.memmap(self._file(_SCALES_FILE), dtype=np.float32, mode="r", shape=(n,))
+                else:
+                    self._scales = np.full(n, self._quant_scale or 127.0, dtype=np.float32)
+            if self._has_full():
+                self._full = np.memmap(self._file(_FULL_VECTORS_FILE), dtype=np.float32, mode="r", shape=(n, self._dim))
+
+    def _read_documents(self, rows):
+        out = []
+        if not rows:
+            return out
+        f = open(self._file(_DOCS_FILE), "rb")
+        for row in rows:
+            start = int(self._spans[row][0])
+            end = int(self._spans[row][1])
+            f.seek(start)
+            out.append(f.read(end - start).decode("utf-8", errors="ignore"))
+        f.close()
+        return out
+
+    def _where_mask(self, where):
+        key = json.dumps(where, sort_keys=True) if where else ""
+        mask = self._mask_cache.get(key)
+        if mask is not None:
+            return mask
+
+        mask = np.zeros(len(self._ids), dtype=bool)
+        i = 0
+        while i < len(self._ids):
+            if self._alive[i] and _matches(self._metadatas[i], where):
+                mask[i] = True
+            i += 1
+        self._mask_cache[key] = mask
+        return mask
+
+    # ---------- Chroma-compatible API ----------
+
+    def count(self):
+        self._refresh()
+        return len(self._row_by_id)
+
+    def add(self, ids, documents=None, metadatas=None, embeddings=None):
+        self.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None):
+        if not ids:
+            return
+        self._refresh()
+
+        if embeddings is None:
+            if self._embedding_function is None:
+                raise RuntimeError("FlatCollection needs embeddings or an embedding_function.")
+            embeddings = self._embedding_function(list(documents))
+
+        vectors = _normalise(embeddings)
+        if self._dim is None:
+            self._init_dims(vectors)
+        elif vectors.shape[1] != self._dim:
+            raise ValueError("Embedding dimension " + str(vectors.shape[1]) + " does not match collection dimension " + str(self._dim))
+        stored, scales = self._encode(vectors)
+        keep_full = self._has_full()
+
+        if documents is None:
+            documents = ["" for _ in ids]
+        if metadatas is None:
+            metadatas = [{} for _ in ids]
+
+        n_rows = len(self._ids)
+        docs_f = open(self._file(_DOCS_FILE), "ab")
+        doc_pos = docs_f.tell()
+
+        new_rows = []
+        new_idx = []
+        new_spans = []
+        updates = []
+        meta_lines = []
+
+        i = 0
+        while i < len(ids):
+            data = documents[i].encode("utf-8")
+            docs_f.write(data)
+            span = (doc_pos, doc_pos + len(data))
+            doc_pos += len(data)
+
+            row = self._row_by_id.get(ids[i])
+            if row is not None and row >= n_rows:
+                # Same id twice in one batch: the last occurrence wins.
+                new_idx[row - n_rows] = i
+                new_spans[row - n_rows] = span
+            elif row is None:
+                row = n_rows + len(new_rows)
+                new_rows.append(row)
+                new_idx.append(i)
+                new_spans.append(span)
+                self._row_by_id[ids[i]] = row
+            else:
+                updates.append((row, i, span))
+
+            meta_lines.append(json.dumps({"row": row, "id": ids[i], "metadata": metadatas[i]}))
+            i += 1
+        docs_f.close()
+
+        if scales is not None:
+            self._write_legacy_scales(n_rows)
+
+        if updates:
+            vec_mm = np.memmap(self._file(_VECTORS_FILE), dtype=self._dtype, mode="r+", shape=(n_rows, self._stored_dim()))
+            span_mm = np.memmap(self._file(_SPANS_FILE), dtype=np.int64, mode="r+", shape=(n_rows, 2))
+            scale_mm = None
+            if scales is not None:
+                scale_mm = np.memmap(self._file(_SCALES_FILE), dtype=np.float32, mode="r+", shape=(n_rows,))
+            full_mm = None
+            if keep_full:
+                full_mm = np.memmap(self._file(_FULL_VECTORS_FILE), dtype=np.float32, mode="r+", shape=(n_rows, self._dim))
+            for row, i, span in updates:
+                vec_mm[row] = stored[i]
+                span_mm[row] = span
+                if scale_mm is not None:
+                    scale_mm[row] = scales[i]
+                if full_mm is not None:
+                    full_mm[row] = vectors[i]
+            vec_mm.flush()
+            span_mm.flush()
+            del vec_mm
+            del span_mm
+            if scale_mm is not None:
+                scale_mm.flush()
+                del scale_mm
+            if full_mm is not None:
+                full_mm.flush()
+                del full_mm
+
+        if new_rows:
+            f = open(self._file(_VECTORS_FILE), "ab")
+            f.write(np.ascontiguousarray(stored[new_idx]).tobytes())
+            f.close()
+            if keep_full:
+                f = open(self._file(_FULL_VECTORS_FILE), "ab")
+                f.write(np.ascontiguousarray(vectors[new_idx], dtype=np.float32).tobytes())
+                f.close()
+            f = open(self._file(_SPANS_FILE), "ab")
+            f.write(np.asarray(new_spans, dtype=np.int64).tobytes())
+            f.close()
+            if scales is not None:
+                f = open(self._file(_SCALES_FILE), "ab")
+                f.write(np.ascontiguousarray(scales[new_idx]).tobytes())
+                f.close()
+
+        # The sidecar is written last: readers only see rows whose vectors are on disk.
+        f = open(self._file(_META_FILE), "a", encoding="utf-8")
+        f.write("\n".join(meta_lines) + "\n")
+        f.close()
+
+        self._meta_stamp = None
+
+    def delete(self, ids=None, where=None):
+        self._refresh()
+        rows = []
+        if ids:
+            for x in ids:
+                if x in self._row_by_id:
+                    rows.append(self._row_by_id[x])
+        if where:
+            mask = self._where_mask(where)
+            for row in np.nonzero(mask)[0]:
+                rows.append(int(row))
+        if not rows:
+            return
+
+        lines = []
+        for row in sorted(set(rows)):
+            lines.append(json.dumps({"row": row, "deleted": True}))
+        f = open(self._file(_META_FILE), "a", encoding="utf-8")
+        f.write("\n".join(lines) + "\n")
+        f.close()
+        self._meta_stamp = None
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None):
+        self._refresh()
+        if include is None:
+            include = ["documents", "metadatas"]
+
+        rows = []
+        if ids is not None:
+            mask = self._where_mask(where) if where else None
+            for x in ids:
+                row = self._row_by_id.get(x)
+                if row is None:
+                    continue
+                if mask is not None and not mask[row]:
+                    continue
+                rows.append(row)
+        else:
+            for row in np.nonzero(self._where_mask(where))[0]:
+                rows.append(int(row))
+
+        if offset:
+            rows = rows[offset:]
+        if limit is not None:
+            rows = rows[:limit]
+
+        out = {"ids": [self._ids[r] for r in rows]}
+        if "metadatas" in include:
+            out["metadatas"] = [self._metadatas[r] for r in rows]
+        if "documents" in include:
+            out["documents"] = self._read_documents(rows)
+        if "embeddings" in include:
+            out["embeddings"] = self._decode(rows)
+        return out
+
+    def _score(self, query_vec):
+        """(Approximate) cosine similarity of every stored row against one normalised query vector."""
+        q = self._query_part(query_vec.reshape(1, -1))[0]
+        if self._dtype == np.float32:
+            return np.asarray(self._vectors @ q)
+
+        n = self._vectors.shape[0]
+        scores = np.empty(n, dtype=np.float32)
+        start = 0
+        while start < n:
+            end = min(start + _SCORE_BLOCK_ROWS, n)
+            scores[start:end] = self._vectors[start:end].astype(np.float32) @ q
+            start = end
+        if self._dtype == np.int8:
+            scores /= self._scales
+        return scores
+
+    def _distance(self, sims):
+        # Rows are unit length, so every supported space is a function of cosine similarity.
+        if self._space == "l2":
+            return 2.0 - 2.0 * sims
+        return 1.0 - sims
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, where=None, include=None):
+        self._refresh()
+        if include is None:
+            include = ["documents", "metadatas", "distances"]
+
+        if query_embeddings is None:
+            if self._embedding_function is None:
+                raise RuntimeError("FlatCollection needs query_embeddings or an embedding_function.")
+            query_embeddings = self._embedding_function(list(query_texts))
+        queries = _normalise(query_embeddings)
+
+        out = {"ids": []}
+        for field in ("documents", "metadatas", "distances", "embeddings"):
+            if field in include:
+                out[field] = []
+
+        mask = self._where_mask(where) if self._vectors is not None else None
+        for q in queries:
+            rows = []
+            row_sims = []
+            if mask is not None and mask.any() and n_results > 0:
+                sims = self._score(q)
+                sims[~mask] = -np.inf
+                n_match = int(mask.sum())
+                k = min(n_results, n_match)
+                pool = k
+                if self._full is not None:
+                    pool = min(max(k, self.rescore_candidates), n_match)
+
+                top = np.argpartition(-sims, pool - 1)[:pool]
+                if self._full is not None:
+                    top = np.sort(top)
+                    top_sims = np.asarray(self._full[top], dtype=np.float32) @ q
+                else:
+                    top_sims = sims[top]
+                order = np.argsort(-top_sims)[:k]
+                rows = [int(r) for r in top[order]]
+                row_sims = [float(x) for x in top_sims[order]]
+
+            out["ids"].append([self._ids[r] for r in rows])
+            if "metadatas" in out:
+                out["metadatas"].append([self._metadatas[r] for r in rows])
+            if "documents" in out:
+                out["documents"].append(self._read_documents(rows))
+            if "distances" in out:
+                out["distances"].append([float(self._distance(x)) for x in row_sims])
+            if "embeddings" in out:
+                out["embeddings"].append(self._decode(rows))
+        return out
+
+
+class FlatClient:
+    """Directory of FlatCollections with the PersistentClient methods embedding.py uses."""
+
+    def __init__(self, path, dtype="float32", truncate_dim=0, keep_full=True, rescore_candidates=50):
+        if dtype not in _DTYPES:
+            raise ValueError("Unsupported flat index dtype: " + str(dtype))
+        self.path = path
+        self.dtype = dtype
+        self.truncate_dim = truncate_dim or 0
+        self.keep_full = keep_full
+        self.rescore_candidates = rescore_candidates
+        os.makedirs(path, exist_ok=True)
+
+    def _dir(self, name):
+        return os.path.join(self.path, name)
+
+    def _exists(self, name):
+        return os.path.isfile(os.path.join(self._dir(name), _COLLECTION_FILE))
+
+    def create_collection(self, name, embedding_function=None, metadata=None):
+        if self._exists(name):
+            raise ValueError("Collection " + name + " already exists")
+        os.makedirs(self._dir(name), exist_ok=True)
+        info = {
+            "name": name,
+            "dtype": self.dtype,
+            "dim": None,
+            "truncate_dim": self.truncate_dim,
+            "keep_full": self.keep_full,
+            "metadata": metadata or {},
+        }
+        _write_json(os.path.join(self._dir(name), _COLLECTION_FILE), info)
+        return FlatCollection(self._dir(name), name, embedding_function, self.rescore_candidates)
+
+    def get_collection(self, name, embedding_function=None):
+        if not self._exists(name):
+            raise ValueError("Collection " + name + " does not exist")
+        return FlatCollection(self._dir(name), name, embedding_function, self.rescore_candidates)
+
+    def get_or_create_collection(self, name, embedding_function=None, metadata=None):
+        if self._exists(name):
+            return self.get_collection(name, embedding_function)
+        return self.create_collection(name, embedding_function, metadata)
+
+    def delete_collection(self, name):
+        if not self._exists(name):
+            raise ValueError("Collection " + name + " does not exist")
+        shutil.rmtree(self._dir(name))
+
+    def list_collections(self):
+        names = []
+        for name in sorted(os.listdir(self.path)):
+            if self._exists(name):
+                names.append(name)
+        return names
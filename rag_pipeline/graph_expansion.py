@@ -0,0 +1,203 @@
+"""
+Graph-aware context expansion for QA.
+
+At build time the package and class dependency graphs (arch/dep_graph.py) are
+written to config.DEP_GRAPH_PATH (one file per shard in multi-repo mode). At query time the files that retrieved code
+chunks import, or are imported by, are fetched from the collection by id and
+appended as extra context blocks within GRAPH_EXPANSION_TOKEN_BUDGET. Questions
+like "how does X reach Y" then get the files along the path without raising TOP_K.
+"""
+
+import os
+
+import config
+from arch.java_static import scan_repo_java
+from arch.parse_cache import parse_cache_for
+from arch.dep_graph import build_package_graph, build_class_graph, save_dependency_graphs, load_dependency_graphs
+from rag_pipeline.ingestion import DocumentChunk
+from rag_pipeline.shards import shard_names, shard_graph_path, prefixed
+from rag_pipeline.retrieval import truncate_to_max_tokens
+from rag_pipeline.text_index import term_lines
+from tools.tokens import count_tokens, TOKEN_RE
+
+_GRAPH = None
+_GRAPH_MTIME = None
+
+# Neighbour blocks smaller than this are not worth a context slot.
+_MIN_BLOCK_TOKENS = 64
+
+
+def persist_dependency_graphs(repo_path, path=None):
+    if path is None:
+        path = config.DEP_GRAPH_PATH
+    java_files = scan_repo_java(repo_path, parse_cache_for(repo_path))
+    package_graph, _ = build_package_graph(java_files)
+    class_graph = build_class_graph(java_files)
+    save_dependency_graphs(path, package_graph, class_graph)
+
+    n_edges = 0
+    for k in class_graph:
+        n_edges += len(class_graph[k])
+    print("[GRAPH] classes=" + str(len(class_graph)) + " edges=" + str(n_edges) + " packages=" + str(len(package_graph)) + " -> " + path)
+    return path
+
+
+def _graph_files():
+    """[(shard, graph path)]: the single-repo graph (shard None), or one per shard."""
+    names = shard_names()
+    if not names:
+        return [(None, config.DEP_GRAPH_PATH)]
+    return [(name, shard_graph_path(name)) for name in names]
+
+
+def _load_graph():
+    """
+    Class graph with reverse edges: {chunk id: (deps, dependents)}, merged over shards
+    (ids prefixed like ShardedCollection ids); reloaded when a graph file changes.
+    """
+    global _GRAPH, _GRAPH_MTIME
+    files = [(shard, path) for shard, path in _graph_files() if os.path.isfile(path)]
+    if not files:
+        return None
+    mtime = tuple((path, os.path.getmtime(path)) for _, path in files)
+    if _GRAPH is not None and _GRAPH_MTIME == mtime:
+        return _GRAPH
+
+    graph = {}
+    for shard, path in files:
+        _, classes = load_dependency_graphs(path)
+        for src, deps in classes.items():
+            if shard is not None:
+                src = prefixed(shard, src)
+                deps = [prefixed(shard, d) for d in deps]
+            graph.setdefault(src, (set(), set()))[0].update(deps)
+            for dst in deps:
+                graph.setdefault(dst, (set(), set()))[1].add(src)
+
+    _GRAPH = graph
+    _GRAPH_MTIME = mtime
+    return graph
+
+
+def _question_terms(question):
+    terms = set()
+    for t in TOKEN_RE.findall(question.lower()):
+        if len(t) >= 3:
+            terms.add(t)
+    return terms
+
+
+def _term_hits(terms, text, meta):
+    index = term_lines(meta)
+    hits = 0
+    if index is not None:
+        for t in terms:
+            if t in index:
+                hits += 1
+        return hits
+    low = text.lower()
+    for t in terms:
+        if t in low:
+            hits += 1
+    return hits
+
+
+def graph_neighbours(chunks, max_neighbours):
+    """
+    Direct dependencies/dependents of the retrieved chunks that are not retrieved
+    themselves, ranked by how many retrieved chunks they connect to, then by the
+    rank of the best one. Returns [(rel_path, seed_id, links)].
+    """
+    graph = _load_graph()
+    if graph is None:
+        return []
+
+    have = set(c.id for c in chunks)
+    found = {}
+    rank = 0
+    for c in chunks:
+        entry = graph.get(c.id)
+        if entry is not None:
+            for n in entry[0] | entry[1]:
+                if n in have:
+                    continue
+                if n not in found:
+                    found[n] = [c.id, rank, 0]
+                found[n][2] += 1
+        rank += 1
+
+    ordered = sorted(found.items(), key=lambda x: (-x[1][2], x[1][1], x[0]))
+    return [(n, v[0], v[2]) for n, v in ordered[:max_neighbours]]
+
+
+def expand_with_neighbours(collection, question, chunks, token_budget=None):
+    """
+    Append dependency neighbours of the retrieved code chunks as extra chunks, each
+    cut to what is left of token_budget (default GRAPH_EXPANSION_TOKEN_BUDGET).
+    Candidates are fetched with collection.get(ids=...) and ordered by graph links,
+    then by overlap with the question's terms. Duplicates (dedup pointer records) are
+    replaced by their canonical chunk.
+    """
+    if token_budget is None:
+        token_budget = config.GRAPH_EXPANSION_TOKEN_BUDGET
+    if token_budget <= 0 or not chunks:
+        return chunks
+
+    neighbours = graph_neighbours(chunks, config.GRAPH_EXPANSION_MAX_NEIGHBOURS)
+    if not neighbours:
+        return chunks
+
+    got = collection.get(ids=[n for n, _, _ in neighbours], include=["documents", "metadatas"])
+    docs = {}
+    i = 0
+    while i < len(got.get("ids") or []):
+        docs[got["ids"][i]] = (got["documents"][i], got["metadatas"][i] or {})
+        i += 1
+
+    # A dedup pointer record (near copy) stands in for its canonical, which is fetched
+    # instead; a canonical already in context or already picked is not added again.
+    canonical = {}
+    for n in docs:
+        if docs[n][1].get("duplicate_of"):
+            canonical[n] = docs[n][1]["duplicate_of"]
+    missing = sorted(set(canonical.values()) - set(docs))
+    if missing:
+        got = collection.get(ids=missing, include=["documents", "metadatas"])
+        i = 0
+        while i < len(got.get("ids") or []):
+            docs[got["ids"][i]] = (got["documents"][i], got["metadatas"][i] or {})
+            i += 1
+
+    have = set(c.id for c in chunks)
+    picked = set()
+    terms = _question_terms(question)
+    scored = []
+    for n, seed, links in neighbours:
+        n = canonical.get(n, n)
+        if n not in docs or n in have or n in picked or docs[n][1].get("type") != "code":
+            continue
+        picked.add(n)
+        text, meta = docs[n]
+        scored.append((-links, -_term_hits(terms, text, meta), n, seed, text, meta))
+    scored.sort(key=lambda x: (x[0], x[1], x[2]))
+
+    out = list(chunks)
+    used = 0
+    added = 0
+    for _, _, n, seed, text, meta in scored:
+        left = token_budget - used
+        if left < _MIN_BLOCK_TOKENS:
+            break
+        text = truncate_to_max_tokens(text, min(left, config.MAX_CANDIDATE_TOKENS), meta)
+        cost = count_tokens(text)
+        if cost > left:
+            continue
+
+        meta = dict(meta)
+        meta["expanded_from"] = seed
+        out.append(DocumentChunk(n, text, meta))
+        used += cost
+        added += 1
+
+    print("[GRAPH] expansion added=" + str(added) + " tokens=" + str(used) + "/" + str(token_budget))
+    return out
@@ -0,0 +1,126 @@
+"""
+Build-then-swap index versions.
+
+A rebuild writes into a fresh collection named "<base>__v<timestamp>" and only
+then repoints the alias "<base>" at it (aliases.json, replaced atomically), so
+readers keep using the previous complete version for the whole build.
+"""
+
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, writers are not serialised
+    fcntl = None
+
+ALIAS_FILE = "aliases.json"
+VERSION_SEP = "__v"
+# In-process writers; the flock on aliases.json.lock covers other processes.
+_ALIAS_LOCK = threading.Lock()
+
+
+def _alias_path(persist_dir):
+    return os.path.join(persist_dir, ALIAS_FILE)
+
+
+def read_aliases(persist_dir):
+    path = _alias_path(persist_dir)
+    if not os.path.isfile(path):
+        return {}
+    try:
+        f = open(path, "r", encoding="utf-8")
+        data = json.load(f)
+        f.close()
+    except Exception:
+        return {}
+    return data
+
+
+def resolve_alias(persist_dir, base_name):
+    """Versioned collection name the alias points at, or None if never swapped."""
+    return read_aliases(persist_dir).get(base_name)
+
+
+def write_alias(persist_dir, base_name, version_name):
+    """
+    Point base_name at version_name; os.replace makes the switch atomic for readers.
+    The read-modify-write runs under a lock file, so concurrent builds of different
+    aliases (e.g. shards sharing a persist dir) do not drop each other's entry.
+    """
+    path = _alias_path(persist_dir)
+    with _ALIAS_LOCK:
+        lock = open(path + ".lock", "a")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            data = read_aliases(persist_dir)
+            data[base_name] = version_name
+
+            tmp = path + "." + str(os.getpid()) + ".tmp"
+            f = open(tmp, "w", encoding="utf-8")
+            json.dump(data, f, indent=2)
+            f.close()
+            os.replace(tmp, path)
+        finally:
+            # closing the file releases the flock
+            lock.close()
+
+
+def new_version_name(base_name):
+    stamp = time.strftime("%Y%m%d%H%M%S", time.gmtime()) + "%03d" % (int(time.time() * 1000) % 1000)
+    return base_name + VERSION_SEP + stamp
+
+
+def is_version_of(name, base_name):
+    return name == base_name or name.startswith(base_name + VERSION_SEP)
+
+
+def stale_versions(names, base_name, current, keep):
+    """
+    Versions of base_name that may be deleted: everything except the current one
+    and the (keep - 1) most recent previous ones, which stay around so processes
+    still holding an older handle can finish their queries.
+    """
+    versions = []
+    for n in names:
+        if n != current and is_version_of(n, base_name):
+            versions.append(n)
+
+    # "<base>__v<timestamp>" sorts chronologically; the legacy unversioned name sorts first.
+    versions.sort(reverse=True)
+    spare = keep - 1
+    if spare < 0:
+        spare = 0
+    return versions[spare:]
+
+
+def _collection_names(client):
+    names = []
+    for c in client.list_collections():
+        names.append(getattr(c, "name", c))
+    return names
+
+
+def collect_garbage_async(client, base_name, current, keep):
+    """Delete stale versions on a background thread; returns the (non-daemon) thread."""
+
+    def run():
+        try:
+            stale = stale_versions(_collection_names(client), base_name, current, keep)
+        except Exception as e:
+            print("[INDEX] gc skipped:", e)
+            return
+
+        for name in stale:
+            try:
+                client.delete_collection(name=name)
+                print("[INDEX] gc deleted old version:", name)
+            except Exception as e:
+                print("[INDEX] gc failed for", name + ":", e)
+
+    t = threading.Thread(target=run, name="index-gc")
+    t.start()
+    return t
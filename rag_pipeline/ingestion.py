@@ -1,65 +1,241 @@
+import mmap
 import os
+import re
+import config
+from arch.java_static import PACKAGE_RE, is_test_path
+from rag_pipeline.text_index import build_text_index
+from rag_pipeline.dedup import content_hash, dedupe_documents
+from rag_pipeline.summaries import FileSummaryInfo, DEFAULT_PACKAGE, extract_signatures, build_summary_documents
+
+_WHITESPACE = b" \t\r\n\x0b\x0c"
+# Paragraph break with any line endings (LF or CRLF)
+_PARAGRAPH_RE = re.compile(b"\r?\n\r?\n")
+
+
+def _decode(data):
+    # Same text as open(..., "r") would give: universal newlines.
+    return data.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _stamp(st):
+    return (st.st_mtime_ns, st.st_size)
+
+
+class StaleChunkError(RuntimeError):
+    """The file behind a byte-range chunk changed after it was chunked."""
+
+
+def _read_range(path, start, end, stamp=None):
+    if end <= start:
+        return ""
+    f = open(path, "rb")
+    try:
+        # Offsets are only valid for the file as it was chunked.
+        if stamp is not None and _stamp(os.fstat(f.fileno())) != stamp:
+            raise StaleChunkError(path + " changed after it was chunked")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            data = mm[start:end]
+        finally:
+            mm.close()
+    finally:
+        f.close()
+    return _decode(data)
+
 
 class DocumentChunk:
-    def __init__(self, chunk_id, text, metadata):
+    """
+    A chunk is either in-memory text (retrieval results, packed context) or a byte
+    range of a source file whose text is read through mmap only when accessed, so an
+    ingest run holds paths and offsets rather than the whole corpus. stamp is the
+    file's (mtime_ns, size) when it was chunked; a changed file raises StaleChunkError
+    instead of returning text from stale offsets (read_text skips it with a log line).
+    """
+
+    __slots__ = ("id", "metadata", "score", "rerank_score", "path", "start", "end", "stamp", "_text")
+
+    def __init__(self, chunk_id, text, metadata, path=None, start=0, end=0, stamp=None):
         self.id = chunk_id
-        self.text = text
         self.metadata = metadata
-        self.score = None
+        self.score = None  # retrieval distance
+        self.rerank_score = None  # cross-encoder score, set by rerank()
+        self.path = path
+        self.start = start
+        self.end = end
+        self.stamp = stamp
+        self._text = text
 
+    @classmethod
+    def from_file_range(cls, chunk_id, path, start, end, metadata, stamp=None):
+        return cls(chunk_id, None, metadata, path=path, start=start, end=end, stamp=stamp)
 
-def ingest_repository(repo_path):
-    documents = []
+    @property
+    def text(self):
+        if self._text is not None:
+            return self._text
+        if self.path is None:
+            return ""
+        return _read_range(self.path, self.start, self.end, self.stamp)
 
-    # 1) README.md (paragraph chunks)
-    readme_path = os.path.join(repo_path, "README.md")
-    if os.path.isfile(readme_path):
+    @text.setter
+    def text(self, value):
+        self._text = value
+
+    def read_text(self):
+        """text, or None (logged) when the file changed after it was chunked; the next build or watch update picks it up."""
         try:
-            f = open(readme_path, "r", encoding="utf-8", errors="ignore")
-            readme_text = f.read()
-            f.close()
-        except Exception:
-            readme_text = ""
-
-        paragraphs = []
-        for para in readme_text.split("\n\n"):
-            p = para.strip()
-            if p:
-                paragraphs.append(p)
-
-        idx = 1
-        for para in paragraphs:
-            chunk_id = "README_paragraph_" + str(idx)
-            metadata = {"source": "README.md", "type": "text"}
-            documents.append(DocumentChunk(chunk_id, para, metadata))
-            idx += 1
+            return self.text
+        except StaleChunkError as e:
+            print("[INGEST] skipped " + str(self.id) + ": " + str(e))
+            return None
 
-    # Java files (whole-file chunks)
-    for root, _, files in os.walk(repo_path):
-        for name in files:
-            if not name.endswith(".java"):
-                continue
 
-            file_path = os.path.join(root, name)
-            try:
-                f = open(file_path, "r", encoding="utf-8", errors="ignore")
-                code = f.read().strip()
-                f.close()
-            except Exception:
-                continue
+def _strip_range(data, start, end):
+    while start < end and data[start] in _WHITESPACE:
+        start += 1
+    while end > start and data[end - 1] in _WHITESPACE:
+        end -= 1
+    return start, end
+
+
+def _read_bytes(path):
+    """(bytes, stamp) of a file, or None when unreadable."""
+    try:
+        f = open(path, "rb")
+        stamp = _stamp(os.fstat(f.fileno()))
+        data = f.read()
+        f.close()
+    except Exception:
+        return None
+    return data, stamp
+
 
-            if not code:
-                continue
+def ingest_readme(repo_path):
+    """README.md paragraph chunks (empty list when there is no README)."""
+    chunks = []
+    readme_path = os.path.join(repo_path, "README.md")
+    if not os.path.isfile(readme_path):
+        return chunks
+    got = _read_bytes(readme_path)
+    readme, stamp = got if got is not None else (b"", None)
+
+    idx = 1
+    pos = 0
+    while pos <= len(readme):
+        m = _PARAGRAPH_RE.search(readme, pos)
+        cut = m.start() if m else len(readme)
+        start, end = _strip_range(readme, pos, cut)
+        pos = m.end() if m else len(readme) + 1
+
+        if start == end:
+            continue
+        para = _decode(readme[start:end])
+        chunk_id = "README_paragraph_" + str(idx)
+        metadata = {"source": "README.md", "type": "text"}
+        metadata.update(build_text_index(para))
+        chunks.append(DocumentChunk.from_file_range(chunk_id, readme_path, start, end, metadata, stamp))
+        idx += 1
+    return chunks
+
+
+def is_indexed_java(rel_path):
+    # Always exclude tests
+    return rel_path.endswith(".java") and not is_test_path(rel_path)
+
+
+def read_java_file(repo_path, rel_path):
+    """(abs path, bytes, stamp) of a Java file given by its repo-relative path; None when unreadable."""
+    file_path = os.path.join(repo_path, rel_path.replace("/", os.sep))
+    got = _read_bytes(file_path)
+    if got is None:
+        return None
+    return file_path, got[0], got[1]
+
+
+def chunk_java_bytes(rel_path, file_path, data, with_summaries=False, stamp=None, keep_text=False):
+    """
+    (chunk, FileSummaryInfo or None) from a file's bytes; None when the file is empty.
+    keep_text keeps the decoded text on the chunk instead of a byte range, for callers
+    that embed it soon anyway (no second read of the file).
+    """
+    start, end = _strip_range(data, 0, len(data))
+    if start == end:
+        return None
+
+    # Without keep_text, the text is only needed here for the text index; the chunk keeps the byte range.
+    code = _decode(data[start:end])
+
+    class_name = rel_path.rsplit("/", 1)[-1][:-5]
+    m = PACKAGE_RE.search(code)
+    package = m.group(1) if m else DEFAULT_PACKAGE
+    metadata = {"source": rel_path, "type": "code", "class": class_name, "package": package}
+    metadata["content_hash"] = content_hash(code)
+    # Set by dedup; None clears a stale value, since Chroma's upsert merges metadata.
+    metadata["duplicate_of"] = None
+    metadata["duplicates"] = None
+    metadata["n_duplicates"] = 0
+    metadata.update(build_text_index(code))
+
+    info = None
+    if with_summaries:
+        info = FileSummaryInfo(rel_path, package, class_name, extract_signatures(code))
+    if keep_text:
+        return DocumentChunk(rel_path, code, metadata), info
+    return DocumentChunk.from_file_range(rel_path, file_path, start, end, metadata, stamp), info
 
+
+def ingest_java_file(repo_path, rel_path, with_summaries=False, keep_text=False):
+    """
+    (chunk, FileSummaryInfo or None) for one Java file given by its repo-relative
+    path; None when the file is unreadable or empty.
+    """
+    got = read_java_file(repo_path, rel_path)
+    if got is None:
+        return None
+    return chunk_java_bytes(rel_path, got[0], got[1], with_summaries, got[2], keep_text)
+
+
+def iter_java_paths(repo_path):
+    """Repo-relative paths of the indexed Java files, in os.walk order."""
+    for root, _, files in os.walk(repo_path):
+        for name in files:
+            file_path = os.path.join(root, name)
             rel_path = os.path.relpath(file_path, repo_path)
             rel_path = rel_path.replace(os.sep, "/")
+            if is_indexed_java(rel_path):
+                yield rel_path
 
-            # Always exclude tests
-            if rel_path.startswith("src/test/"):
-                continue
 
-            class_name = name[:-5]
-            metadata = {"source": rel_path, "type": "code", "class": class_name}
+def ingest_repository(repo_path):
+    """
+    README paragraphs and whole Java files as chunks; with config.INDEX_SUMMARIES also
+    one file_summary per Java file and one pkg_summary per package (hierarchical retrieval).
+    With config.DEDUP_ENABLED, exact copies are left out (listed on their canonical
+    chunk) and near copies become pointer records (rag_pipeline/dedup.py); neither
+    gets a file_summary.
+    """
+    with_summaries = getattr(config, "INDEX_SUMMARIES", False)
+
+    # 1) README.md (paragraph chunks)
+    readme_chunks = ingest_readme(repo_path)
+    documents = list(readme_chunks)
+    file_infos = []
+
+    # Java files (whole-file chunks)
+    for rel_path in iter_java_paths(repo_path):
+        got = ingest_java_file(repo_path, rel_path, with_summaries)
+        if got is None:
+            continue
+        documents.append(got[0])
+        if got[1] is not None:
+            file_infos.append(got[1])
+
+    if config.DEDUP_ENABLED:
+        # Duplicate files point to their canonical chunk instead of being embedded again.
+        documents, copies = dedupe_documents(documents)
+        file_infos = [f for f in file_infos if f.rel_path not in copies]
 
-            documents.append(DocumentChunk(rel_path, code, metadata))
+    if with_summaries:
+        for chunk_id, text, metadata in build_summary_documents(file_infos, readme_chunks):
+            documents.append(DocumentChunk(chunk_id, text, metadata))
     return documents
@@ -0,0 +1,216 @@
+"""
+ONNX Runtime embedding backend (config.EMBEDDING_BACKEND = "onnx").
+
+`export_onnx_model` converts the sentence-transformers model named by
+config.EMBEDDING_MODEL_NAME to ONNX, applies dynamic int8 weight quantisation and
+records the pooling/normalisation the reference model uses. `OnnxEmbeddingFunction`
+then embeds with onnxruntime + tokenizers only, so neither PyTorch nor
+sentence-transformers is imported on build or query nodes.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+try:
+    from chromadb.api.types import EmbeddingFunction as _EmbeddingFunctionBase
+except ImportError:
+    _EmbeddingFunctionBase = object
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+SETTINGS_FILE = "onnx_config.json"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+def _read_settings(model_dir):
+    path = os.path.join(model_dir, SETTINGS_FILE)
+    f = open(path, "r", encoding="utf-8")
+    data = json.load(f)
+    f.close()
+    return data
+
+
+class OnnxEmbeddingFunction(_EmbeddingFunctionBase):
+    def __init__(self, model_dir, model_file=INT8_FILE, batch_size=32, num_threads=0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        settings = _read_settings(model_dir)
+        self.model_name = settings.get("model_name", "")
+        self.pooling = settings.get("pooling", "cls")
+        self.normalize = bool(settings.get("normalize", True))
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=int(settings.get("max_length", 512)))
+        self.tokenizer.enable_padding(pad_id=int(settings.get("pad_id", 0)))
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [x.name for x in self.session.get_inputs()]
+
+    def _embed_batch(self, texts):
+        encoded = self.tokenizer.encode_batch(list(texts))
+        input_ids = np.asarray([e.ids for e in encoded], dtype=np.int64)
+        attention = np.asarray([e.attention_mask for e in encoded], dtype=np.int64)
+
+        feeds = {}
+        for name in self.input_names:
+            if name == "input_ids":
+                feeds[name] = input_ids
+            elif name == "attention_mask":
+                feeds[name] = attention
+            elif name == "token_type_ids":
+                feeds[name] = np.zeros_like(input_ids)
+
+        hidden = self.session.run(None, feeds)[0]
+
+        if self.pooling == "mean":
+            mask = attention[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        else:
+            pooled = hidden[:, 0]
+
+        pooled = pooled.astype(np.float32)
+        if self.normalize:
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            pooled = pooled / norms
+        return pooled
+
+    def __call__(self, input):
+        out = []
+        i = 0
+        while i < len(input):
+            for vec in self._embed_batch(input[i : i + self.batch_size]):
+                out.append(vec)
+            i += self.batch_size
+        return out
+
+
+def _reference_settings(model):
+    """Pooling mode and normalisation used by a loaded SentenceTransformer."""
+    pooling = "cls"
+    normalize = False
+    for module in model:
+        if hasattr(module, "get_pooling_mode_str"):
+            mode = module.get_pooling_mode_str()
+            if mode == "mean_tokens":
+                pooling = "mean"
+            elif mode == "cls_token":
+                pooling = "cls"
+            else:
+                raise ValueError("Unsupported pooling mode for ONNX export: " + str(mode))
+        if type(module).__name__ == "Normalize":
+            normalize = True
+    return pooling, normalize
+
+
+def export_onnx_model(model_name, out_dir, opset=17):
+    """Export model_name to out_dir as fp32 ONNX plus a dynamically int8-quantised copy."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0]
+    tokenizer = transformer.tokenizer
+    hf_model = transformer.auto_model
+    hf_model.eval()
+    pooling, normalize = _reference_settings(model)
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.inner(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            ).last_hidden_state
+
+    dummy = tokenizer(["export sample"], return_tensors="pt")
+    token_type_ids = dummy.get("token_type_ids")
+    if token_type_ids is None:
+        token_type_ids = torch.zeros_like(dummy["input_ids"])
+
+    fp32_path = os.path.join(out_dir, FP32_FILE)
+    dynamic = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(hf_model),
+            (dummy["input_ids"], dummy["attention_mask"], token_type_ids),
+            fp32_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": dynamic,
+                "attention_mask": dynamic,
+                "token_type_ids": dynamic,
+                "last_hidden_state": dynamic,
+            },
+            opset_version=opset,
+        )
+
+    int8_path = os.path.join(out_dir, INT8_FILE)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(out_dir)
+    settings = {
+        "model_name": model_name,
+        "pooling": pooling,
+        "normalize": normalize,
+        "max_length": int(model.max_seq_length or 512),
+        "pad_id": int(tokenizer.pad_token_id or 0),
+    }
+    f = open(os.path.join(out_dir, SETTINGS_FILE), "w", encoding="utf-8")
+    json.dump(settings, f, indent=2)
+    f.close()
+
+    print("[ONNX] exported:", fp32_path)
+    print("[ONNX] quantised:", int8_path)
+    return int8_path
+
+
+def check_parity(model_name, model_dir, texts, model_file=INT8_FILE, min_cosine=0.99):
+    """
+    Compare ONNX embeddings with the reference sentence-transformers embeddings on texts.
+    Prints min/mean cosine similarity and per-text embedding time for both; returns True
+    if every text stays above min_cosine.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if not texts:
+        print("[ONNX] parity: no texts to compare")
+        return False
+
+    reference = SentenceTransformer(model_name, device="cpu")
+    onnx_fn = OnnxEmbeddingFunction(model_dir, model_file=model_file)
+
+    t0 = time.perf_counter()
+    ref = np.asarray(reference.encode(list(texts), batch_size=onnx_fn.batch_size), dtype=np.float32)
+    t1 = time.perf_counter()
+    got = np.asarray(onnx_fn(list(texts)), dtype=np.float32)
+    t2 = time.perf_counter()
+
+    ref = ref / np.clip(np.linalg.norm(ref, axis=1, keepdims=True), 1e-9, None)
+    got = got / np.clip(np.linalg.norm(got, axis=1, keepdims=True), 1e-9, None)
+    cos = (ref * got).sum(axis=1)
+
+    n = float(len(texts))
+    print("[ONNX] parity texts=" + str(len(texts)) + " min_cos=" + "%.4f" % float(cos.min()) + " mean_cos=" + "%.4f" % float(cos.mean()))
+    print("[ONNX] reference_ms_per_text=" + "%.2f" % ((t1 - t0) * 1000 / n) + " onnx_ms_per_text=" + "%.2f" % ((t2 - t1) * 1000 / n))
+
+    ok = float(cos.min()) >= min_cosine
+    if not ok:
+        print("[ONNX] parity FAILED: min cosine below " + str(min_cosine))
+    return ok
@@ -3,22 +3,129 @@ import time
 
 from tools.runtime import get_collection
 from rag_pipeline.retrieval import retrieve_top_k
+from rag_pipeline.embedding import embed_texts, current_index_version
+from rag_pipeline.qa_cache import normalise_question, query_embedding_cache, answer_cache
+from rag_pipeline.context_packer import pack_context
+from rag_pipeline.rerank import rerank
+from rag_pipeline.graph_expansion import expand_with_neighbours
 from tools.prompt_builder import build_prompt
 from tools.llm_client import generate_rag_answer_with_fallback
 from tools.verify import verify_citations
 
+# Answers produced without the LLM (or rejected) are not worth caching.
+_UNCACHEABLE_PREFIXES = (
+    "BLOCKED:",
+    "No relevant retrieval results.",
+    "I cannot answer from the provided context.",
+)
+
+
+def _cache_settings():
+    # Cached answers are only valid for the retrieval settings they were produced with.
+    parts = [config.RETRIEVAL_SCOPE, config.TOP_K, config.MAX_CANDIDATE_TOKENS]
+    if config.RETRIEVAL_MODE == "hierarchical":
+        parts += ["hier", config.HIER_TOP_PACKAGES, config.HIER_TOP_FILES]
+    if config.CONTEXT_PACKING:
+        parts += ["pack", config.CANDIDATE_POOL_K, config.CONTEXT_TOKEN_BUDGET]
+    if config.RERANK_ENABLED:
+        parts += ["rerank", config.RERANK_MODEL_NAME, config.RERANK_CANDIDATES]
+    if config.GRAPH_EXPANSION:
+        parts += ["graph", config.GRAPH_EXPANSION_TOKEN_BUDGET, config.GRAPH_EXPANSION_MAX_NEIGHBOURS]
+    return "|".join(str(x) for x in parts)
+
+
+def _embedding_key(question):
+    backend = getattr(config, "EMBEDDING_BACKEND", "sentence-transformers")
+    return backend + "|" + config.EMBEDDING_MODEL_NAME + "|" + normalise_question(question)
+
+
+def get_query_embedding(question):
+    """Question embedding via the in-process LRU, then the persisted cache, then the model."""
+    key = _embedding_key(question)
+    lru = query_embedding_cache()
+
+    vec = lru.get(key)
+    if vec is not None:
+        return vec
+
+    vec = answer_cache().find_embedding(key)
+    if vec is None:
+        vec = embed_texts([question])[0]
+    lru.put(key, vec)
+    return vec
+
+
+def _cached_answer(question_vec):
+    entry, sim = answer_cache().lookup(
+        question_vec, current_index_version(), _cache_settings(), config.SEMANTIC_CACHE_MIN_SIMILARITY
+    )
+    if entry is None:
+        return None
+
+    ok, msg = verify_citations(entry["answer"], entry["num_contexts"])
+    if not ok:
+        print("[CACHE] semantic hit rejected: " + msg)
+        return None
+
+    print("[CACHE] semantic hit sim=" + "%.3f" % sim + " cached_question=" + repr(entry["question"]))
+    return entry["answer"]
+
+
+def _store_answer(question, question_vec, answer, retrieved):
+    if not answer or answer.startswith(_UNCACHEABLE_PREFIXES):
+        return
+    sources = [c.metadata.get("source", c.id) for c in retrieved]
+    answer_cache().store(
+        _embedding_key(question), question, question_vec, current_index_version(),
+        _cache_settings(), answer, len(retrieved), sources,
+    )
+
 
 def run_question_answering(question, build_index, rebuild_index):
     collection = get_collection(build=build_index, rebuild=rebuild_index)
     if collection is None:
         return None
-    
+
+    use_cache = getattr(config, "QA_CACHE_ENABLED", True)
+
     t0 = time.perf_counter()
-    retrieved = retrieve_top_k(collection, question, config.TOP_K)
+    question_vec = get_query_embedding(question)
+    if use_cache:
+        cached = _cached_answer(question_vec)
+        if cached is not None:
+            print("[TIMING] qa_cache_ms=" + str(int((time.perf_counter() - t0) * 1000)))
+            return cached
+
+    if config.CONTEXT_PACKING:
+        keep = max(config.TOP_K, config.CANDIDATE_POOL_K)
+        max_tokens = 0
+    else:
+        keep = config.TOP_K
+        max_tokens = None
+
+    fetch = keep
+    if config.RERANK_ENABLED:
+        fetch = max(keep, config.RERANK_CANDIDATES)
+    pool = retrieve_top_k(collection, question, fetch, query_embedding=question_vec, max_tokens=max_tokens)
     t1 = time.perf_counter()
     print("[TIMING] qa_retrieve_ms=" + str(int((t1 - t0) * 1000)))
 
+    if config.RERANK_ENABLED:
+        pool = rerank(question, pool, keep, current_index_version())
+        t2 = time.perf_counter()
+        print("[TIMING] qa_rerank_ms=" + str(int((t2 - t1) * 1000)))
+
+    if config.CONTEXT_PACKING:
+        retrieved = pack_context(question, pool, config.CONTEXT_TOKEN_BUDGET)
+    else:
+        retrieved = pool
+
+    if config.GRAPH_EXPANSION and config.RETRIEVAL_SCOPE != "text":
+        retrieved = expand_with_neighbours(collection, question, retrieved)
+
     prompt = build_prompt(question, retrieved)
 
     answer = generate_rag_answer_with_fallback(question, retrieved, prompt, verify_citations)
+    if use_cache:
+        _store_answer(question, question_vec, answer, retrieved)
     return answer
@@ -0,0 +1,189 @@
+"""
+Two-level cache for the QA path:
+
+- LRUCache: exact LRU of normalised question -> query embedding, so a repeated
+  question skips the embedding model (also holds the reranker's scores).
+- SemanticAnswerCache: verified answers persisted on disk, reused when a new
+  question's embedding is within config.SEMANTIC_CACHE_MIN_SIMILARITY of an
+  earlier one asked against the same index version and retrieval settings.
+
+Index builds call invalidate_answer_cache(), and entries from other index
+versions are never returned.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalise_question(question):
+    return _WS_RE.sub(" ", question.strip().lower())
+
+
+class LRUCache:
+    """Thread-safe LRU of up to capacity values (None is never cached)."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.capacity < 1:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class SemanticAnswerCache:
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = None
+        self._matrix = None
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = []
+        if os.path.isfile(self.path):
+            try:
+                f = open(self.path, "r", encoding="utf-8")
+                self._entries = json.load(f).get("entries", [])
+                f.close()
+            except Exception:
+                self._entries = []
+        self._matrix = None
+
+    def _save(self):
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        tmp = self.path + "." + str(os.getpid()) + ".tmp"
+        f = open(tmp, "w", encoding="utf-8")
+        json.dump({"entries": self._entries}, f)
+        f.close()
+        os.replace(tmp, self.path)
+
+    def _vectors(self):
+        if self._matrix is None:
+            if self._entries:
+                m = np.asarray([e["embedding"] for e in self._entries], dtype=np.float32)
+                norms = np.linalg.norm(m, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                self._matrix = m / norms
+            else:
+                self._matrix = np.zeros((0, 0), dtype=np.float32)
+        return self._matrix
+
+    def find_embedding(self, key):
+        """Stored embedding of an identical earlier question (any index version)."""
+        with self._lock:
+            self._load()
+            for e in self._entries:
+                if e.get("key") == key:
+                    return np.asarray(e["embedding"], dtype=np.float32)
+        return None
+
+    def lookup(self, embedding, index_version, settings, min_similarity):
+        """Best cached entry for this index version/settings above min_similarity, with its similarity."""
+        with self._lock:
+            self._load()
+            if not self._entries:
+                return None, 0.0
+
+            q = np.asarray(embedding, dtype=np.float32)
+            norm = float(np.linalg.norm(q))
+            if norm == 0:
+                return None, 0.0
+            m = self._vectors()
+            if m.shape[1] != q.shape[0]:
+                return None, 0.0
+            sims = m @ (q / norm)
+
+            best = None
+            best_sim = 0.0
+            i = 0
+            while i < len(self._entries):
+                e = self._entries[i]
+                s = float(sims[i])
+                if e.get("index_version") == index_version and e.get("settings") == settings and s >= min_similarity and s > best_sim:
+                    best = e
+                    best_sim = s
+                i += 1
+            return best, best_sim
+
+    def store(self, key, question, embedding, index_version, settings, answer, num_contexts, sources):
+        with self._lock:
+            self._load()
+            self._entries = [e for e in self._entries if not (e.get("key") == key and e.get("index_version") == index_version)]
+            self._entries.append({
+                "key": key,
+                "question": question,
+                "embedding": [round(float(x), 6) for x in embedding],
+                "index_version": index_version,
+                "settings": settings,
+                "answer": answer,
+                "num_contexts": num_contexts,
+                "sources": sources,
+                "created": time.time(),
+            })
+            if self.max_entries > 0 and len(self._entries) > self.max_entries:
+                self._entries = self._entries[-self.max_entries :]
+            self._matrix = None
+            self._save()
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = []
+            self._matrix = None
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                # Parallel shard builds may invalidate at the same time.
+                pass
+
+
+_QUERY_EMBEDDINGS = LRUCache(getattr(config, "QUERY_EMBEDDING_CACHE_SIZE", 256))
+_ANSWERS = None
+
+
+def query_embedding_cache():
+    return _QUERY_EMBEDDINGS
+
+
+def answer_cache():
+    global _ANSWERS
+    if _ANSWERS is None:
+        _ANSWERS = SemanticAnswerCache(config.QA_CACHE_PATH, config.SEMANTIC_CACHE_MAX_ENTRIES)
+    return _ANSWERS
+
+
+def invalidate_answer_cache():
+    """Drop every cached answer (called whenever the index contents change)."""
+    answer_cache().invalidate()
+    print("[CACHE] answer cache invalidated")
@@ -0,0 +1,100 @@
+"""
+Optional cross-encoder reranking of retrieved chunks.
+
+retrieve_top_k orders chunks by embedding distance alone. With reranking, a wider
+pool (RERANK_CANDIDATES) is retrieved, each (question, chunk) pair is scored by a
+local CPU cross-encoder in batches of RERANK_BATCH_SIZE, and the best chunks by
+that score are kept. Scores are cached per (question hash, hash of the scored
+text, index version), so repeated or re-run questions only score chunks not seen
+before. Chunk ids are not unique enough (every README paragraph is "README.md").
+"""
+
+import hashlib
+import time
+
+import config
+from rag_pipeline.qa_cache import LRUCache, normalise_question
+from rag_pipeline.retrieval import truncate_to_max_tokens
+
+_MODEL = None
+
+
+_SCORES = LRUCache(getattr(config, "RERANK_CACHE_SIZE", 4096))
+
+
+def get_cross_encoder():
+    """Process-wide cross-encoder, loaded on first use."""
+    global _MODEL
+    if _MODEL is None:
+        from sentence_transformers import CrossEncoder
+
+        _MODEL = CrossEncoder(config.RERANK_MODEL_NAME, max_length=config.RERANK_MAX_LENGTH, device="cpu")
+    return _MODEL
+
+
+def _question_hash(question):
+    return hashlib.sha1(normalise_question(question).encode("utf-8")).hexdigest()
+
+
+def _score_key(qhash, text, index_version):
+    thash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    return config.RERANK_MODEL_NAME + "|" + qhash + "|" + thash + "|" + str(index_version)
+
+
+def score_pairs(question, chunks, index_version=None):
+    """Cross-encoder score per chunk (higher = more relevant); only cache misses are scored."""
+    qhash = _question_hash(question)
+    scores = [None] * len(chunks)
+    texts = []
+    keys = []
+    todo = []
+
+    i = 0
+    while i < len(chunks):
+        # The model truncates at RERANK_MAX_LENGTH anyway; cut early so whole files are not tokenised.
+        text = truncate_to_max_tokens(chunks[i].text, config.RERANK_MAX_LENGTH, chunks[i].metadata)
+        texts.append(text)
+        keys.append(_score_key(qhash, text, index_version))
+        cached = _SCORES.get(keys[i])
+        if cached is not None:
+            scores[i] = cached
+        else:
+            todo.append(i)
+        i += 1
+
+    if todo:
+        model = get_cross_encoder()
+        pairs = [(question, texts[i]) for i in todo]
+        predicted = model.predict(pairs, batch_size=config.RERANK_BATCH_SIZE, show_progress_bar=False)
+
+        j = 0
+        while j < len(todo):
+            i = todo[j]
+            scores[i] = float(predicted[j])
+            _SCORES.put(keys[i], scores[i])
+            j += 1
+
+    return scores, len(chunks) - len(todo)
+
+
+def rerank(question, chunks, top_k, index_version=None):
+    """
+    Reorder chunks by cross-encoder score and keep the top_k. Each kept chunk gets
+    its cross-encoder score as rerank_score; score stays the retrieval distance.
+    """
+    if not chunks:
+        return []
+
+    t0 = time.perf_counter()
+    scores, hits = score_pairs(question, chunks, index_version)
+
+    order = sorted(range(len(chunks)), key=lambda i: (-scores[i], i))
+    out = []
+    for i in order[:top_k]:
+        chunk = chunks[i]
+        chunk.rerank_score = scores[i]
+        out.append(chunk)
+
+    ms = int((time.perf_counter() - t0) * 1000)
+    print("[RERANK] candidates=" + str(len(chunks)) + " kept=" + str(len(out)) + " cached=" + str(hits) + " ms=" + str(ms))
+    return out
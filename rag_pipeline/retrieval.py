@@ -1,14 +1,19 @@
 import config
-import re
 from rag_pipeline.ingestion import DocumentChunk
+from rag_pipeline.embedding import embed_texts
+from rag_pipeline.dedup import collapse_duplicate_hits
+from rag_pipeline.text_index import has_offsets, truncate_with_index
+from tools.tokens import TOKEN_RE as _TOKEN_RE
 
 
-_TOKEN_RE = re.compile(r"[A-Za-z0-9_]+|[^\s]", re.UNICODE)
-
-def truncate_to_max_tokens(text, max_tokens):
+def truncate_to_max_tokens(text, max_tokens, meta=None):
     if not text:
         return text
 
+    # Chunks indexed at ingest carry token checkpoints: no full re-tokenisation.
+    if has_offsets(meta) and meta.get("ix_chars") == len(text):
+        return truncate_with_index(text, meta, max_tokens)
+
     count = 0
     for m in _TOKEN_RE.finditer(text):
         count += 1
@@ -17,9 +22,56 @@ def truncate_to_max_tokens(text, max_tokens):
 
     return text
 
-def retrieve_top_k(collection, query, top_k, scope=None):
+def _query_metadatas(collection, query_args, n_results, where):
+    res = collection.query(n_results=n_results, where=where, include=["metadatas"], **query_args)
+    if not res or not res.get("metadatas") or not res["metadatas"][0]:
+        return []
+    return [m or {} for m in res["metadatas"][0]]
+
+
+def _hierarchical_filter(collection, query_args, where_filter, scope):
+    """
+    Narrow the chunk search to the best files of the best packages:
+    top HIER_TOP_PACKAGES pkg_summary docs, then top HIER_TOP_FILES file_summary
+    docs within them. Returns the narrowed where filter, or None when the index
+    has no summaries (built without INDEX_SUMMARIES).
+    """
+    metas = _query_metadatas(collection, query_args, config.HIER_TOP_PACKAGES, {"type": "pkg_summary"})
+    packages = [m.get("package") for m in metas if m.get("package") is not None]
+    if not packages:
+        print("[HIER] no package summaries in the index (set INDEX_SUMMARIES = True and rebuild); searching all chunks")
+        return None
+
+    metas = _query_metadatas(
+        collection, query_args, config.HIER_TOP_FILES,
+        {"$and": [{"type": "file_summary"}, {"package": {"$in": packages}}]},
+    )
+    files = [m.get("source") for m in metas if m.get("source")]
+    print("[HIER] packages=" + ",".join(packages) + " files=" + str(len(files)))
+    if not files:
+        return None
+
+    in_files = {"source": {"$in": files}}
+    if scope == "both":
+        # README paragraphs belong to no package; keep them searchable.
+        return {"$or": [{"$and": [{"type": "code"}, in_files]}, {"type": "text"}]}
+    return {"$and": [where_filter, in_files]}
+
+
+def retrieve_top_k(collection, query, top_k, scope=None, query_embedding=None, max_tokens=None):
+    """
+    Top-k chunks for query within scope. Pass query_embedding to reuse an
+    already computed (e.g. cached) embedding instead of embedding query again.
+    Each chunk is cut to max_tokens (default MAX_CANDIDATE_TOKENS; 0 keeps it whole).
+    With RETRIEVAL_MODE = "hierarchical", packages and then files are picked first
+    and only their chunks are searched. Hits with the same content are collapsed into
+    one whose "duplicates" metadata lists the other paths.
+    """
     if top_k < 1:
         return []
+
+    if max_tokens is None:
+        max_tokens = config.MAX_CANDIDATE_TOKENS
     
     if scope is None:
         scope = config.RETRIEVAL_SCOPE
@@ -29,11 +81,28 @@ def retrieve_top_k(collection, query, top_k, scope=None):
     else:
         where_filter = {"type": scope}
 
+    hierarchical = getattr(config, "RETRIEVAL_MODE", "flat") == "hierarchical" and scope != "text"
+    if query_embedding is None and hierarchical:
+        # Embed once for all three stages.
+        query_embedding = embed_texts([query])[0]
+
+    if query_embedding is not None:
+        query_args = {"query_embeddings": [[float(x) for x in query_embedding]]}
+    else:
+        query_args = {"query_texts": [query]}
+
+    if hierarchical:
+        narrowed = _hierarchical_filter(collection, query_args, where_filter, scope)
+        if narrowed is not None:
+            where_filter = narrowed
+
+    # With dedup, a few extra hits so that collapsing duplicates still leaves top_k.
+    extra = config.DEDUP_QUERY_EXTRA if config.DEDUP_ENABLED else 0
     results = collection.query(
-        query_texts=[query],
-        n_results=top_k,
+        n_results=top_k + extra,
         where=where_filter,
-        include=["documents", "metadatas", "distances"]
+        include=["documents", "metadatas", "distances"],
+        **query_args
     )
 
     chunks = []
@@ -54,8 +123,9 @@ def retrieve_top_k(collection, query, top_k, scope=None):
     i = 0
     while i < len(docs):
         doc_text = docs[i]
-        doc_text = truncate_to_max_tokens(doc_text, config.MAX_CANDIDATE_TOKENS)
         meta = metas[i] if i < len(metas) else {}
+        if max_tokens:
+            doc_text = truncate_to_max_tokens(doc_text, max_tokens, meta)
         dist = dists[i] if i < len(dists) else None
 
         chunk_id = meta.get("source", "")
@@ -65,4 +135,6 @@ def retrieve_top_k(collection, query, top_k, scope=None):
 
         i += 1
 
+    if config.DEDUP_ENABLED:
+        chunks = collapse_duplicate_hits(chunks)[:top_k]
     return chunks
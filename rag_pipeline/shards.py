@@ -0,0 +1,312 @@
+"""
+Multi-repository mode: one index shard per entry of config.REPOS.
+
+Each shard is a normal versioned index (its own persist dir under SHARDS_DIR, own
+alias file and dependency graph), built by its own worker process, so adding or
+rebuilding one repository never touches the others. Queries go through
+ShardedCollection, which fans a query out to every shard concurrently and merges
+the hits by distance. Ids and "source" are prefixed with "<shard>:" so
+citations and graph lookups stay unambiguous across repositories.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import config
+from rag_pipeline.ingestion import ingest_repository
+from rag_pipeline.embedding import embed_and_store, load_collection, get_embedding_fn, _store_persist_dir
+from rag_pipeline.build_pipeline import build_index_pipelined
+
+SHARD_SEP = ":"
+
+
+def shard_names():
+    return sorted(getattr(config, "REPOS", {}) or {})
+
+
+def prefixed(shard, value):
+    return shard + SHARD_SEP + value
+
+
+def split_prefixed(value):
+    """("shard", "rest") for a prefixed id/source, or (None, value) when unprefixed."""
+    shard, sep, rest = str(value).partition(SHARD_SEP)
+    if sep and shard in (getattr(config, "REPOS", {}) or {}):
+        return shard, rest
+    return None, value
+
+
+def shard_graph_path(shard):
+    return os.path.join(_store_persist_dir(shard), "dep_graph.json")
+
+
+def _build_shard(shard, repo_path, rebuild):
+    # Runs in a worker process: each shard ingests, embeds and swaps independently.
+    # (graph_expansion imports this module, hence the local import)
+    from rag_pipeline.graph_expansion import persist_dependency_graphs
+
+    t0 = time.perf_counter()
+    if config.PIPELINED_BUILD:
+        collection = build_index_pipelined(repo_path, reset=rebuild, shard=shard)
+    else:
+        docs = ingest_repository(repo_path)
+        collection = embed_and_store(docs, reset=rebuild, shard=shard)
+    persist_dependency_graphs(repo_path, shard_graph_path(shard))
+    return shard, collection.count(), time.perf_counter() - t0
+
+
+def build_shards(rebuild=False, only=None):
+    """Build every shard (or the names in only) in parallel worker processes."""
+    names = [n for n in shard_names() if not only or n in only]
+    if not names:
+        return []
+
+    workers = max(1, min(config.SHARD_BUILD_WORKERS, len(names)))
+    results = []
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for name in names:
+            futures[pool.submit(_build_shard, name, config.REPOS[name], rebuild)] = name
+        for fut in futures:
+            name = futures[fut]
+            try:
+                shard, count, secs = fut.result()
+                results.append((shard, count))
+                print("[SHARD] built " + shard + " count=" + str(count) + " secs=" + "%.1f" % secs)
+            except Exception as e:
+                failed.append(name)
+                print("[SHARD] build failed for " + name + ": " + str(e))
+
+    if failed:
+        print("[SHARD] failed shards keep serving their previous version:", ", ".join(failed))
+    return results
+
+
+def _source_for_shard(cond, shard):
+    """(condition, possible) for a "source" condition; condition None = matches everything."""
+    if isinstance(cond, dict):
+        if "$in" in cond or "$nin" in cond:
+            op = "$in" if "$in" in cond else "$nin"
+            values = []
+            for v in cond[op]:
+                s, rest = split_prefixed(v)
+                if s is None or s == shard:
+                    values.append(rest)
+            if not values:
+                return None, op == "$nin"
+            return {op: values}, True
+        if "$ne" in cond:
+            s, rest = split_prefixed(cond["$ne"])
+            if s is not None and s != shard:
+                return None, True
+            return {"$ne": rest}, True
+        if "$eq" not in cond:
+            return cond, True
+        value = cond["$eq"]
+    else:
+        value = cond
+
+    s, rest = split_prefixed(value)
+    if s is not None and s != shard:
+        return None, False
+    return rest, True
+
+
+def _where_for_shard(where, shard):
+    """
+    Rewrite a where filter for one shard: prefixed "source" values are kept (unprefixed)
+    only if they belong to shard. Returns (filter, possible): filter None matches
+    everything; possible=False means no document of this shard can match.
+    """
+    if not where:
+        return None, True
+
+    out = {}
+    for key, cond in where.items():
+        if key in ("$and", "$or"):
+            parts = []
+            always = False
+            for sub in cond:
+                f, ok = _where_for_shard(sub, shard)
+                if not ok:
+                    if key == "$and":
+                        return None, False
+                    continue
+                if f is None:
+                    always = True
+                    continue
+                parts.append(f)
+            if key == "$or":
+                if always:
+                    continue
+                if not parts:
+                    return None, False
+            if len(parts) == 1:
+                for k, v in parts[0].items():
+                    out[k] = v
+            elif parts:
+                out[key] = parts
+            continue
+
+        if key == "source":
+            cond, ok = _source_for_shard(cond, shard)
+            if not ok:
+                return None, False
+            if cond is None:
+                continue
+        out[key] = cond
+
+    if not out:
+        return None, True
+    if len(out) > 1:
+        # Chroma wants one top-level key per filter.
+        return {"$and": [{k: v} for k, v in out.items()]}, True
+    return out, True
+
+
+def _prefix_meta(shard, meta):
+    meta = dict(meta or {})
+    if "source" in meta:
+        meta["source"] = prefixed(shard, meta["source"])
+    if meta.get("duplicates"):
+        meta["duplicates"] = ",".join(prefixed(shard, d) for d in meta["duplicates"].split(","))
+    if meta.get("duplicate_of"):
+        meta["duplicate_of"] = prefixed(shard, meta["duplicate_of"])
+    meta["shard"] = shard
+    return meta
+
+
+class ShardedCollection:
+    """Read-side view over all shards with the collection methods QA uses (count/query/get)."""
+
+    def __init__(self, collections):
+        self.collections = collections  # {shard: collection}
+        self.name = ",".join(sorted(collections))
+
+    def count(self):
+        total = 0
+        for c in self.collections.values():
+            total += c.count()
+        return total
+
+    def _fan_out(self, calls):
+        workers = max(1, min(config.SHARD_QUERY_WORKERS, len(calls)))
+        if workers == 1:
+            return [(shard, fn()) for shard, fn in calls]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(shard, pool.submit(fn)) for shard, fn in calls]
+            return [(shard, fut.result()) for shard, fut in futures]
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, where=None, include=None):
+        if include is None:
+            include = ["documents", "metadatas", "distances"]
+        if query_embeddings is None:
+            # Embed once here instead of once per shard.
+            query_embeddings = [[float(x) for x in v] for v in get_embedding_fn()(list(query_texts))]
+
+        shard_include = list(include)
+        if "distances" not in shard_include:
+            shard_include.append("distances")
+
+        calls = []
+        for shard in sorted(self.collections):
+            f, ok = _where_for_shard(where, shard)
+            if not ok:
+                continue
+            collection = self.collections[shard]
+
+            def call(collection=collection, f=f):
+                return collection.query(
+                    query_embeddings=query_embeddings, n_results=n_results, where=f, include=shard_include
+                )
+
+            calls.append((shard, call))
+
+        n_queries = len(query_embeddings)
+        merged = [[] for _ in range(n_queries)]
+        for shard, res in self._fan_out(calls):
+            q = 0
+            while q < n_queries:
+                ids = res["ids"][q] if res.get("ids") else []
+                i = 0
+                while i < len(ids):
+                    row = {"ids": prefixed(shard, ids[i]), "distances": res["distances"][q][i]}
+                    if "documents" in include:
+                        row["documents"] = res["documents"][q][i]
+                    if "metadatas" in include:
+                        row["metadatas"] = _prefix_meta(shard, res["metadatas"][q][i])
+                    merged[q].append(row)
+                    i += 1
+                q += 1
+
+        out = {"ids": []}
+        for key in include:
+            out[key] = []
+        for rows in merged:
+            rows.sort(key=lambda r: r["distances"])
+            rows = rows[:n_results]
+            out["ids"].append([r["ids"] for r in rows])
+            for key in include:
+                out[key].append([r.get(key) for r in rows])
+        return out
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None):
+        if include is None:
+            include = ["documents", "metadatas"]
+
+        by_shard = {}
+        if ids is not None:
+            for i in ids:
+                shard, rest = split_prefixed(i)
+                if shard in self.collections:
+                    by_shard.setdefault(shard, []).append(rest)
+        else:
+            for shard in self.collections:
+                by_shard[shard] = None
+
+        calls = []
+        for shard in sorted(by_shard):
+            f, ok = _where_for_shard(where, shard)
+            if not ok:
+                continue
+            collection = self.collections[shard]
+            shard_ids = by_shard[shard]
+
+            def call(collection=collection, shard_ids=shard_ids, f=f):
+                return collection.get(ids=shard_ids, where=f, include=include)
+
+            calls.append((shard, call))
+
+        out = {"ids": []}
+        for key in include:
+            out[key] = []
+        for shard, res in self._fan_out(calls):
+            i = 0
+            while i < len(res.get("ids") or []):
+                out["ids"].append(prefixed(shard, res["ids"][i]))
+                if "documents" in include:
+                    out["documents"].append(res["documents"][i])
+                if "metadatas" in include:
+                    out["metadatas"].append(_prefix_meta(shard, res["metadatas"][i]))
+                i += 1
+
+        start = offset or 0
+        end = start + limit if limit else None
+        for key in out:
+            out[key] = out[key][start:end]
+        return out
+
+
+def open_sharded_collection():
+    collections = {}
+    for name in shard_names():
+        c = load_collection(name)
+        if c.count() > 0:
+            collections[name] = c
+        else:
+            print("[SHARD] " + name + " has no index yet; run build")
+    if not collections:
+        return None
+    return ShardedCollection(collections)
@@ -0,0 +1,289 @@
+"""
+Portable index snapshots: `main.py index export|import`.
+
+An export is one zip archive with:
+
+  manifest.json   format, embedding model/backend, dimension, row count, source
+                  index version, and the sha256 + size of every other member
+  records.jsonl   one {"id", "document", "metadata"} per row (deflate-compressed)
+  vectors.f16     row-major float16 embeddings, same row order as records.jsonl
+  dep_graph.json  dependency graphs for graph expansion (when present)
+
+Import verifies every checksum, bulk-upserts the stored vectors into a new
+collection version (no re-embedding) and swaps the alias to it, so a fresh node
+can serve in seconds instead of re-running the full build.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import zipfile
+
+import numpy as np
+
+import config
+from rag_pipeline.embedding import (
+    _collection_metadata,
+    _open_client,
+    _store_persist_dir,
+    current_index_version,
+    get_embedding_fn,
+    load_collection,
+)
+from rag_pipeline.index_versions import new_version_name, write_alias, collect_garbage_async
+from rag_pipeline.qa_cache import invalidate_answer_cache
+from rag_pipeline.shards import shard_graph_path
+
+SNAPSHOT_FORMAT = 1
+MANIFEST = "manifest.json"
+RECORDS = "records.jsonl"
+VECTORS = "vectors.f16"
+GRAPH = "dep_graph.json"
+
+_CHUNK_BYTES = 1 << 20
+
+
+def _graph_path(shard):
+    if shard is not None:
+        return shard_graph_path(shard)
+    return config.DEP_GRAPH_PATH
+
+
+def _model_info():
+    return {
+        "embedding_backend": getattr(config, "EMBEDDING_BACKEND", "sentence-transformers"),
+        "embedding_model": config.EMBEDDING_MODEL_NAME,
+        "space": config.CHROMA_SPACE,
+    }
+
+
+class _HashingWriter:
+    """Write-through wrapper that tracks sha256 and size of a zip member."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha.update(data)
+        self.size += len(data)
+        self.f.write(data)
+
+    def entry(self):
+        return {"sha256": self.sha.hexdigest(), "bytes": self.size}
+
+
+def export_index(out_path, shard=None):
+    """Write the current collection (of shard, if given) to out_path; returns the manifest."""
+    t0 = time.perf_counter()
+    collection = load_collection(shard)
+    total = collection.count()
+    if total == 0:
+        print("Index is empty. Run build first.")
+        return None
+
+    page = max(1, config.SNAPSHOT_PAGE_SIZE)
+    files = {}
+    dim = 0
+    rows = 0
+
+    parent = os.path.dirname(out_path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    tmp = out_path + ".tmp"
+
+    zf = zipfile.ZipFile(tmp, "w", allowZip64=True)
+    try:
+        # Records and vectors are paged out of the store in the same order.
+        rec_tmp = tmp + ".records"
+        vec_tmp = tmp + ".vectors"
+        rec_f = open(rec_tmp, "wb")
+        vec_f = open(vec_tmp, "wb")
+        rec_w = _HashingWriter(rec_f)
+        vec_w = _HashingWriter(vec_f)
+        try:
+            offset = 0
+            while offset < total:
+                got = collection.get(limit=page, offset=offset, include=["documents", "metadatas", "embeddings"])
+                ids = got.get("ids") or []
+                if not ids:
+                    break
+                vectors = np.asarray(got["embeddings"], dtype=np.float32)
+                if dim == 0:
+                    dim = vectors.shape[1]
+
+                lines = []
+                i = 0
+                while i < len(ids):
+                    lines.append(json.dumps({
+                        "id": ids[i],
+                        "document": got["documents"][i],
+                        "metadata": got["metadatas"][i] or {},
+                    }))
+                    i += 1
+                rec_w.write(("\n".join(lines) + "\n").encode("utf-8"))
+                vec_w.write(vectors.astype(np.float16).tobytes())
+
+                rows += len(ids)
+                offset += len(ids)
+        finally:
+            rec_f.close()
+            vec_f.close()
+
+        zf.write(rec_tmp, RECORDS, compress_type=zipfile.ZIP_DEFLATED)
+        zf.write(vec_tmp, VECTORS, compress_type=zipfile.ZIP_STORED)
+        os.remove(rec_tmp)
+        os.remove(vec_tmp)
+        files[RECORDS] = rec_w.entry()
+        files[VECTORS] = vec_w.entry()
+
+        graph_path = _graph_path(shard)
+        if os.path.isfile(graph_path):
+            f = open(graph_path, "rb")
+            data = f.read()
+            f.close()
+            zf.writestr(GRAPH, data, compress_type=zipfile.ZIP_DEFLATED)
+            files[GRAPH] = {"sha256": hashlib.sha256(data).hexdigest(), "bytes": len(data)}
+
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "created": time.time(),
+            "source_version": current_index_version(shard),
+            "shard": shard,
+            "count": rows,
+            "dim": dim,
+            "vector_dtype": "float16",
+            "files": files,
+        }
+        manifest.update(_model_info())
+        zf.writestr(MANIFEST, json.dumps(manifest, indent=2))
+    finally:
+        zf.close()
+    os.replace(tmp, out_path)
+
+    print(
+        "[SNAPSHOT] exported rows=" + str(rows) + " dim=" + str(dim) + " -> " + out_path
+        + " (" + "%.1f" % (os.path.getsize(out_path) / 1e6) + " MB)"
+    )
+    print("[TIMING] index_export_ms=" + str(int((time.perf_counter() - t0) * 1000)))
+    return manifest
+
+
+def _verify_member(zf, name, entry):
+    sha = hashlib.sha256()
+    size = 0
+    f = zf.open(name)
+    while True:
+        data = f.read(_CHUNK_BYTES)
+        if not data:
+            break
+        sha.update(data)
+        size += len(data)
+    f.close()
+    return sha.hexdigest() == entry["sha256"] and size == entry["bytes"]
+
+
+def import_index(path, shard=None, force=False):
+    """
+    Load a snapshot into a new collection version and swap the alias to it.
+    Refuses snapshots made with a different embedding model/backend unless force,
+    since query embeddings would not be comparable with the stored vectors.
+    """
+    t0 = time.perf_counter()
+    zf = zipfile.ZipFile(path, "r")
+    try:
+        manifest = json.loads(zf.read(MANIFEST).decode("utf-8"))
+        if manifest.get("format") != SNAPSHOT_FORMAT:
+            print("[SNAPSHOT] unsupported snapshot format:", manifest.get("format"))
+            return None
+
+        mismatch = []
+        for key, value in _model_info().items():
+            if manifest.get(key) != value:
+                mismatch.append(key + "=" + str(manifest.get(key)) + " (config: " + str(value) + ")")
+        if mismatch and not force:
+            print("[SNAPSHOT] snapshot does not match this config: " + "; ".join(mismatch))
+            print("[SNAPSHOT] rebuild instead, or pass --force to import anyway")
+            return None
+
+        for name, entry in manifest["files"].items():
+            if not _verify_member(zf, name, entry):
+                print("[SNAPSHOT] checksum mismatch in " + name + "; archive is corrupt")
+                return None
+
+        client = _open_client(shard)
+        persist_dir = _store_persist_dir(shard)
+        base_name = config.CHROMA_COLLECTION_NAME
+        name = new_version_name(base_name)
+        collection = client.create_collection(
+            name=name,
+            embedding_function=get_embedding_fn(),
+            metadata=_collection_metadata(),
+        )
+
+        try:
+            dim = manifest["dim"]
+            batch = max(1, config.SNAPSHOT_BATCH_SIZE)
+            row_bytes = dim * 2
+            rec_f = zf.open(RECORDS)
+            vec_f = zf.open(VECTORS)
+            try:
+                done = 0
+                while True:
+                    ids, documents, metadatas = [], [], []
+                    while len(ids) < batch:
+                        line = rec_f.readline()
+                        if not line:
+                            break
+                        rec = json.loads(line.decode("utf-8"))
+                        ids.append(rec["id"])
+                        documents.append(rec["document"])
+                        metadatas.append(rec["metadata"])
+                    if not ids:
+                        break
+
+                    raw = vec_f.read(row_bytes * len(ids))
+                    vectors = np.frombuffer(raw, dtype=np.float16).reshape(len(ids), dim).astype(np.float32)
+                    collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=vectors)
+                    done += len(ids)
+            finally:
+                rec_f.close()
+                vec_f.close()
+
+            if done != manifest["count"]:
+                print("[SNAPSHOT] expected " + str(manifest["count"]) + " rows, read " + str(done) + "; keeping the current index")
+                client.delete_collection(name=name)
+                return None
+
+            if GRAPH in manifest["files"]:
+                graph_path = _graph_path(shard)
+                parent = os.path.dirname(graph_path)
+                if parent:
+                    os.makedirs(parent, exist_ok=True)
+                tmp = graph_path + ".tmp"
+                src = zf.open(GRAPH)
+                dst = open(tmp, "wb")
+                shutil.copyfileobj(src, dst)
+                dst.close()
+                src.close()
+                os.replace(tmp, graph_path)
+        except Exception:
+            # Never leave a half-filled version behind; the alias still points at the old one.
+            try:
+                client.delete_collection(name=name)
+            except Exception:
+                pass
+            raise
+    finally:
+        zf.close()
+
+    write_alias(persist_dir, base_name, name)
+    collect_garbage_async(client, base_name, name, config.INDEX_KEEP_VERSIONS)
+    invalidate_answer_cache()
+
+    print("[SNAPSHOT] imported rows=" + str(done) + " into " + base_name + " -> " + name + " (from " + str(manifest.get("source_version")) + ")")
+    print("[TIMING] index_import_ms=" + str(int((time.perf_counter() - t0) * 1000)))
+    return collection
@@ -0,0 +1,107 @@
+"""
+Package- and file-level summary documents for hierarchical retrieval.
+
+A file summary lists the file's package, type declarations and public/protected
+method signatures. A package summary lists its classes, their declarations and up
+to SUMMARY_README_PARAGRAPHS README paragraphs that mention the package or one of
+its classes. Both are embedded next to the regular chunks with their own "type"
+(file_summary / pkg_summary), so flat retrieval never sees them.
+"""
+
+import re
+
+import config
+
+TYPE_DECL_RE = re.compile(
+    r"^[ \t]*(?:(?:public|protected|private|abstract|final|static|sealed|strictfp)\s+)*"
+    r"(?:class|interface|enum|record|@interface)\s+\w+[^{;]*",
+    re.MULTILINE,
+)
+METHOD_RE = re.compile(
+    r"^[ \t]*(?:public|protected)\s+(?:(?:static|final|abstract|synchronized|default|native)\s+)*"
+    r"[\w<>\[\],.?\s]+?\s+\w+\s*\([^)]*\)",
+    re.MULTILINE,
+)
+_WS_RE = re.compile(r"\s+")
+
+_MAX_SIGNATURES = 40
+_MAX_README_CHARS = 400
+
+DEFAULT_PACKAGE = "(default)"
+
+
+def extract_signatures(code):
+    """Type declarations followed by public/protected method signatures, whitespace-collapsed."""
+    out = []
+    for m in TYPE_DECL_RE.finditer(code):
+        out.append(_WS_RE.sub(" ", m.group(0)).strip())
+    for m in METHOD_RE.finditer(code):
+        sig = _WS_RE.sub(" ", m.group(0)).strip()
+        if " new " in " " + sig or sig.startswith(("return ", "throw ")):
+            continue
+        out.append(sig)
+        if len(out) >= _MAX_SIGNATURES:
+            break
+    return out
+
+
+class FileSummaryInfo:
+    def __init__(self, rel_path, package, class_name, signatures):
+        self.rel_path = rel_path
+        self.package = package
+        self.class_name = class_name
+        self.signatures = signatures
+
+
+def _readme_mentions(readme_chunks, package, class_names, limit):
+    last = package.rsplit(".", 1)[-1] if package else ""
+    words = set(class_names)
+    if last and len(last) >= 3:
+        words.add(last)
+    if not words:
+        return []
+
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(w) for w in sorted(words)) + r")\b")
+    out = []
+    for chunk in readme_chunks:
+        text = chunk.text
+        if pattern.search(text):
+            out.append(text[:_MAX_README_CHARS])
+            if len(out) >= limit:
+                break
+    return out
+
+
+def build_summary_documents(file_infos, readme_chunks):
+    """(chunk_id, text, metadata) for one file_summary per file and one pkg_summary per package."""
+    docs = []
+    by_pkg = {}
+
+    for info in file_infos:
+        pkg = info.package or DEFAULT_PACKAGE
+        by_pkg.setdefault(pkg, []).append(info)
+
+        text = "File: " + info.rel_path + "\nPackage: " + pkg + "\nClass: " + info.class_name + "\n"
+        if info.signatures:
+            text += "\n".join(info.signatures) + "\n"
+        meta = {"source": info.rel_path, "type": "file_summary", "package": pkg, "class": info.class_name}
+        docs.append(("file_summary::" + info.rel_path, text, meta))
+
+    for pkg in sorted(by_pkg.keys()):
+        infos = sorted(by_pkg[pkg], key=lambda x: x.rel_path)
+        names = [i.class_name for i in infos]
+
+        text = "Package: " + pkg + "\nClasses: " + ", ".join(names) + "\n"
+        for i in infos:
+            if i.signatures:
+                text += i.signatures[0] + "\n"
+        mentions = _readme_mentions(
+            readme_chunks, "" if pkg == DEFAULT_PACKAGE else pkg, names, config.SUMMARY_README_PARAGRAPHS
+        )
+        if mentions:
+            text += "\n" + "\n\n".join(mentions) + "\n"
+
+        meta = {"source": pkg, "type": "pkg_summary", "package": pkg, "files": len(infos)}
+        docs.append(("pkg_summary::" + pkg, text, meta))
+
+    return docs
@@ -0,0 +1,224 @@
+"""
+Per-chunk text index computed once at ingest and stored in chunk metadata, so
+query-time code does not re-tokenise or re-scan retrieved documents:
+
+  ix_chars      length of the indexed text
+  ix_tokens     number of TOKEN_RE tokens
+  ix_tok_ckpt   base64 uint32 end offsets of every CHECKPOINT_STRIDE-th token
+  ix_lines      base64 uint32 start offsets of every line
+  ix_terms      "term:line ..." lowercase identifier terms (plus camelCase /
+                snake_case parts) with the first line they occur on
+
+Chroma metadata only holds scalars, hence the base64 / space-joined encodings.
+"""
+
+import base64
+import bisect
+import re
+from array import array
+from functools import lru_cache
+
+from tools.tokens import TOKEN_RE
+
+CHECKPOINT_STRIDE = 32
+OFFSET_KEYS = ("ix_chars", "ix_tokens", "ix_tok_ckpt", "ix_lines")
+
+TERM_RE = re.compile(r"[a-zA-Z_][a-zA-Z0-9_]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z0-9]+")
+
+
+def _encode_u32(values):
+    return base64.b64encode(array("I", values).tobytes()).decode("ascii")
+
+
+@lru_cache(maxsize=512)
+def _decode_u32(data):
+    arr = array("I")
+    arr.frombytes(base64.b64decode(data))
+    return arr
+
+
+def _term_variants(word):
+    low = word.lower()
+    out = [low]
+    for part in word.split("_"):
+        for sub in _CAMEL_RE.findall(part):
+            sub = sub.lower()
+            if len(sub) >= 3 and sub != low:
+                out.append(sub)
+    return out
+
+
+def build_text_index(text):
+    ckpt = []
+    n = 0
+    for m in TOKEN_RE.finditer(text):
+        n += 1
+        if n % CHECKPOINT_STRIDE == 0:
+            ckpt.append(m.end())
+
+    line_starts = [0]
+    terms = {}
+    line_no = 0
+    pos = 0
+    for line in text.split("\n"):
+        if line_no > 0:
+            line_starts.append(pos)
+        for word in TERM_RE.findall(line):
+            for t in _term_variants(word):
+                if t not in terms:
+                    terms[t] = line_no
+        pos += len(line) + 1
+        line_no += 1
+
+    parts = []
+    for t, ln in terms.items():
+        parts.append(t + ":" + str(ln))
+
+    return {
+        "ix_chars": len(text),
+        "ix_tokens": n,
+        "ix_tok_ckpt": _encode_u32(ckpt),
+        "ix_lines": _encode_u32(line_starts),
+        "ix_terms": " ".join(parts),
+    }
+
+
+def has_offsets(meta):
+    return bool(meta) and "ix_tok_ckpt" in meta and "ix_tokens" in meta
+
+
+class TermIndex:
+    """
+    Decoded ix_terms: exact lookups, prefix lookups over the sorted terms, and
+    substring lookups through a trigram map of the terms (built on first use and
+    kept with the cached TermIndex).
+    """
+
+    def __init__(self, data):
+        self.lines = {}
+        for item in data.split(" "):
+            if not item:
+                continue
+            t, _, ln = item.rpartition(":")
+            self.lines[t] = int(ln)
+        self.sorted_terms = sorted(self.lines.keys())
+        self._grams = None
+        self._short = None
+
+    def find(self, token):
+        """First line of token, or of the smallest term it prefixes (e.g. zip -> zip4j); else None."""
+        ln = self.lines.get(token)
+        if ln is not None:
+            return ln
+        i = bisect.bisect_left(self.sorted_terms, token)
+        if i < len(self.sorted_terms) and self.sorted_terms[i].startswith(token):
+            return self.lines[self.sorted_terms[i]]
+        return None
+
+    def __contains__(self, token):
+        return self.find(token) is not None
+
+    def _build_grams(self):
+        # trigram -> terms containing it; substrings shorter than 3 -> first line
+        grams = {}
+        short = {}
+        for t in self.sorted_terms:
+            ln = self.lines[t]
+            i = 0
+            while i < len(t):
+                for k in (1, 2):
+                    sub = t[i : i + k]
+                    if len(sub) == k and (sub not in short or ln < short[sub]):
+                        short[sub] = ln
+                if i + 3 <= len(t):
+                    grams.setdefault(t[i : i + 3], set()).add(t)
+                i += 1
+        self._grams = grams
+        self._short = short
+
+    def first_line(self, token):
+        """
+        First line on which `token in line.lower()` for a word token (2+ characters)
+        of the indexed text: every such match lies inside one indexed term. None if absent.
+        """
+        if self._grams is None:
+            self._build_grams()
+        if len(token) < 3:
+            return self._short.get(token)
+        cands = None
+        i = 0
+        while i + 3 <= len(token):
+            got = self._grams.get(token[i : i + 3])
+            if not got:
+                return None
+            if cands is None or len(got) < len(cands):
+                cands = got
+            i += 1
+        best = None
+        for t in cands:
+            if token in t and (best is None or self.lines[t] < best):
+                best = self.lines[t]
+        return best
+
+    def has_substring(self, token):
+        """Same answer as `token in text.lower()` for a word token (2+ characters) of the indexed text."""
+        if token in self.lines:
+            return True
+        return self.first_line(token) is not None
+
+
+@lru_cache(maxsize=512)
+def _decode_terms(data):
+    return TermIndex(data)
+
+
+def term_lines(meta):
+    """TermIndex for an indexed chunk, or None if the chunk was not indexed."""
+    if not meta or "ix_terms" not in meta:
+        return None
+    return _decode_terms(meta["ix_terms"])
+
+
+def truncate_with_index(text, meta, max_tokens):
+    """
+    Same result as scanning text for its first max_tokens tokens, but starts from
+    the nearest stored checkpoint and scans fewer than CHECKPOINT_STRIDE tokens.
+    """
+    if meta["ix_tokens"] < max_tokens:
+        return text
+
+    ckpt = _decode_u32(meta["ix_tok_ckpt"])
+    j = max_tokens // CHECKPOINT_STRIDE
+    if j > len(ckpt):
+        j = len(ckpt)
+
+    pos = 0
+    count = 0
+    if j > 0:
+        pos = ckpt[j - 1]
+        count = j * CHECKPOINT_STRIDE
+        if count == max_tokens:
+            return text[:pos]
+
+    for m in TOKEN_RE.finditer(text, pos):
+        count += 1
+        if count >= max_tokens:
+            return text[: m.end()]
+    return text
+
+
+def line_slice(text, meta, lo, hi):
+    """Lines [lo, hi) of text using the stored line offsets (clamped to text length)."""
+    starts = _decode_u32(meta["ix_lines"])
+    if lo >= len(starts):
+        return ""
+    start = starts[lo]
+    end = starts[hi] - 1 if hi < len(starts) else len(text)
+    if end > len(text):
+        end = len(text)
+    return text[start:end]
+
+
+def line_count(meta):
+    return len(_decode_u32(meta["ix_lines"]))
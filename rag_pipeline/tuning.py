@@ -0,0 +1,290 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import config
+from rag_pipeline.embedding import embed_texts
+from rag_pipeline.ingestion import ingest_repository
+
+
+def _normalise_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _load_queries(question_file, documents, n):
+    """Questions from a file (one per line); otherwise the opening of sampled chunks."""
+    if question_file:
+        f = open(question_file, "r", encoding="utf-8")
+        lines = [line.strip() for line in f if line.strip()]
+        f.close()
+        return lines[:n] if n else lines
+
+    rng = random.Random(0)
+    picked = rng.sample(documents, min(n, len(documents)))
+    return [d.text[:300] for d in picked]
+
+
+def exact_top_k(corpus, queries, k):
+    """Brute-force ground truth: row indices of the k most similar corpus vectors per query."""
+    sims = _normalise_rows(queries) @ _normalise_rows(corpus).T
+    k = min(k, corpus.shape[0])
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    out = []
+    i = 0
+    while i < top.shape[0]:
+        row = top[i]
+        out.append([int(x) for x in row[np.argsort(-sims[i][row])]])
+        i += 1
+    return out
+
+
+def recall_at_k(approx, exact):
+    total = 0.0
+    i = 0
+    while i < len(exact):
+        want = set(exact[i])
+        if want:
+            total += len(want.intersection(approx[i])) / float(len(want))
+        i += 1
+    return total / max(1, len(exact))
+
+
+def _percentile(values, pct):
+    xs = sorted(values)
+    if not xs:
+        return 0.0
+    idx = int(round((pct / 100.0) * (len(xs) - 1)))
+    return xs[idx]
+
+
+def _set_search_ef(client, collection, name, metadata, corpus, ef):
+    """Change ef_search in place when Chroma supports it; otherwise rebuild with the new value."""
+    try:
+        collection.modify(configuration={"hnsw": {"ef_search": ef}})
+        return collection
+    except Exception:
+        pass
+
+    client.delete_collection(name=name)
+    metadata = dict(metadata)
+    metadata["hnsw:search_ef"] = ef
+    return _build_collection(client, name, metadata, corpus)
+
+
+def _build_collection(client, name, metadata, corpus):
+    collection = client.create_collection(name=name, metadata=metadata, embedding_function=None)
+    batch = 1000
+    i = 0
+    while i < corpus.shape[0]:
+        end = min(i + batch, corpus.shape[0])
+        collection.add(
+            ids=[str(j) for j in range(i, end)],
+            embeddings=corpus[i:end].tolist(),
+        )
+        i = end
+    return collection
+
+
+def _pick_best(rows, target_recall):
+    """Fastest setting that reaches the target recall; otherwise the most accurate one."""
+    ok = [r for r in rows if r["recall"] >= target_recall]
+    if ok:
+        ok.sort(key=lambda r: (r["mean_ms"], r["build_s"]))
+        return ok[0]
+    rows = sorted(rows, key=lambda r: (-r["recall"], r["mean_ms"]))
+    return rows[0]
+
+
+def write_hnsw_profile(best, k, n_docs, n_queries):
+    path = config.HNSW_PROFILE_PATH
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+
+    data = {
+        "settings": {
+            "hnsw:M": best["M"],
+            "hnsw:construction_ef": best["construction_ef"],
+            "hnsw:search_ef": best["search_ef"],
+        },
+        "measured": {
+            "recall_at_k": round(best["recall"], 4),
+            "k": k,
+            "mean_query_ms": round(best["mean_ms"], 3),
+            "p95_query_ms": round(best["p95_ms"], 3),
+            "build_s": round(best["build_s"], 3),
+            "documents": n_docs,
+            "queries": n_queries,
+        },
+        "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    f = open(path, "w", encoding="utf-8")
+    json.dump(data, f, indent=2)
+    f.close()
+    return path
+
+
+def tune_hnsw(repo_path, question_file=None):
+    """
+    Sweep HNSW M / ef_construction / ef_search against exact brute-force search over
+    the repo's embeddings, print recall@k vs. query latency and build time, and write
+    the chosen settings to config.HNSW_PROFILE_PATH (picked up by new index versions).
+    """
+    import chromadb
+
+    documents = ingest_repository(repo_path)
+    if not documents:
+        print("No documents to tune on.")
+        return None
+
+    k = config.TUNE_RECALL_K
+    t0 = time.perf_counter()
+    corpus = embed_texts([d.text for d in documents])
+    queries = embed_texts(_load_queries(question_file, documents, config.TUNE_NUM_QUERIES))
+    t1 = time.perf_counter()
+    print("[TUNE] documents=" + str(corpus.shape[0]) + " queries=" + str(queries.shape[0]) + " embed_s=" + str(round(t1 - t0, 2)))
+
+    exact = exact_top_k(corpus, queries, k)
+    query_list = queries.tolist()
+
+    client = chromadb.EphemeralClient()
+    rows = []
+    print("M\tef_construction\tef_search\trecall@" + str(k) + "\tmean_ms\tp95_ms\tbuild_s")
+
+    for m in config.TUNE_HNSW_M:
+        for ef_c in config.TUNE_HNSW_CONSTRUCTION_EF:
+            name = "hnsw-tune-" + str(m) + "-" + str(ef_c)
+            metadata = {"hnsw:space": config.CHROMA_SPACE, "hnsw:M": m, "hnsw:construction_ef": ef_c}
+
+            b0 = time.perf_counter()
+            collection = _build_collection(client, name, metadata, corpus)
+            build_s = time.perf_counter() - b0
+
+            for ef_s in config.TUNE_HNSW_SEARCH_EF:
+                collection = _set_search_ef(client, collection, name, metadata, corpus, ef_s)
+
+                approx = []
+                latencies = []
+                for q in query_list:
+                    s = time.perf_counter()
+                    res = collection.query(query_embeddings=[q], n_results=min(k, corpus.shape[0]), include=[])
+                    latencies.append((time.perf_counter() - s) * 1000)
+                    approx.append([int(x) for x in res["ids"][0]])
+
+                row = {
+                    "M": m,
+                    "construction_ef": ef_c,
+                    "search_ef": ef_s,
+                    "recall": recall_at_k(approx, exact),
+                    "mean_ms": sum(latencies) / max(1, len(latencies)),
+                    "p95_ms": _percentile(latencies, 95),
+                    "build_s": build_s,
+                }
+                rows.append(row)
+                print(
+                    str(m) + "\t" + str(ef_c) + "\t" + str(ef_s) + "\t"
+                    + "%.4f" % row["recall"] + "\t" + "%.3f" % row["mean_ms"] + "\t"
+                    + "%.3f" % row["p95_ms"] + "\t" + "%.2f" % row["build_s"]
+                )
+
+            client.delete_collection(name=name)
+
+    best = _pick_best(rows, config.TUNE_TARGET_RECALL)
+    path = write_hnsw_profile(best, k, corpus.shape[0], queries.shape[0])
+    print(
+        "[TUNE] chosen M=" + str(best["M"]) + " ef_construction=" + str(best["construction_ef"])
+        + " ef_search=" + str(best["search_ef"]) + " recall@" + str(k) + "=" + "%.4f" % best["recall"]
+    )
+    print("[TUNE] wrote profile:", path, "(applies to the next build/rebuild)")
+    return best
+
+
+def _file_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return 0
+
+
+def _run_flat_variant(corpus, query_list, k, dtype, truncate_dim, rescore):
+    from rag_pipeline.flat_store import FlatClient
+
+    tmp = tempfile.mkdtemp(prefix="bench_vectors_")
+    try:
+        client = FlatClient(
+            tmp,
+            dtype=dtype,
+            truncate_dim=truncate_dim,
+            keep_full=rescore,
+            rescore_candidates=config.FLAT_RESCORE_CANDIDATES,
+        )
+        collection = client.create_collection("bench", metadata={"hnsw:space": config.CHROMA_SPACE})
+        collection.upsert(ids=[str(i) for i in range(corpus.shape[0])], embeddings=corpus)
+
+        approx = []
+        latencies = []
+        for q in query_list:
+            s = time.perf_counter()
+            res = collection.query(query_embeddings=[q], n_results=k, include=[])
+            latencies.append((time.perf_counter() - s) * 1000)
+            approx.append([int(x) for x in res["ids"][0]])
+
+        scanned = _file_size(os.path.join(tmp, "bench", "vectors.bin"))
+        full = _file_size(os.path.join(tmp, "bench", "vectors_full.bin"))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return approx, latencies, scanned, full
+
+
+def benchmark_vector_storage(repo_path, question_file=None):
+    """
+    Compare compressed flat-index layouts (config.BENCH_VECTOR_VARIANTS) against exact
+    float32 search: bytes of the scanned matrix, recall@k with and without full-precision
+    rescoring of the top config.FLAT_RESCORE_CANDIDATES, and mean query latency.
+    """
+    documents = ingest_repository(repo_path)
+    if not documents:
+        print("No documents to benchmark on.")
+        return []
+
+    k = config.TUNE_RECALL_K
+    corpus = _normalise_rows(embed_texts([d.text for d in documents]))
+    queries = embed_texts(_load_queries(question_file, documents, config.TUNE_NUM_QUERIES))
+    exact = exact_top_k(corpus, queries, k)
+    query_list = list(queries)
+
+    baseline = corpus.shape[0] * corpus.shape[1] * 4
+    print("[BENCH] documents=" + str(corpus.shape[0]) + " dim=" + str(corpus.shape[1]) + " queries=" + str(len(query_list)))
+    print("dtype\tdims\trescore\tscanned_MB\tsaved\tdisk_MB\trecall@" + str(k) + "\tmean_ms")
+
+    rows = []
+    for dtype, truncate_dim in config.BENCH_VECTOR_VARIANTS:
+        lossy = dtype != "float32" or (truncate_dim and truncate_dim < corpus.shape[1])
+        modes = [False, True] if lossy else [False]
+        for rescore in modes:
+            approx, latencies, scanned, full = _run_flat_variant(corpus, query_list, k, dtype, truncate_dim, rescore)
+            row = {
+                "dtype": dtype,
+                "dims": truncate_dim or corpus.shape[1],
+                "rescore": rescore,
+                "scanned_bytes": scanned,
+                "disk_bytes": scanned + full,
+                "saved": 1.0 - scanned / float(max(1, baseline)),
+                "recall": recall_at_k(approx, exact),
+                "mean_ms": sum(latencies) / max(1, len(latencies)),
+            }
+            rows.append(row)
+            print(
+                dtype + "\t" + str(row["dims"]) + "\t" + ("yes" if rescore else "no") + "\t"
+                + "%.2f" % (scanned / 1e6) + "\t" + "%.0f%%" % (row["saved"] * 100) + "\t"
+                + "%.2f" % (row["disk_bytes"] / 1e6) + "\t" + "%.4f" % row["recall"] + "\t"
+                + "%.3f" % row["mean_ms"]
+            )
+    return rows
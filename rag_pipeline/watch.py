@@ -0,0 +1,405 @@
+"""
+`main.py watch`: keep the index, the Java parse cache and the dependency graph in
+step with the working tree.
+
+Changes are picked up with inotify (Linux, via ctypes) or by polling file stats
+when inotify is unavailable, and debounced for WATCH_DEBOUNCE_SECS so an editor's
+burst of writes becomes one update. Each update re-chunks and re-embeds only the
+changed files, upserts them into the current index version, deletes chunks of
+removed files, refreshes their parse-cache entries and rewrites the dependency
+graph. QA sees the changes on its next query; `arch` reuses the parse cache.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+import config
+from arch.java_static import parse_java_file
+from arch.parse_cache import parse_cache_for
+from rag_pipeline.dedup import Deduper, canonical_key, mark_duplicates
+from rag_pipeline.embedding import embed_and_store, load_collection, current_index_version
+from rag_pipeline.graph_expansion import persist_dependency_graphs
+from rag_pipeline.ingestion import DocumentChunk, ingest_readme, ingest_java_file, is_indexed_java
+from rag_pipeline.qa_cache import invalidate_answer_cache
+from rag_pipeline.shards import shard_graph_path
+from rag_pipeline.summaries import DEFAULT_PACKAGE, build_summary_documents
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _is_tracked(rel_path):
+    return rel_path == "README.md" or is_indexed_java(rel_path)
+
+
+def _walk_tracked(repo_path):
+    """{rel_path: (mtime_ns, size)} of every file the index is built from."""
+    out = {}
+    for root, dirs, files in os.walk(repo_path):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in files:
+            abs_path = os.path.join(root, name)
+            rel_path = os.path.relpath(abs_path, repo_path).replace(os.sep, "/")
+            if not _is_tracked(rel_path):
+                continue
+            try:
+                st = os.stat(abs_path)
+            except OSError:
+                continue
+            out[rel_path] = (st.st_mtime_ns, st.st_size)
+    return out
+
+
+def _diff(old, new):
+    changed = set()
+    for rel_path, stamp in new.items():
+        if old.get(rel_path) != stamp:
+            changed.add(rel_path)
+    for rel_path in old:
+        if rel_path not in new:
+            changed.add(rel_path)
+    return changed
+
+
+class PollingWatcher:
+    """Stat-based fallback: compares file mtimes/sizes every WATCH_POLL_SECS."""
+
+    name = "polling"
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.snapshot = _walk_tracked(repo_path)
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, config.WATCH_POLL_SECS))
+        current = _walk_tracked(self.repo_path)
+        changed = _diff(self.snapshot, current)
+        self.snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Recursive inotify watch through libc (Linux only). self.tracked mirrors the
+    tracked files under the watched dirs, so a deleted or moved-away directory can
+    be reported file by file.
+    """
+
+    name = "inotify"
+
+    def __init__(self, repo_path):
+        self.repo_path = os.path.abspath(repo_path)
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        self.tracked = self._add_tree(self.repo_path)
+
+    def _add_dir(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            # ENOSPC: fs.inotify.max_user_watches reached
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed for " + path)
+        self.dirs[wd] = path
+
+    def _add_tree(self, top):
+        """Watch top and its subdirectories; returns tracked files already inside (created before the watch)."""
+        found = set()
+        for root, dirs, files in os.walk(top):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            self._add_dir(root)
+            for name in files:
+                rel_path = os.path.relpath(os.path.join(root, name), self.repo_path).replace(os.sep, "/")
+                if _is_tracked(rel_path):
+                    found.add(rel_path)
+        return found
+
+    def _drop_tree(self, path, unwatch):
+        """
+        Forget the directory path (deleted or moved away): returns the tracked files
+        that were under it. With unwatch, its watches are removed too (a moved dir
+        is still alive; a deleted one loses its watches by itself).
+        """
+        prefix = path + os.sep
+        for wd, d in list(self.dirs.items()):
+            if d == path or d.startswith(prefix):
+                if unwatch:
+                    self.libc.inotify_rm_watch(self.fd, wd)
+                del self.dirs[wd]
+
+        rel_prefix = os.path.relpath(path, self.repo_path).replace(os.sep, "/") + "/"
+        gone = set(p for p in self.tracked if p.startswith(rel_prefix))
+        self.tracked -= gone
+        return gone
+
+    def wait(self, timeout):
+        changed = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return changed
+
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return changed
+
+        pos = 0
+        while pos + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, pos)
+            pos += _EVENT_HEADER.size
+            name = data[pos : pos + length].rstrip(b"\0").decode("utf-8", errors="ignore")
+            pos += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped: report every tracked file, past and present, so the caller re-checks them all.
+                current = set(_walk_tracked(self.repo_path).keys())
+                changed.update(current | self.tracked)
+                self.tracked = current
+                continue
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+
+            parent = self.dirs.get(wd)
+            if parent is None or not name:
+                continue
+            path = os.path.join(parent, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not name.startswith("."):
+                    found = self._add_tree(path)
+                    self.tracked |= found
+                    changed.update(found)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    # A rename arrives as MOVED_FROM + MOVED_TO: the old paths are removed here
+                    # and the new ones found again by _add_tree.
+                    changed.update(self._drop_tree(path, unwatch=bool(mask & IN_MOVED_FROM)))
+                continue
+
+            rel_path = os.path.relpath(path, self.repo_path).replace(os.sep, "/")
+            if _is_tracked(rel_path):
+                changed.add(rel_path)
+                if mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.tracked.discard(rel_path)
+                else:
+                    self.tracked.add(rel_path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _open_watcher(repo_path):
+    if config.WATCH_USE_INOTIFY and hasattr(select, "select") and os.name == "posix":
+        try:
+            return InotifyWatcher(repo_path)
+        except (OSError, AttributeError) as e:
+            print("[WATCH] inotify unavailable (" + str(e) + "); polling every " + str(config.WATCH_POLL_SECS) + "s")
+    return PollingWatcher(repo_path)
+
+
+def _package_summaries(repo_path, packages, cache):
+    """Re-derived pkg_summary documents for packages (all of their files are re-read)."""
+    infos = []
+    for pkg in packages:
+        for rel_path in cache.files_in_package("" if pkg == DEFAULT_PACKAGE else pkg):
+            got = ingest_java_file(repo_path, rel_path, with_summaries=True)
+            if got is not None:
+                infos.append(got[1])
+    docs = []
+    for chunk_id, text, metadata in build_summary_documents(infos, ingest_readme(repo_path)):
+        if metadata["type"] == "pkg_summary":
+            docs.append(DocumentChunk(chunk_id, text, metadata))
+    return docs
+
+
+def _group_members(collection, chunks, paths):
+    """
+    Paths sharing a duplicate group with any of paths: the groups they were in before
+    the change (as canonical, near copy or listed exact copy), plus the groups of
+    indexed files with the same content_hash as a new chunk.
+    """
+    canonical = set()
+    got = collection.get(ids=sorted(paths), include=["metadatas"])
+    for chunk_id, meta in zip(got["ids"], got["metadatas"]):
+        canonical.add((meta or {}).get("duplicate_of") or chunk_id)
+    # Exact copies have no record of their own, only an entry on their canonical.
+    listed = collection.get(where={"n_duplicates": {"$gt": 0}}, include=["metadatas"])
+    for chunk_id, meta in zip(listed["ids"], listed["metadatas"]):
+        if set((meta.get("duplicates") or "").split(",")) & paths:
+            canonical.add(chunk_id)
+    for chunk in chunks:
+        got = collection.get(where={"content_hash": chunk.metadata["content_hash"]}, include=["metadatas"])
+        for chunk_id, meta in zip(got["ids"], got["metadatas"]):
+            canonical.add((meta or {}).get("duplicate_of") or chunk_id)
+
+    members = set(canonical)
+    got = collection.get(ids=sorted(canonical), include=["metadatas"])
+    for meta in got["metadatas"]:
+        members.update(d for d in ((meta or {}).get("duplicates") or "").split(",") if d)
+    for chunk_id in canonical:
+        members.update(collection.get(where={"duplicate_of": chunk_id}, include=["metadatas"])["ids"])
+    return members - paths
+
+
+def apply_changes(repo_path, changed, shard=None):
+    """
+    Re-index the given repo-relative paths: upsert existing ones, delete removed ones.
+    With DEDUP_ENABLED the duplicate groups of the changed files are recomputed from
+    disk, so copies of an edited or deleted canonical get a new canonical.
+    """
+    t0 = time.perf_counter()
+    collection = load_collection(shard)
+    cache = parse_cache_for(repo_path)
+    with_summaries = getattr(config, "INDEX_SUMMARIES", False)
+
+    documents = []
+    removed = []
+    packages = set()
+    chunks = {}
+    infos = {}
+
+    for rel_path in sorted(changed):
+        abs_path = os.path.join(repo_path, rel_path.replace("/", os.sep))
+
+        if rel_path == "README.md":
+            # Paragraph ids are positional: replace all README chunks.
+            collection.delete(where={"source": "README.md"})
+            documents.extend(ingest_readme(repo_path))
+            continue
+
+        old = cache.files.get(rel_path)
+        if old is not None:
+            packages.add(old["package"] or DEFAULT_PACKAGE)
+
+        got = None
+        if os.path.isfile(abs_path):
+            got = ingest_java_file(repo_path, rel_path, with_summaries, keep_text=True)
+        if got is None:
+            removed.append(rel_path)
+            cache.remove(rel_path)
+            continue
+
+        chunks[rel_path], infos[rel_path] = got
+        packages.add(got[0].metadata["package"])
+
+        parsed = parse_java_file(abs_path, rel_path)
+        if parsed is not None:
+            cache.store(parsed, os.stat(abs_path))
+    cache.save()
+
+    copies = set()
+    exact = set()
+    if config.DEDUP_ENABLED and (chunks or removed):
+        # Unchanged members of the affected groups are re-read so the group is decided again.
+        for rel_path in sorted(_group_members(collection, list(chunks.values()), set(chunks) | set(removed))):
+            got = ingest_java_file(repo_path, rel_path, with_summaries, keep_text=True)
+            if got is not None:
+                chunks[rel_path], infos[rel_path] = got
+                packages.add(got[0].metadata["package"])
+        deduper = Deduper()
+        for rel_path in sorted(chunks, key=canonical_key):
+            deduper.check(rel_path, chunks[rel_path].text)
+        exact = mark_duplicates(list(chunks.values()), deduper)
+        copies = set(deduper.copies)
+
+    for rel_path in sorted(chunks):
+        if rel_path in exact:
+            continue
+        documents.append(chunks[rel_path])
+        info = infos[rel_path]
+        if info is not None and rel_path not in copies:
+            for chunk_id, text, metadata in build_summary_documents([info], []):
+                if metadata["type"] == "file_summary":
+                    documents.append(DocumentChunk(chunk_id, text, metadata))
+
+    if removed or copies:
+        ids = []
+        for rel_path in removed:
+            ids.append(rel_path)
+            ids.append("file_summary::" + rel_path)
+        for rel_path in sorted(copies):
+            if rel_path in exact:
+                ids.append(rel_path)
+            ids.append("file_summary::" + rel_path)
+        collection.delete(ids=ids)
+
+    if with_summaries and packages:
+        summaries = _package_summaries(repo_path, packages, cache)
+        documents.extend(summaries)
+        kept = set(d.id for d in summaries)
+        stale = ["pkg_summary::" + p for p in packages if "pkg_summary::" + p not in kept]
+        if stale:
+            collection.delete(ids=stale)
+
+    if documents:
+        embed_and_store(documents, reset=False, shard=shard)
+    else:
+        invalidate_answer_cache()
+
+    graph_path = shard_graph_path(shard) if shard is not None else None
+    persist_dependency_graphs(repo_path, graph_path)
+
+    print(
+        "[WATCH] updated=" + str(len(changed) - len(removed)) + " removed=" + str(len(removed))
+        + " upserted_chunks=" + str(len(documents))
+    )
+    print("[TIMING] watch_update_ms=" + str(int((time.perf_counter() - t0) * 1000)))
+
+
+def watch_repository(repo_path, shard=None):
+    """Run until interrupted (Ctrl+C)."""
+    # Incremental upserts need a versioned index to update (see embed_and_store).
+    if current_index_version(shard) == config.CHROMA_COLLECTION_NAME:
+        print("No versioned index yet. Run `python main.py build` before watching.")
+        return
+
+    watcher = _open_watcher(repo_path)
+    print("[WATCH] " + watcher.name + " on " + repo_path + " (debounce " + str(config.WATCH_DEBOUNCE_SECS) + "s)")
+
+    pending = set()
+    failed = set()
+    last_event = 0.0
+    try:
+        while True:
+            timeout = config.WATCH_DEBOUNCE_SECS if pending else 3600.0
+            changed = watcher.wait(timeout)
+            now = time.monotonic()
+            if changed:
+                pending.update(changed)
+                pending.update(failed)
+                failed = set()
+                last_event = now
+                continue
+            if pending and now - last_event >= config.WATCH_DEBOUNCE_SECS:
+                batch = pending
+                pending = set()
+                try:
+                    apply_changes(repo_path, batch, shard)
+                except Exception as e:
+                    print("[WATCH] update failed (" + str(e) + "); will retry with the next change")
+                    failed = batch
+    except KeyboardInterrupt:
+        print("[WATCH] stopped")
+    finally:
+        watcher.close()
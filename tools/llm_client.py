@@ -1,7 +1,13 @@
+import asyncio
+import json
+import random
 import re
+import threading
 import requests
 import config
 import time
+from concurrent.futures import ThreadPoolExecutor
+from rag_pipeline.text_index import term_lines, line_slice, line_count
 
 def llm_is_available():
     if not config.LM_STUDIO_MODEL:
@@ -37,11 +43,19 @@ def retrieval_looks_relevant(question, retrieved):
 
     best_hits = 0
     for chunk in retrieved:
-        chunk_text = chunk.text.lower()
+        terms = term_lines(chunk.metadata)
         hits = 0
-        for t in useful:
-            if t in chunk_text:
-                hits += 1
+        if terms is not None:
+            # Terms precomputed at ingest: lookups instead of rescanning the chunk, with
+            # the same substring matches as the text scan below.
+            for t in useful:
+                if terms.has_substring(t):
+                    hits += 1
+        else:
+            chunk_text = chunk.text.lower()
+            for t in useful:
+                if t in chunk_text:
+                    hits += 1
         if hits > best_hits:
             best_hits = hits
 
@@ -67,7 +81,7 @@ def build_fallback_answer(reason, question, retrieved):
     out.append("Evidence snippets (for manual inspection):")
     i = 1
     for chunk in retrieved:
-        snippet = pick_evidence_snippet(question, chunk.text)
+        snippet = pick_evidence_snippet(question, chunk.text, chunk.metadata)
         out.append("[C" + str(i) + "]")
         out.append(snippet)
         out.append("")
@@ -96,12 +110,12 @@ def generate_rag_answer_with_fallback(question, retrieved, prompt, verify_fn):
             return "BLOCKED: " + msg
         return answer
 
-    # Try LLM
+    # Try LLM: first candidate that passes verify_fn wins
     start = time.perf_counter()
-    answer, err = safe_generate_answer(prompt)
+    answer, err = generate_verified_answer(prompt, lambda a: verify_fn(a, len(retrieved)))
     end = time.perf_counter()
     print("[TIMING] qa_llm_ms=" + str(int((end - start) * 1000)))
-    if err:
+    if answer is None:
         answer = build_fallback_answer(err, question, retrieved)
 
     ok, msg = verify_fn(answer, len(retrieved))
@@ -110,20 +124,69 @@ def generate_rag_answer_with_fallback(question, retrieved, prompt, verify_fn):
 
     return answer
 
-def generate_arch_answer_with_fallback(prompt, evidence, verify_fn):
+def build_repair_messages(prompt, answer, violations):
+    """Chat turns asking the model to fix only the listed verifier violations in its answer."""
+    lines = []
+    lines.append("Your answer failed these checks:")
+    for v in violations:
+        lines.append("- " + v)
+    lines.append("")
+    lines.append(
+        "Return the corrected answer in full, with the same headings. Change only what is needed to fix "
+        "the listed problems; use only IDs, packages and file paths from the EVIDENCE above."
+    )
+    # Appended after the original turns so the cached prompt prefix is reused.
+    return _as_messages(prompt) + [
+        {"role": "assistant", "content": answer},
+        {"role": "user", "content": "\n".join(lines)},
+    ]
+
+
+def repair_arch_answer(prompt, answer, evidence, verify_fn, violations_fn=None):
+    """
+    Up to ARCH_REPAIR_ROUNDS follow-up turns that send the rejected answer back with its
+    violations and re-verify the result. Returns (answer, None) once one passes, else
+    (last answer, last violation message).
+    """
+    ok, msg = verify_fn(answer, evidence)
+    rounds = 0
+    while not ok and rounds < config.ARCH_REPAIR_ROUNDS:
+        rounds += 1
+        violations = violations_fn(answer, evidence) if violations_fn is not None else [msg]
+        start = time.perf_counter()
+        repaired, err = generate_verified_answer(
+            build_repair_messages(prompt, answer, violations), lambda a: verify_fn(a, evidence), 1
+        )
+        print("[TIMING] arch_repair_ms=" + str(int((time.perf_counter() - start) * 1000)))
+        if repaired is None:
+            print("[LLM] repair round " + str(rounds) + " failed: " + str(err))
+            break
+        answer = repaired
+        ok, msg = verify_fn(answer, evidence)
+        print("[LLM] repair round " + str(rounds) + ": " + ("OK" if ok else msg))
+    if ok:
+        return answer, None
+    return answer, msg
+
+
+def generate_arch_answer_with_fallback(prompt, evidence, verify_fn, violations_fn=None):
 
     if not llm_is_available():
         return build_arch_fallback_answer(evidence, "LLM not available")
 
-    # Try LLM
+    # Try LLM: first candidate that passes verify_fn wins
     start = time.perf_counter()
-    answer, err = safe_generate_answer(prompt)
+    answer, err = generate_verified_answer(prompt, lambda a: verify_fn(a, evidence))
     end = time.perf_counter()
     print("[TIMING] arch_llm_ms=" + str(int((end - start) * 1000)))
 
     if answer is None:
         return build_arch_fallback_answer(evidence, err)
 
+    # Rejected by the verifier: ask for targeted fixes instead of discarding it
+    if err is not None:
+        answer, _ = repair_arch_answer(prompt, answer, evidence, verify_fn, violations_fn)
+
     # Verify LLM output; if fails
     ok, msg = verify_fn(answer, evidence)
     if not ok:
@@ -133,7 +196,7 @@ def generate_arch_answer_with_fallback(prompt, evidence, verify_fn):
 
 
 def build_arch_fallback_answer(evidence, reason):
-    pick = _pick_first_cycle_and_edge(evidence)
+    pick = evidence.first_cycle_edge()
     if pick is None:
         out = []
         out.append("I cannot propose a grounded refactoring from the provided evidence.")
@@ -141,14 +204,15 @@ def build_arch_fallback_answer(evidence, reason):
         out.append("Reason: " + str(reason))
         out.append("")
         out.append("Dependency evidence (raw):")
-        out.append(evidence)
+        out.append(evidence.render())
         return "\n".join(out)
 
-    cycle_id = pick["cycle_id"]
-    cycle_path = pick["cycle_path"]
-    edge_id = pick["edge_id"]
-    a = pick["edge_a"]
-    b = pick["edge_b"]
+    cycle, edge = pick
+    cycle_id = cycle["id"]
+    cycle_path = " -> ".join(cycle["path"])
+    edge_id = edge["id"]
+    a = edge["a"]
+    b = edge["b"]
 
     out = []
     out.append("Architectural smell: cyclic dependency between packages. [" + cycle_id + "]")
@@ -174,57 +238,49 @@ def build_arch_fallback_answer(evidence, reason):
     return "\n".join(out)
 
 
-def _pick_first_cycle_and_edge(evidence):
-    lines = evidence.splitlines()
+def _pick_indexed_snippet(q_tokens, chunk_text, meta):
+    # Candidate lines are the first occurrences of question terms (from the ingest-time
+    # term map); only those lines are lowercased and scored, and slices use line offsets.
+    terms = term_lines(meta)
+    n_lines = line_count(meta)
 
-    cycle_id = None
-    cycle_path = None
+    candidates = set()
+    for t in q_tokens:
+        if len(t) >= 3:
+            ln = terms.find(t)
+            if ln is not None:
+                candidates.add(ln)
 
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        if line.startswith("CYCLE_") and ": " in line:
-            cycle_id = line.split(":")[0].strip()
-            cycle_path = line[len(cycle_id) + 2 :].strip()
-            break
-        i += 1
+    best_i = -1
+    best_score = 0
+    for i in sorted(candidates):
+        s = line_slice(chunk_text, meta, i, i + 1).lower()
+        if not s:
+            continue
+        score = 0
+        for t in q_tokens:
+            if len(t) >= 3 and t in s:
+                score += 1
+        if score > best_score:
+            best_score = score
+            best_i = i
 
-    if cycle_id is None:
-        return None
-
-    want = " cycle=" + cycle_id
-    edge_id = None
-    edge_a = None
-    edge_b = None
-
-    j = 0
-    while j < len(lines):
-        line = lines[j].strip()
-        if line.startswith("EDGE_") and want in line and ": " in line:
-            edge_id = line.split(":")[0].strip()
-            rest = line[len(edge_id) + 2 :].strip()
-            left = rest.split(" cycle=")[0].strip()  
-            if " -> " in left:
-                edge_a = left.split(" -> ")[0].strip()
-                edge_b = left.split(" -> ")[1].strip()
-                break
-        j += 1
-
-    if edge_id is None:
-        return None
-
-    return {
-        "cycle_id": cycle_id,
-        "cycle_path": cycle_path,
-        "edge_id": edge_id,
-        "edge_a": edge_a,
-        "edge_b": edge_b,
-    }
+    if best_i == -1:
+        return line_slice(chunk_text, meta, 0, min(8, n_lines)).strip()
 
-def pick_evidence_snippet(question, chunk_text):
+    lo = max(0, best_i - 2)
+    hi = min(n_lines, best_i + 3)
+    return line_slice(chunk_text, meta, lo, hi).strip()
+
+
+def pick_evidence_snippet(question, chunk_text, meta=None):
     # Find 5 lines around the best matching line; fallback to first 8 lines.
     q_tokens = re.findall(r"[a-zA-Z_][a-zA-Z0-9_]+", question.lower())
 
+    # The line index is only valid for the indexed text or a prefix of it (truncation).
+    if meta and "ix_lines" in meta and "ix_terms" in meta and len(chunk_text) <= meta.get("ix_chars", -1):
+        return _pick_indexed_snippet(q_tokens, chunk_text, meta)
+
     lines = chunk_text.splitlines()
     if not lines:
         return ""
@@ -261,43 +317,273 @@ def pick_evidence_snippet(question, chunk_text):
     return "\n".join(lines[lo:hi]).strip()
 
 
-def safe_generate_answer(prompt):
-    # Wrap your existing generate_answer(prompt) so we can fallback on any failure.
-    try:
-        answer = generate_answer(prompt)
-        if not answer or not answer.strip():
-            return None, "LLM returned empty output"
-        return answer, None
-    except Exception as e:
-        return None, "LLM error: " + str(e)
+class LLMRequestError(RuntimeError):
+    """A failed chat request; retryable for timeouts, connection errors, 429 and 5xx."""
 
-def generate_answer(prompt):
-    base_url = config.LM_STUDIO_BASE_URL.rstrip("/")
-    api_url = base_url + "/v1/chat/completions"
+    def __init__(self, message, retryable):
+        RuntimeError.__init__(self, message)
+        self.retryable = retryable
+
+
+def _malformed(detail):
+    """
+    Any response the client cannot parse (non-JSON body, bad stream event, wrong
+    structure): not retryable, since the server answered and would likely repeat it.
+    """
+    return LLMRequestError("LM Studio returned a malformed response: " + detail[:200], False)
+
+
+# Worker threads for blocking HTTP calls; not the loop's default executor, so that
+# asyncio.run() returns without waiting for cancelled candidates to finish.
+_HTTP_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-http")
 
+
+def _as_messages(prompt):
+    """prompt is a user message text, or already a list of chat messages."""
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return list(prompt)
+
+
+def _chat_payload(prompt, temperature=None, n=1):
     if not config.LM_STUDIO_MODEL:
         raise RuntimeError("Set config.LM_STUDIO_MODEL in config.py to your LM Studio loaded model name.")
 
     payload = {
         "model": config.LM_STUDIO_MODEL,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": config.LM_TEMPERATURE,
+        "messages": _as_messages(prompt),
+        "temperature": config.LM_TEMPERATURE if temperature is None else temperature,
         "top_p": config.LM_TOP_P
     }
+    if n > 1:
+        payload["n"] = n
+    if config.LLM_STREAM:
+        payload["stream"] = True
+        if config.LLM_STREAM_INCLUDE_USAGE:
+            payload["stream_options"] = {"include_usage": True}
+    return payload
+
+
+def _report_timing(t0, t_first, usage, timings):
+    """One [TIMING] line per call: time to first token, total, and prompt-cache reuse when the server reports it."""
+    line = "[TIMING] llm_total_ms=" + str(int((time.perf_counter() - t0) * 1000))
+    if t_first is not None:
+        line += " llm_ttft_ms=" + str(int((t_first - t0) * 1000))
+    if timings and timings.get("prompt_ms") is not None:
+        # llama.cpp-style servers report prefill time and reused cache tokens directly
+        line += " prefill_ms=" + str(int(timings["prompt_ms"]))
+        if timings.get("cache_n") is not None:
+            line += " cached_tokens=" + str(timings["cache_n"])
+    if usage:
+        line += " prompt_tokens=" + str(usage.get("prompt_tokens"))
+        details = usage.get("prompt_tokens_details") or {}
+        if details.get("cached_tokens") is not None:
+            line += " cached_tokens=" + str(details["cached_tokens"])
+    print(line)
+
+
+def _read_stream(r, stop):
+    """Collect an SSE chat stream: ([content per choice], first-token time, usage, timings)."""
+    contents = {}
+    t_first = None
+    usage = None
+    timings = None
+    for raw in r.iter_lines(chunk_size=None):
+        if stop is not None and stop.is_set():
+            r.close()
+            raise LLMRequestError("cancelled", False)
+        if not raw:
+            continue
+        line = raw.decode("utf-8", errors="ignore")
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        try:
+            event = json.loads(data)
+        except ValueError:
+            raise _malformed("stream event " + data)
+
+        try:
+            if event.get("error"):
+                raise LLMRequestError("LM Studio API error: " + str(event["error"]), False)
+            if event.get("usage"):
+                usage = event["usage"]
+            if event.get("timings"):
+                timings = event["timings"]
+            for c in event.get("choices") or []:
+                delta = (c.get("delta") or {}).get("content")
+                if delta:
+                    if t_first is None:
+                        t_first = time.perf_counter()
+                    i = c.get("index", 0)
+                    contents[i] = contents.get(i, "") + delta
+        except (AttributeError, TypeError):
+            raise _malformed("stream event " + data)
+
+    if not contents:
+        return [""], t_first, usage, timings
+    return [contents[i] for i in sorted(contents)], t_first, usage, timings
+
+
+def _post_chat(payload, timeout, stop=None):
+    """POST one chat completion; returns the content of every choice. stop (threading.Event) aborts a stream."""
+    base_url = config.LM_STUDIO_BASE_URL.rstrip("/")
+    api_url = base_url + "/v1/chat/completions"
+
+    t0 = time.perf_counter()
+    streaming = bool(payload.get("stream"))
+    try:
+        r = requests.post(api_url, json=payload, timeout=timeout, stream=streaming)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        raise LLMRequestError("Failed to generate answer: " + str(e), True)
+    except requests.RequestException as e:
+        raise LLMRequestError("Failed to generate answer: " + str(e), False)
+
+    if r.status_code == 429 or r.status_code >= 500:
+        raise LLMRequestError("LM Studio HTTP " + str(r.status_code), True)
     try:
-        r = requests.post(api_url, json=payload, timeout=config.LM_TIMEOUT_SECS)
         r.raise_for_status()
     except requests.RequestException as e:
-        raise RuntimeError(f"Failed to generate answer: {e}")
-            
+        raise LLMRequestError("Failed to generate answer: " + str(e), False)
+
+    if streaming:
+        try:
+            contents, t_first, usage, timings = _read_stream(r, stop)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            # the connection broke mid-stream
+            raise LLMRequestError("Failed to generate answer: " + str(e), True)
+        except requests.RequestException as e:
+            raise LLMRequestError("Failed to generate answer: " + str(e), False)
+        finally:
+            r.close()
+        _report_timing(t0, t_first, usage, timings)
+        return contents
+
     try:
         data = r.json()
     except Exception as e:
-        raise RuntimeError("LM Studio returned non-JSON response: " + str(e))
+        raise _malformed("not JSON (" + str(e) + ")")
 
+    if not isinstance(data, dict):
+        raise _malformed(json.dumps(data))
     if data.get("error"):
-        raise RuntimeError("LM Studio API error: " + str(data["error"]))
-    
-    return data["choices"][0]["message"]["content"]
+        raise LLMRequestError("LM Studio API error: " + str(data["error"]), False)
+
+    try:
+        contents = [c["message"]["content"] or "" for c in data["choices"]]
+    except (KeyError, TypeError):
+        raise _malformed(json.dumps(data))
+    if not contents:
+        raise _malformed("no choices")
+
+    _report_timing(t0, None, data.get("usage"), data.get("timings"))
+    return contents
+
+
+def _backoff_secs(attempt):
+    # "Full jitter": uniform in [0, min(cap, base * 2^attempt)]
+    return random.uniform(0, min(config.LLM_BACKOFF_MAX_SECS, config.LLM_BACKOFF_BASE_SECS * (2 ** attempt)))
+
+
+async def agenerate_with_retry(prompt, temperature=None, n=1, deadline=None):
+    """
+    Chat completion with retries: each attempt is bounded by LLM_REQUEST_DEADLINE_SECS
+    (and by the overall deadline, a time.monotonic() value); retryable failures are
+    retried up to LLM_MAX_RETRIES times with jittered exponential backoff.
+    Returns (contents, None) or (None, error message).
+    """
+    payload = _chat_payload(prompt, temperature, n)
+    err = None
+    attempt = 0
+    while attempt <= config.LLM_MAX_RETRIES:
+        limit = config.LLM_REQUEST_DEADLINE_SECS
+        if deadline is not None:
+            limit = min(limit, deadline - time.monotonic())
+            if limit <= 0:
+                return None, err or "LLM deadline exceeded"
+        # requests is blocking: run it on _HTTP_POOL; stop ends a stream early once we stop waiting.
+        stop = threading.Event()
+        call = asyncio.get_running_loop().run_in_executor(_HTTP_POOL, _post_chat, payload, limit, stop)
+        try:
+            contents = await asyncio.wait_for(call, timeout=limit)
+            return contents, None
+        except asyncio.TimeoutError:
+            stop.set()
+            err = "LLM request exceeded " + "%.0f" % limit + "s"
+        except asyncio.CancelledError:
+            stop.set()
+            raise
+        except LLMRequestError as e:
+            err = str(e)
+            if not e.retryable:
+                return None, err
+
+        attempt += 1
+        if attempt > config.LLM_MAX_RETRIES:
+            break
+        delay = _backoff_secs(attempt - 1)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            break
+        print("[LLM] " + err + "; retry " + str(attempt) + "/" + str(config.LLM_MAX_RETRIES) + " in " + "%.2f" % delay + "s")
+        await asyncio.sleep(delay)
+    return None, err
+
+
+async def afirst_verified_answer(prompt, accept_fn, candidates=None):
+    """
+    Ask for LLM_CANDIDATES answers and return the first that accept_fn(answer) -> (ok, msg)
+    accepts, cancelling the outstanding requests. LLM_CANDIDATE_MODE "parallel" sends
+    one request per candidate (the first at LM_TEMPERATURE, the others at
+    LLM_CANDIDATE_TEMPERATURE so they differ); "n" sends one request with n > 1.
+    Returns (answer, error): answer is the accepted one, else the last unaccepted
+    candidate (error = its verify message), else None with the request error.
+    """
+    k = max(1, config.LLM_CANDIDATES if candidates is None else candidates)
+    deadline = time.monotonic() + config.LLM_TOTAL_DEADLINE_SECS
+
+    if k > 1 and config.LLM_CANDIDATE_MODE == "n":
+        tasks = [asyncio.ensure_future(agenerate_with_retry(prompt, config.LLM_CANDIDATE_TEMPERATURE, k, deadline))]
+    else:
+        tasks = []
+        i = 0
+        while i < k:
+            temperature = None if i == 0 else config.LLM_CANDIDATE_TEMPERATURE
+            tasks.append(asyncio.ensure_future(agenerate_with_retry(prompt, temperature, 1, deadline)))
+            i += 1
+
+    rejected = None
+    err = None
+    try:
+        for fut in asyncio.as_completed(tasks):
+            try:
+                contents, e = await fut
+            except Exception as ex:
+                # not a request failure (e.g. a bad payload setting); the other candidates still count
+                contents, e = None, str(ex) or type(ex).__name__
+            if contents is None:
+                err = e
+                continue
+            for answer in contents:
+                if not answer or not answer.strip():
+                    err = "LLM returned empty output"
+                    continue
+                ok, msg = accept_fn(answer)
+                if ok:
+                    return answer, None
+                print("[LLM] candidate rejected: " + msg)
+                rejected = (answer, msg)
+    finally:
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+
+    if rejected is not None:
+        return rejected
+    return None, "LLM error: " + (err or "no answer returned")
+
+
+def generate_verified_answer(prompt, accept_fn, candidates=None):
+    """Blocking wrapper around afirst_verified_answer."""
+    return asyncio.run(afirst_verified_answer(prompt, accept_fn, candidates))
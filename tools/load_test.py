@@ -0,0 +1,145 @@
+"""
+LLM load test: `python main.py load-test [qa|arch] [requests] [concurrency]`.
+
+Calls generate_rag_answer_with_fallback (qa) or generate_arch_answer_with_fallback
+(arch) LOAD_TEST_REQUESTS times from LOAD_TEST_CONCURRENCY threads, with a fixed
+synthetic prompt, so the whole client path is measured: availability check,
+retries, candidates, verification, repair rounds and fallbacks.
+With LOAD_TEST_USE_STUB the run targets an in-process stub server (tools/stub_llm.py)
+on a free port; otherwise the configured LM_STUDIO_BASE_URL is used.
+
+Reports throughput and latency percentiles (whole call, including the fallback
+path) and how each call ended: llm, fallback, blocked or error.
+"""
+
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from arch.evidence import DependencyEvidence
+from rag_pipeline.ingestion import DocumentChunk
+from tools.llm_client import generate_rag_answer_with_fallback, generate_arch_answer_with_fallback
+from tools.prompt_builder import build_prompt, build_architecture_prompt
+from tools.stub_llm import StubLLM
+from tools.verify import verify_citations, verify_arch_response, collect_arch_violations
+
+_QA_QUESTION = "How does ZipFile extract all entries to a directory?"
+
+
+def _qa_case():
+    retrieved = [
+        DocumentChunk(
+            "src/main/java/net/lingala/zip4j/ZipFile.java",
+            "public class ZipFile {\n  public void extractAll(String destinationPath) {\n    // extract every entry\n  }\n}",
+            {"source": "src/main/java/net/lingala/zip4j/ZipFile.java", "type": "code"},
+        ),
+        DocumentChunk(
+            "src/main/java/net/lingala/zip4j/tasks/ExtractAllFilesTask.java",
+            "public class ExtractAllFilesTask {\n  protected void executeTask() {\n    // extract each file header\n  }\n}",
+            {"source": "src/main/java/net/lingala/zip4j/tasks/ExtractAllFilesTask.java", "type": "code"},
+        ),
+    ]
+    prompt = build_prompt(_QA_QUESTION, retrieved)
+
+    def call():
+        answer = generate_rag_answer_with_fallback(_QA_QUESTION, retrieved, prompt, verify_citations)
+        if answer.startswith("BLOCKED:"):
+            return "blocked"
+        if answer.startswith("I cannot answer from the provided context."):
+            return "fallback"
+        return "llm"
+
+    return call
+
+
+def _arch_case():
+    a = "net.lingala.zip4j.util"
+    b = "net.lingala.zip4j.io.inputstream"
+    c = "net.lingala.zip4j.model"
+    evidence = DependencyEvidence(3, 4)
+    evidence.add_magnet(a, 2, 2, 4, ["src/main/java/net/lingala/zip4j/util/Zip4jUtil.java (loc=300)"])
+    evidence.add_cycle([a, b, a], {(a, b): 3, (b, a): 5}, 2)
+    evidence.add_oversized(c, 2400)
+    prompt = build_architecture_prompt(config.ARCH_QUERY, evidence.render())
+
+    def call():
+        answer = generate_arch_answer_with_fallback(prompt, evidence, verify_arch_response, collect_arch_violations)
+        if "Fallback used because" in answer or answer.startswith("I cannot propose"):
+            return "fallback"
+        return "llm"
+
+    return call
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    i = int(math.ceil(p / 100.0 * len(sorted_values))) - 1
+    return sorted_values[max(0, min(i, len(sorted_values) - 1))]
+
+
+def run_load_test(target="qa", n_requests=None, concurrency=None, use_stub=None):
+    """Returns {"throughput", "p50_ms", "p90_ms", "p99_ms", "max_ms", "outcomes"} and prints a [LOAD] report."""
+    n_requests = config.LOAD_TEST_REQUESTS if n_requests is None else n_requests
+    concurrency = config.LOAD_TEST_CONCURRENCY if concurrency is None else concurrency
+    use_stub = config.LOAD_TEST_USE_STUB if use_stub is None else use_stub
+    if target not in ("qa", "arch"):
+        raise ValueError("load-test target must be qa or arch, not " + repr(target))
+
+    stub = None
+    base_url = config.LM_STUDIO_BASE_URL
+    if use_stub:
+        stub = StubLLM(port=0).start()
+        config.LM_STUDIO_BASE_URL = stub.url
+
+    call = _qa_case() if target == "qa" else _arch_case()
+
+    def timed(_):
+        t = time.perf_counter()
+        try:
+            outcome = call()
+        except Exception as e:
+            print("[LOAD] call failed: " + str(e))
+            outcome = "error"
+        return (time.perf_counter() - t) * 1000, outcome
+
+    t0 = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            results = list(pool.map(timed, range(n_requests)))
+    finally:
+        wall = time.perf_counter() - t0
+        if stub is not None:
+            stub.stop()
+            config.LM_STUDIO_BASE_URL = base_url
+
+    latencies = sorted(r[0] for r in results)
+    outcomes = {"llm": 0, "fallback": 0, "blocked": 0, "error": 0}
+    for _, outcome in results:
+        outcomes[outcome] += 1
+    summary = {
+        "throughput": len(results) / wall if wall > 0 else 0.0,
+        "p50_ms": _percentile(latencies, 50),
+        "p90_ms": _percentile(latencies, 90),
+        "p99_ms": _percentile(latencies, 99),
+        "max_ms": latencies[-1] if latencies else 0.0,
+        "outcomes": outcomes,
+    }
+
+    print(
+        "[LOAD] target=" + target + " requests=" + str(len(results)) + " concurrency=" + str(concurrency)
+        + " server=" + ("stub" if stub is not None else base_url) + " wall_s=" + "%.2f" % wall
+        + " throughput=" + "%.2f" % summary["throughput"] + "/s"
+    )
+    print(
+        "[LOAD] latency_ms p50=" + str(int(summary["p50_ms"])) + " p90=" + str(int(summary["p90_ms"]))
+        + " p99=" + str(int(summary["p99_ms"])) + " max=" + str(int(summary["max_ms"]))
+    )
+    print(
+        "[LOAD] outcomes llm=" + str(outcomes["llm"]) + " fallback=" + str(outcomes["fallback"])
+        + " blocked=" + str(outcomes["blocked"]) + " error=" + str(outcomes["error"])
+    )
+    if stub is not None:
+        stub.report()
+    return summary
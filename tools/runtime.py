@@ -1,6 +1,9 @@
 import config
 from rag_pipeline.ingestion import ingest_repository
 from rag_pipeline.embedding import embed_and_store, load_collection
+from rag_pipeline.build_pipeline import build_index_pipelined
+from rag_pipeline.graph_expansion import persist_dependency_graphs
+from rag_pipeline.shards import shard_names, build_shards, open_sharded_collection
 
 
 def get_repo_path():
@@ -11,12 +14,27 @@ def get_repo_path():
     return repo_path
 
 
-def get_collection(build, rebuild):
+def _get_sharded_collection(build, rebuild, only):
+    if build or rebuild:
+        build_shards(rebuild=rebuild, only=only)
+
+    collection = open_sharded_collection()
+    if collection is None:
+        print("No shard has an index yet. Run with --build to create embeddings.")
+    return collection
+
+
+def get_collection(build, rebuild, only=None):
     """
-    - build=True: ingest + embed now (persisted on disk)
-    - rebuild=True: delete collection then rebuild
+    - build=True: ingest + embed now (persisted on disk), and write the dependency graphs
+    - rebuild=True: build a fresh index version, then swap it in
     - build=False: just open persisted collection
+    With config.REPOS set, every repo is its own shard (only = shard names to build)
+    and a ShardedCollection over all shards is returned.
     """
+    if shard_names():
+        return _get_sharded_collection(build, rebuild, only)
+
     repo_path = get_repo_path()
     if repo_path is None:
         return None
@@ -25,8 +43,13 @@ def get_collection(build, rebuild):
         build = True
 
     if build:
-        docs = ingest_repository(repo_path)
-        return embed_and_store(docs, reset=rebuild)
+        if config.PIPELINED_BUILD:
+            collection = build_index_pipelined(repo_path, reset=rebuild)
+        else:
+            docs = ingest_repository(repo_path)
+            collection = embed_and_store(docs, reset=rebuild)
+        persist_dependency_graphs(repo_path)
+        return collection
 
     collection = load_collection()
     if collection.count() == 0:
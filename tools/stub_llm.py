@@ -0,0 +1,268 @@
+"""
+Local OpenAI-compatible stand-in for LM Studio: `python main.py stub-llm [port]`.
+
+Serves GET /v1/models and POST /v1/chat/completions (plain JSON or SSE streaming,
+n > 1, stream_options.include_usage) so tools/llm_client.py can be exercised and
+load-tested without a model. Behaviour comes from the STUB_LLM_* settings:
+
+- latency before the first token, then a fixed token rate (whitespace tokens)
+- error injection: a fraction of requests fail with STUB_LLM_ERROR_STATUS
+- invalid answers: a fraction of answers carry no citations / evidence IDs, so the
+  verifier rejects them (exercises candidates, repair rounds and fallbacks)
+- canned answers: STUB_LLM_ANSWERS_FILE, a JSON list of {"match": regex, "answer": text};
+  the first regex found in the prompt wins. Otherwise a QA prompt gets a cited
+  one-liner and an architecture prompt an answer built from its first CYCLE_k/EDGE_k,
+  both of which pass tools/verify.py.
+
+usage reports prompt_tokens and, when the system message was seen before, its tokens
+as cached_tokens, like a server with a prefix cache.
+"""
+
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+from tools.tokens import count_tokens
+
+_TOKEN_RE = re.compile(r"\s*\S+")
+_CYCLE_LINE_RE = re.compile(r"^(CYCLE_\d+): (.+?)(?: scc_size=\d+)?$", re.MULTILINE)
+_EDGE_LINE_RE = re.compile(r"^(EDGE_\d+): (\S+) -> (\S+) cycle=(CYCLE_\d+)", re.MULTILINE)
+
+
+def _load_answers(path):
+    if not path:
+        return []
+    f = open(path, "r", encoding="utf-8")
+    items = json.load(f)
+    f.close()
+    return [(re.compile(x["match"]), x["answer"]) for x in items]
+
+
+def _arch_answer(text):
+    cycle = _CYCLE_LINE_RE.search(text)
+    if cycle is None:
+        return "I cannot propose a concrete refactoring from the provided evidence."
+    edge = None
+    for m in _EDGE_LINE_RE.finditer(text):
+        if m.group(4) == cycle.group(1):
+            edge = m
+            break
+    if edge is None:
+        return "I cannot propose a concrete refactoring from the provided evidence."
+
+    out = []
+    out.append("Smell:")
+    out.append("Cyclic dependency `" + cycle.group(2) + "`. [" + cycle.group(1) + "]")
+    out.append("Evidence:")
+    out.append("- " + cycle.group(1) + ": `" + cycle.group(2) + "`")
+    out.append("Refactoring:")
+    out.append("- Break edge: " + edge.group(1) + " (" + edge.group(2) + " -> " + edge.group(3) + ")")
+    out.append("- Extract the subset of " + edge.group(3) + " used by " + edge.group(2) + " behind an interface owned by " + edge.group(2) + ".")
+    out.append("Trade-offs / Risks:")
+    out.append("- One more indirection between the two packages.")
+    out.append("Self-check:")
+    out.append("- The broken edge is an arrow of the quoted cycle.")
+    return "\n".join(out)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients drop idle keep-alive connections; not worth a traceback
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        ThreadingHTTPServer.handle_error(self, request, client_address)
+
+
+class StubLLM:
+    """The server plus its settings and counters; start() serves from a daemon thread."""
+
+    def __init__(self, port=None, host="127.0.0.1"):
+        self.port = config.STUB_LLM_PORT if port is None else port
+        self.host = host
+        self.latency_secs = config.STUB_LLM_LATENCY_SECS
+        self.tokens_per_sec = config.STUB_LLM_TOKENS_PER_SEC
+        self.error_rate = config.STUB_LLM_ERROR_RATE
+        self.error_status = config.STUB_LLM_ERROR_STATUS
+        self.invalid_rate = config.STUB_LLM_INVALID_RATE
+        self.answers = _load_answers(config.STUB_LLM_ANSWERS_FILE)
+
+        self.lock = threading.Lock()
+        self.rng = random.Random(0)
+        self.seen_prefixes = set()
+        self.stats = {"requests": 0, "errors": 0, "invalid": 0, "completed": 0, "aborted": 0}
+        self.server = None
+
+    @property
+    def url(self):
+        return "http://" + self.host + ":" + str(self.server.server_address[1])
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _roll(self, rate):
+        with self.lock:
+            return rate > 0 and self.rng.random() < rate
+
+    def answer_for(self, messages):
+        text = "\n".join(str(m.get("content", "")) for m in messages)
+        for pattern, answer in self.answers:
+            if pattern.search(text):
+                return answer
+        if self._roll(self.invalid_rate):
+            self._count("invalid")
+            return "Stub answer without citations."
+        if "EVIDENCE:" in text:
+            return _arch_answer(text)
+        return "Stub answer based on the provided context. [C1]"
+
+    def usage_for(self, messages, completion_tokens):
+        prompt_tokens = count_tokens("\n".join(str(m.get("content", "")) for m in messages))
+        cached = 0
+        if messages and messages[0].get("role") == "system":
+            system = str(messages[0].get("content", ""))
+            key = hashlib.sha1(system.encode("utf-8")).hexdigest()
+            with self.lock:
+                if key in self.seen_prefixes:
+                    cached = count_tokens(system)
+                self.seen_prefixes.add(key)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+
+    def start(self):
+        self.server = _Server((self.host, self.port), _Handler)
+        self.server.stub = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def report(self):
+        print(
+            "[STUB] requests=" + str(self.stats["requests"]) + " errors_injected=" + str(self.stats["errors"])
+            + " invalid_answers=" + str(self.stats["invalid"]) + " completed=" + str(self.stats["completed"])
+            + " aborted=" + str(self.stats["aborted"])
+        )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, data):
+        # SSE over chunked encoding, flushed per event so clients see each token as it is sent
+        self.wfile.write(("%x\r\n" % len(data)).encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/v1/models":
+            self._json(404, {"error": "not found"})
+            return
+        self._json(200, {"object": "list", "data": [{"id": config.LM_STUDIO_MODEL or "stub", "object": "model", "owned_by": "stub"}]})
+
+    def do_POST(self):
+        stub = self.server.stub
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._json(404, {"error": "not found"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            self._json(400, {"error": "invalid JSON"})
+            return
+        stub._count("requests")
+
+        if stub._roll(stub.error_rate):
+            stub._count("errors")
+            self._json(stub.error_status, {"error": "injected error"})
+            return
+
+        messages = payload.get("messages") or []
+        n = max(1, int(payload.get("n") or 1))
+        answers = [_TOKEN_RE.findall(stub.answer_for(messages)) for _ in range(n)]
+        completion_tokens = sum(len(a) for a in answers)
+        delay = 1.0 / stub.tokens_per_sec if stub.tokens_per_sec > 0 else 0.0
+
+        try:
+            if not payload.get("stream"):
+                time.sleep(stub.latency_secs + delay * max(len(a) for a in answers))
+                choices = []
+                i = 0
+                while i < n:
+                    choices.append({"index": i, "message": {"role": "assistant", "content": "".join(answers[i])}, "finish_reason": "stop"})
+                    i += 1
+                self._json(200, {
+                    "object": "chat.completion",
+                    "model": payload.get("model"),
+                    "choices": choices,
+                    "usage": stub.usage_for(messages, completion_tokens),
+                })
+                stub._count("completed")
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            time.sleep(stub.latency_secs)
+            t = 0
+            while t < max(len(a) for a in answers):
+                i = 0
+                while i < n:
+                    if t < len(answers[i]):
+                        event = {"object": "chat.completion.chunk", "choices": [{"index": i, "delta": {"content": answers[i][t]}}]}
+                        self._chunk(("data: " + json.dumps(event) + "\n\n").encode("utf-8"))
+                    i += 1
+                if delay:
+                    time.sleep(delay)
+                t += 1
+            if (payload.get("stream_options") or {}).get("include_usage"):
+                event = {"object": "chat.completion.chunk", "choices": [], "usage": stub.usage_for(messages, completion_tokens)}
+                self._chunk(("data: " + json.dumps(event) + "\n\n").encode("utf-8"))
+            self._chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+            stub._count("completed")
+        except (BrokenPipeError, ConnectionResetError):
+            # client went away: a cancelled candidate or an expired deadline
+            stub._count("aborted")
+            self.close_connection = True
+
+
+def serve_stub_llm(port=None):
+    """Run the stub in the foreground until Ctrl+C."""
+    stub = StubLLM(port).start()
+    print("[STUB] serving " + stub.url + "/v1 (set LM_STUDIO_BASE_URL to this address); Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    stub.stop()
+    stub.report()
@@ -0,0 +1,50 @@
+import os
+import re
+import config
+
+# Approximate token: identifier run or single non-space character.
+TOKEN_RE = re.compile(r"[A-Za-z0-9_]+|[^\s]", re.UNICODE)
+
+_TOKENIZER = None
+_TOKENIZER_LOADED = False
+
+
+def _load_tokenizer():
+    """
+    Serving model's tokenizer from config.PROMPT_TOKENIZER (a tokenizer.json path or a
+    Hugging Face repo id). Returns None when unset or unavailable; callers then fall
+    back to the regex approximation.
+    """
+    global _TOKENIZER, _TOKENIZER_LOADED
+    if _TOKENIZER_LOADED:
+        return _TOKENIZER
+    _TOKENIZER_LOADED = True
+
+    name = getattr(config, "PROMPT_TOKENIZER", "")
+    if not name:
+        return None
+
+    try:
+        from tokenizers import Tokenizer
+
+        if os.path.isfile(name):
+            _TOKENIZER = Tokenizer.from_file(name)
+        else:
+            _TOKENIZER = Tokenizer.from_pretrained(name)
+    except Exception as e:
+        print("[TOKENS] tokenizer unavailable (" + str(e) + "); using regex token counts")
+        _TOKENIZER = None
+    return _TOKENIZER
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    tok = _load_tokenizer()
+    if tok is not None:
+        return len(tok.encode(text, add_special_tokens=False).ids)
+
+    n = 0
+    for _ in TOKEN_RE.finditer(text):
+        n += 1
+    return n
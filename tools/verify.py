@@ -2,10 +2,7 @@ import re
 
 CITE_RE = re.compile(r"\[C(\d+)\]")
 
-EVIDENCE_ID_RE = re.compile(r"\b(CYCLE_\d+|EDGE_\d+|MAGNET_\d+|OVERSIZED_\d+)\b")
-EDGE_LINE_RE = re.compile(r"^\s*EDGE_\d+:\s*(.+?)\s*cycle=CYCLE_\d+\s*$")
-MAGNET_LINE_RE = re.compile(r"^\s*MAGNET_\d+:\s*([a-zA-Z0-9_.]+)\s+fin=")
-OVERSIZED_LINE_RE = re.compile(r"^\s*OVERSIZED_\d+:\s*([a-zA-Z0-9_.]+)\s+total_loc=")
+EVIDENCE_ID_RE = re.compile(r"\b(CYCLE_\d+|EDGE_\d+|MAGNET_\d+|OVERSIZED_\d+|MODULE_\d+)\b")
 
 BREAK_EDGE_LINE_RE = re.compile(r"^\s*-\s*Break edge:\s*(.*)$", re.IGNORECASE)
 EDGE_ID_IN_TEXT_RE = re.compile(r"\bEDGE_\d+\b")
@@ -37,67 +34,22 @@ def _count_heading(answer_text, heading):
     return answer_text.count("\n" + heading + "\n") + (1 if answer_text.startswith(heading + "\n") else 0)
 
 
-def _collect_valid_ids(evidence_text):
-    ids = set()
-    for line in evidence_text.splitlines():
-        for x in EVIDENCE_ID_RE.findall(line):
-            ids.add(x)
-    return ids
-
-
-def _collect_allowed_packages(evidence_text):
+def collect_arch_violations(answer_text, evidence):
     """
-    Allowed packages = packages appearing in:
-      - CYCLE lines (via EDGE arrows)
-      - EDGE lines (A -> B)
-      - MAGNET lines (pkg)
-      - OVERSIZED lines (pkg)
-    """
-    allowed = set()
-
-    for line in evidence_text.splitlines():
-        line = line.strip()
-
-        # EDGE_k: A -> B cycle=CYCLE_1
-        m = EDGE_LINE_RE.match(line)
-        if m:
-            arrow = m.group(1).strip()
-            parts = arrow.split("->")
-            if len(parts) == 2:
-                a = parts[0].strip()
-                b = parts[1].strip()
-                allowed.add(a)
-                allowed.add(b)
-            continue
-
-        m = MAGNET_LINE_RE.match(line)
-        if m:
-            allowed.add(m.group(1).strip())
-            continue
-
-        m = OVERSIZED_LINE_RE.match(line)
-        if m:
-            allowed.add(m.group(1).strip())
-            continue
-
-    return allowed
-
-
-def verify_arch_response(answer_text, evidence_text):
-    """
-    checks:
+    Every violation of the checks below against a DependencyEvidence (empty list = valid):
       1) Must be single response (headings appear once)
       2) Evidence section must reference a CYCLE_k
       3) Break edge must reference exactly one EDGE_k that exists
       4) Any package token mentioned must be in allowed packages OR line includes [NEW]
     """
+    violations = []
 
     for h in ["Smell:", "Evidence:", "Refactoring:", "Trade-offs / Risks:", "Self-check:"]:
         if _count_heading(answer_text, h) != 1:
-            return False, "Duplicate or missing heading: " + h
+            violations.append("Duplicate or missing heading: " + h)
 
-    valid_ids = _collect_valid_ids(evidence_text)
-    allowed_pkgs = _collect_allowed_packages(evidence_text)
+    valid_ids = evidence.ids
+    allowed_pkgs = evidence.packages
 
     # must reference a CYCLE_k somewhere in Evidence section
     if "Evidence:" in answer_text:
@@ -105,11 +57,13 @@ def verify_arch_response(answer_text, evidence_text):
         if "Refactoring:" in ev_part:
             ev_part = ev_part.split("Refactoring:", 1)[0]
         if not CYCLE_ID_IN_TEXT_RE.search(ev_part):
-            return False, "Evidence must reference one CYCLE_k ID from Context."
+            violations.append("Evidence must reference one CYCLE_k ID from Context.")
         # also ensure any referenced IDs exist
+        unknown = []
         for x in EVIDENCE_ID_RE.findall(ev_part):
-            if x not in valid_ids:
-                return False, "Evidence references unknown ID: " + x
+            if x not in valid_ids and x not in unknown:
+                unknown.append(x)
+                violations.append("Evidence references unknown ID: " + x)
 
     # Break edge must reference exactly one EDGE_k id
     ref_part = answer_text.split("Refactoring:", 1)[1] if "Refactoring:" in answer_text else ""
@@ -123,22 +77,32 @@ def verify_arch_response(answer_text, evidence_text):
             break
 
     if break_line is None:
-        return False, "Missing '- Break edge:' line."
-
-    edge_ids = EDGE_ID_IN_TEXT_RE.findall(break_line)
-    if len(edge_ids) != 1:
-        return False, "Break edge must reference exactly one EDGE_k ID."
-
-    if edge_ids[0] not in valid_ids:
-        return False, "Break edge references unknown EDGE id: " + edge_ids[0]
+        violations.append("Missing '- Break edge:' line.")
+    else:
+        edge_ids = EDGE_ID_IN_TEXT_RE.findall(break_line)
+        if len(edge_ids) != 1:
+            violations.append("Break edge must reference exactly one EDGE_k ID.")
+        elif edge_ids[0] not in valid_ids:
+            violations.append("Break edge references unknown EDGE id: " + edge_ids[0])
 
     # package tokens must be allowed or marked [NEW] on same line
     seen_new = set()
-    for line in answer_text.splitlines(): 
-        is_new = NEW_MARK_RE.search(line) is not None 
-        pkgs = PKG_TOKEN_RE.findall(line) 
+    reported = set()
+    for line in answer_text.splitlines():
+        is_new = NEW_MARK_RE.search(line) is not None
+        pkgs = PKG_TOKEN_RE.findall(line)
         for p in pkgs:
-            if (p not in allowed_pkgs) and (not is_new) and (p not in seen_new): 
-                return False, "Unknown package not in Context (mark [NEW] if intended): " + p
-            seen_new.add(p)
-    return True, "OK"
\ No newline at end of file
+            if (p not in allowed_pkgs) and (not is_new) and (p not in seen_new) and (p not in reported):
+                violations.append("Unknown package not in Context (mark [NEW] if intended): " + p)
+                reported.add(p)
+            if is_new:
+                seen_new.add(p)
+    return violations
+
+
+def verify_arch_response(answer_text, evidence):
+    """Same checks as collect_arch_violations; returns (ok, first violation)."""
+    violations = collect_arch_violations(answer_text, evidence)
+    if violations:
+        return False, violations[0]
+    return True, "OK"